@@ -0,0 +1,35 @@
+"""
+Deferred imports for fast application startup.
+
+lazy_import returns a module object immediately and only executes the
+module on first attribute access, so heavy libraries (cv2, numpy, PIL)
+are loaded when the first image operation needs them rather than
+before the window appears.
+"""
+import sys
+import importlib.util
+
+
+def lazy_import(name):
+    """Return module name, loading it on first attribute access."""
+    # Already imported (eagerly or lazily)
+    if name in sys.modules:
+        return sys.modules[name]
+
+    # Module is missing: fail now rather than on first use
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    # Create the module with a loader that defers execution
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    # Bind submodules on their parent package like a normal import
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
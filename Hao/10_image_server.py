@@ -0,0 +1,429 @@
+"""
+Local HTTP image-processing service around ImageModel.
+
+Runs the editor's operations without the GUI. A request carries an image
+(raw upload or a path on shared disk) plus an op recipe; the result is
+returned encoded. Work is limited by a worker pool, a bounded admission
+queue and a maximum body size. Usage:
+
+    python 10_image_server.py serve [--port 8765] [--workers 4] [--queue 16] [--root DIR]
+    python 10_image_server.py client [--image FILE] [--requests 50] [--concurrency 8]
+
+Requests:
+
+    POST /process?recipe=<json>&format=png    body: encoded image bytes
+    POST /process                             body: {"path": ..., "recipe": [...], "format": "jpg"}
+    GET  /health
+
+A recipe is a list of steps such as [{"op": "rotate", "angle": 90},
+{"op": "adjust", "brightness": 20, "blur": 5}] using the operation names
+of ImageModel.apply_op. Slider values and filter parameters are clamped
+to their GUI ranges, and scale further to an output of at most
+MAX_OUTPUT_PIXELS. Decoded inputs over MAX_INPUT_PIXELS are refused
+with 413.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+# Import modules dynamically
+image_processing_module = importlib.import_module("1_image_processing")
+op_registry_module = importlib.import_module("12_op_registry")
+
+ImageModel = image_processing_module.ImageModel
+get_op = op_registry_module.get_op
+
+
+# Encoders for the supported output formats
+FORMATS = {
+    "png": (".png", "image/png"),
+    "jpg": (".jpg", "image/jpeg"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "bmp": (".bmp", "image/bmp"),
+}
+
+# Scale range of the GUI's Resize slider, and the largest output produced
+SCALE_RANGE = (0.1, 3.0)
+MAX_OUTPUT_PIXELS = 64_000_000
+
+# Largest decoded input accepted (a small compressed body can hold far more)
+MAX_INPUT_PIXELS = 64_000_000
+
+# Ranges of the other adjustment sliders (edge thresholds as the edge filter's)
+ADJUST_RANGES = {
+    "brightness": (-100, 100),
+    "contrast": (0.5, 2.0),
+    "blur": (0, 20),
+    "edge_low": get_op("edge").ranges["low"],
+    "edge_high": get_op("edge").ranges["high"],
+}
+
+
+class RequestError(Exception):
+    """Client error carrying the HTTP status to return."""
+
+    def __init__(self, status, message):
+        """Initialize error with HTTP status and message."""
+        super().__init__(message)
+        self.status = status
+
+
+def _number(value, name):
+    """Return value if it is a number (not a bool), else raise RequestError."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RequestError(400, f"{name} must be a number")
+    return value
+
+
+def _clamp_params(params, ranges):
+    """Return params with every value that has a range checked and clamped into it (integer ranges round)."""
+    clamped = dict(params)
+    for key, (low, high) in ranges.items():
+        if key in clamped:
+            value = min(max(_number(clamped[key], key), low), high)
+            clamped[key] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else float(value)
+    return clamped
+
+
+def _rect(rect, name):
+    """Return rect if it is None or four numbers (x, y, w, h), else raise RequestError."""
+    if rect is not None and (not isinstance(rect, (list, tuple)) or len(rect) != 4):
+        raise RequestError(400, f"{name} must be [x, y, w, h] or null")
+    for value in rect or ():
+        _number(value, name)
+    return rect
+
+
+def _clamp_filters(params):
+    """Return filter step params with each filter's parameters clamped to its ranges."""
+    if "steps" not in params:
+        name = params.get("name")
+        options = _clamp_params({k: v for k, v in params.items() if k != "name"}, get_op(name).ranges)
+        return {"name": name, **options}
+    steps = params["steps"]
+    if not isinstance(steps, list) or not all(isinstance(s, (list, tuple)) and len(s) == 2 for s in steps):
+        raise RequestError(400, "Filter steps must be [name, params] pairs")
+    for _name, options in steps:
+        if options is not None and not isinstance(options, dict):
+            raise RequestError(400, "Filter params must be objects")
+    return {**params, "steps": [[name, _clamp_params(options or {}, get_op(name).ranges)] for name, options in steps]}
+
+
+def clamp_recipe(recipe, shape):
+    """Return recipe with slider values and filter parameters checked and clamped to their GUI ranges, and every scale bounded so the output stays within the size limits."""
+    # Largest scale whose output fits MAX_OUTPUT_PIXELS (rotations keep the pixel count)
+    limit = min(SCALE_RANGE[1], (MAX_OUTPUT_PIXELS / (shape[0] * shape[1])) ** 0.5)
+    clamped = []
+    for step in recipe:
+        if not isinstance(step, dict):
+            raise RequestError(400, "Recipe steps must be objects")
+        op = step.get("op")
+        if "scale" in step:
+            step = {**step, "scale": min(max(float(_number(step["scale"], "Scale")), SCALE_RANGE[0]), limit)}
+        if op == "adjust":
+            step = _clamp_params(step, ADJUST_RANGES)
+            if "roi" in step:
+                _rect(step["roi"], "roi")
+        elif op == "select":
+            _rect(step.get("rect"), "rect")
+        elif op == "filter":
+            step = {"op": op, **_clamp_filters({k: v for k, v in step.items() if k != "op"})}
+        elif op == "layer" and step.get("name") is not None and isinstance(step.get("params"), dict):
+            step = {**step, "params": _clamp_params(step["params"], get_op(step["name"]).ranges)}
+        clamped.append(step)
+    return clamped
+
+
+def process_image(img, recipe, fmt="png"):
+    """Run recipe on a decoded image and return (encoded bytes, content type)."""
+    # Validate output format
+    if fmt not in FORMATS:
+        raise RequestError(400, f"Unsupported format: {fmt}")
+    ext, content_type = FORMATS[fmt]
+
+    # Headless model: no undo snapshots
+    model = ImageModel()
+    model.record_history = False
+    model.load_array(img)
+    try:
+        recipe = clamp_recipe(recipe, img.shape)
+        model.apply_recipe(recipe)
+    except (KeyError, TypeError, ValueError, IndexError, ZeroDivisionError, cv2.error) as e:
+        # Values the checks above do not cover still fail as a bad request
+        raise RequestError(400, f"Invalid recipe: {e}")
+
+    # Encode result
+    ok, buf = cv2.imencode(ext, model.current_img)
+    if not ok:
+        raise RequestError(500, "Could not encode result")
+    return buf.tobytes(), content_type
+
+
+class ImageServer(ThreadingHTTPServer):
+    """
+    HTTP server with a bounded processing pool.
+
+    At most workers requests are processed at once and at most queue
+    more wait for a worker; further requests get 503 immediately.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=4, queue=16, max_body=64 * 1024 ** 2, root=None):
+        """Initialize server with pool size, queue bound, body limit and shared-disk root."""
+        super().__init__(address, ImageRequestHandler)
+
+        # Processing pool and admission control
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-worker")
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+        # Request limits
+        self.max_body = max_body
+        self.root = Path(root).resolve() if root else None
+
+    def resolve_path(self, path):
+        """Return path as a file inside the shared-disk root, or raise RequestError."""
+        if self.root is None:
+            raise RequestError(403, "Path input is disabled (start the server with --root)")
+        full = (self.root / path).resolve()
+        if self.root != full and self.root not in full.parents:
+            raise RequestError(403, "Path is outside the shared root")
+        if not full.is_file():
+            raise RequestError(404, "File not found")
+        return full
+
+    def server_close(self):
+        """Stop accepting requests and shut down the pool."""
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """Handler for /process and /health."""
+
+    def log_message(self, fmt, *args):
+        """Silence per-request logging (load tests would flood the console)."""
+        pass
+
+    def send_body(self, status, body, content_type):
+        """Send a complete response."""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        """Send a JSON error response."""
+        self.send_body(status, json.dumps({"error": message}).encode(), "application/json")
+
+    def do_GET(self):
+        """Answer health checks."""
+        if urllib.parse.urlparse(self.path).path == "/health":
+            self.send_body(200, b'{"status": "ok"}', "application/json")
+        else:
+            self.send_error_json(404, "Not found")
+
+    def do_POST(self):
+        """Process an image with a recipe."""
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/process":
+            self.send_error_json(404, "Not found")
+            return
+
+        # Body length, checked once for both branches below
+        try:
+            length = self.content_length()
+        except RequestError as e:
+            self.send_error_json(e.status, str(e))
+            return
+
+        # Reject when pool and queue are both full (drain the upload so the
+        # client sees the 503 rather than a broken pipe)
+        if not self.server.slots.acquire(blocking=False):
+            if length is not None and length <= self.server.max_body:
+                self.rfile.read(length)
+            self.send_error_json(503, "Server busy")
+            return
+        try:
+            body, content_type = self.handle_process(url, length)
+            self.send_body(200, body, content_type)
+        except RequestError as e:
+            self.send_error_json(e.status, str(e))
+        except Exception as e:
+            self.send_error_json(500, f"Processing failed: {e}")
+        finally:
+            self.server.slots.release()
+
+    def content_length(self):
+        """Return the Content-Length header as an int (None if absent), or raise RequestError."""
+        value = self.headers.get("Content-Length")
+        if value is None:
+            return None
+        value = value.strip()
+        if not value.isdigit():
+            raise RequestError(400, "Invalid Content-Length")
+        return int(value)
+
+    def handle_process(self, url, length):
+        """Read the request, run it on the pool and return (body, content type)."""
+        # Enforce body size before reading
+        if length is None:
+            raise RequestError(411, "Content-Length required")
+        if length > self.server.max_body:
+            raise RequestError(413, f"Body larger than {self.server.max_body} bytes")
+        data = self.rfile.read(length)
+
+        # JSON body references a file on shared disk
+        query = urllib.parse.parse_qs(url.query)
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                req = json.loads(data)
+            except json.JSONDecodeError as e:
+                raise RequestError(400, f"Invalid JSON: {e}")
+            if not isinstance(req, dict):
+                raise RequestError(400, "JSON body must be an object")
+            path = req.get("path", "")
+            if not isinstance(path, str):
+                raise RequestError(400, "Path must be a string")
+            path = self.server.resolve_path(path)
+            recipe = req.get("recipe", [])
+            fmt = req.get("format", "png")
+            img = cv2.imread(str(path))
+        else:
+            try:
+                recipe = json.loads(query.get("recipe", ["[]"])[0])
+            except json.JSONDecodeError as e:
+                raise RequestError(400, f"Invalid recipe: {e}")
+            fmt = query.get("format", ["png"])[0]
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+        # Validate inputs
+        if img is None:
+            raise RequestError(400, "Could not decode image")
+        if img.shape[0] * img.shape[1] > MAX_INPUT_PIXELS:
+            raise RequestError(413, f"Image larger than {MAX_INPUT_PIXELS} pixels")
+        if not isinstance(recipe, list):
+            raise RequestError(400, "Recipe must be a list of steps")
+        if not isinstance(fmt, str):
+            raise RequestError(400, "Format must be a string")
+
+        # Run on the worker pool (this handler thread waits for it)
+        return self.server.pool.submit(process_image, img, recipe, fmt.lower()).result()
+
+
+def serve(args):
+    """Run the server until interrupted."""
+    server = ImageServer(
+        (args.host, args.port),
+        workers=args.workers,
+        queue=args.queue,
+        max_body=args.max_body_mb * 1024 ** 2,
+        root=args.root,
+    )
+    print(f"Serving on http://{args.host}:{server.server_address[1]} ({args.workers} workers, queue {args.queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def post_image(url, data, recipe, fmt="png", timeout=60):
+    """Send one upload request; return (status, body bytes)."""
+    query = urllib.parse.urlencode({"recipe": json.dumps(recipe), "format": fmt})
+    req = urllib.request.Request(
+        f"{url}/process?{query}", data=data, method="POST",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except urllib.error.URLError as e:
+        # Connection closed before a response (e.g. oversized body)
+        return "error", str(e.reason).encode()
+
+
+def client(args):
+    """Drive the server with concurrent requests and report latency and throughput."""
+    # Input image: file or deterministic synthetic image
+    if args.image:
+        data = Path(args.image).read_bytes()
+    else:
+        rng = np.random.default_rng(0)
+        img = cv2.resize(rng.integers(0, 256, (48, 64, 3), dtype=np.uint8), (2048, 1536), interpolation=cv2.INTER_CUBIC)
+        data = cv2.imencode(".png", img)[1].tobytes()
+    recipe = json.loads(args.recipe)
+
+    # Fire requests from a pool of client threads
+    def one(_):
+        start = time.perf_counter()
+        status, _body = post_image(args.url, data, recipe, args.format)
+        return status, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    # Summarize
+    ok = sorted(t for status, t in results if status == 200)
+    statuses = {}
+    for status, _t in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    print(f"{len(results)} requests in {elapsed:.2f}s ({len(results) / elapsed:.1f} req/s), status counts {statuses}")
+    if ok:
+        pct = lambda p: ok[min(len(ok) - 1, int(p * len(ok)))] * 1000
+        print(f"latency ms: p50 {pct(0.5):.0f}  p90 {pct(0.9):.0f}  p99 {pct(0.99):.0f}  max {ok[-1] * 1000:.0f}")
+
+
+def main():
+    """Parse arguments and run server or client."""
+    parser = argparse.ArgumentParser(description="Local image-processing service")
+    sub = parser.add_subparsers(dest="mode", required=True)
+
+    srv = sub.add_parser("serve", help="run the HTTP server")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    srv.add_argument("--queue", type=int, default=16)
+    srv.add_argument("--max-body-mb", type=int, default=64)
+    srv.add_argument("--root", help="shared-disk directory allowed for path requests")
+    srv.set_defaults(func=serve)
+
+    cli = sub.add_parser("client", help="load-test a running server")
+    cli.add_argument("--url", default="http://127.0.0.1:8765")
+    cli.add_argument("--image", help="image file to upload (synthetic if omitted)")
+    cli.add_argument("--recipe", default='[{"op": "adjust", "brightness": 20, "contrast": 1.2, "blur": 5}]')
+    cli.add_argument("--format", default="png")
+    cli.add_argument("--requests", type=int, default=50)
+    cli.add_argument("--concurrency", type=int, default=8)
+    cli.set_defaults(func=client)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Streaming mode: run the ImageModel slider pipeline over video frames.
+
+Frames are read with cv2.VideoCapture (a video file or an image sequence
+pattern such as frames/%04d.png), processed with ImageModel.process_frame
+into reused buffers and written with cv2.VideoWriter. Decode, process and
+encode run as three pipelined threads connected by bounded queues, so all
+three overlap. Usage:
+
+    python 11_video_stream.py INPUT OUTPUT [--brightness 20] [--contrast 1.2]
+        [--blur 5] [--scale 0.5] [--grayscale] [--edge]
+    python 11_video_stream.py synthetic OUTPUT --frames 300   (1080p test source)
+"""
+import sys
+import time
+import queue
+import argparse
+import importlib
+import threading
+from pathlib import Path
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+# Import modules dynamically
+image_processing_module = importlib.import_module("1_image_processing")
+
+ImageModel = image_processing_module.ImageModel
+
+
+# Marker passed down the queues after the last frame
+_END = object()
+
+
+class BufferPool:
+    """
+    Fixed set of reusable frame arrays.
+
+    Arrays are allocated on first demand up to limit; after that get()
+    blocks until a downstream stage returns one with put().
+    """
+
+    def __init__(self, limit):
+        """Initialize empty pool allowing up to limit arrays."""
+        self.limit = limit
+        self.created = 0
+        self._free = queue.Queue()
+
+    def get(self, shape, dtype=np.uint8):
+        """Return a free array of the given shape."""
+        # Prefer a returned array of the right shape; one of another shape
+        # is dropped and no longer counts against the limit
+        try:
+            arr = self._free.get_nowait()
+            if arr.shape == shape and arr.dtype == dtype:
+                return arr
+            self.created -= 1
+        except queue.Empty:
+            pass
+
+        # Allocate while under the limit, otherwise wait for one
+        if self.created < self.limit:
+            self.created += 1
+            return np.empty(shape, dtype)
+        arr = self._free.get()
+        if arr.shape != shape or arr.dtype != dtype:
+            arr = np.empty(shape, dtype)
+        return arr
+
+    def put(self, arr):
+        """Return an array to the pool."""
+        self._free.put(arr)
+
+
+class FramePipeline:
+    """
+    Three-stage decode/process/encode pipeline.
+
+    The model's brightness, contrast, blur and scale configure the
+    processing stage; grayscale and edge are optional per-frame effects.
+    """
+
+    def __init__(self, model, source, output, fourcc="mp4v", fps=None, depth=4, grayscale=False, edge=False):
+        """Initialize pipeline for a source (path, pattern or frame iterator) and output path."""
+        # Processing configuration
+        self.model = model
+        self.grayscale = grayscale
+        self.edge = edge
+
+        # Input and output
+        self.source = source
+        self.output = output
+        self.fourcc = fourcc
+        self.fps = fps
+
+        # Bounded queues between stages and reusable frame buffers
+        self.decoded = queue.Queue(maxsize=depth)
+        self.processed = queue.Queue(maxsize=depth)
+        self.in_pool = BufferPool(depth + 2)
+        self.out_pool = BufferPool(depth + 2)
+
+        # Results
+        self.frames = 0
+        self.source_fps = None
+        self.error = None
+
+    def _decode(self):
+        """Read frames into pooled buffers."""
+        try:
+            if isinstance(self.source, str):
+                cap = cv2.VideoCapture(self.source)
+                if not cap.isOpened():
+                    raise ValueError(f"Cannot open video source: {self.source}")
+                self.source_fps = cap.get(cv2.CAP_PROP_FPS) or None
+                shape = None
+                while self.error is None:
+                    # Reuse a pooled array once the frame size is known
+                    buf = self.in_pool.get(shape) if shape else None
+                    ok, frame = cap.read(buf) if buf is not None else cap.read()
+                    if not ok:
+                        break
+                    shape = frame.shape
+                    self.decoded.put(frame)
+                cap.release()
+            else:
+                # In-memory iterator of frames (synthetic sources, tests)
+                for frame in self.source:
+                    if self.error is not None:
+                        break
+                    buf = self.in_pool.get(frame.shape, frame.dtype)
+                    np.copyto(buf, frame)
+                    self.decoded.put(buf)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.decoded.put(_END)
+
+    def _process(self):
+        """Run the model pipeline on each decoded frame."""
+        work = {}
+        try:
+            while True:
+                frame = self.decoded.get()
+                if frame is _END:
+                    break
+                if self.error is None:
+                    out = self.out_pool.get(self.model.frame_shape(frame.shape))
+                    out = self.model.process_frame(frame, work, out=out, grayscale=self.grayscale, edge=self.edge)
+                    self.processed.put(out)
+                self.in_pool.put(frame)
+        except Exception as e:
+            self.error = e
+            # Keep draining so the decoder never blocks on a full queue or pool
+            while True:
+                frame = self.decoded.get()
+                if frame is _END:
+                    break
+                self.in_pool.put(frame)
+        finally:
+            self.processed.put(_END)
+
+    def _encode(self):
+        """Write processed frames to the output."""
+        writer = None
+        try:
+            while True:
+                frame = self.processed.get()
+                if frame is _END:
+                    break
+                if self.error is None:
+                    # Open writer once the output size is known
+                    if writer is None:
+                        fps = self.fps or self.source_fps or 30.0
+                        h, w = frame.shape[:2]
+                        writer = cv2.VideoWriter(self.output, cv2.VideoWriter_fourcc(*self.fourcc), fps, (w, h))
+                        if not writer.isOpened():
+                            raise ValueError(f"Cannot open video writer: {self.output}")
+                    writer.write(frame)
+                    self.frames += 1
+                self.out_pool.put(frame)
+        except Exception as e:
+            self.error = e
+            # Keep draining so upstream stages never block on a full queue or pool
+            while True:
+                frame = self.processed.get()
+                if frame is _END:
+                    break
+                self.out_pool.put(frame)
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def run(self):
+        """Run all stages to completion and return frames per second."""
+        start = time.perf_counter()
+        stages = [threading.Thread(target=f, name=f.__name__.strip("_"), daemon=True)
+                  for f in (self._decode, self._process, self._encode)]
+        for t in stages:
+            t.start()
+        for t in stages:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        # Surface the first stage error
+        if self.error is not None:
+            raise self.error
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+
+def synthetic_frames(count, width=1920, height=1080):
+    """Yield a deterministic moving 1080p test pattern."""
+    rng = np.random.default_rng(0)
+    base = cv2.resize(rng.integers(0, 256, (54, 96, 3), dtype=np.uint8), (width * 2, height), interpolation=cv2.INTER_CUBIC)
+    for i in range(count):
+        x = (i * 8) % width
+        yield base[:, x:x + width]
+
+
+def main():
+    """Parse arguments and stream the input through the pipeline."""
+    parser = argparse.ArgumentParser(description="Apply the editor pipeline to a video or image sequence")
+    parser.add_argument("input", help="video file, image sequence pattern, or 'synthetic'")
+    parser.add_argument("output", help="output video file")
+    parser.add_argument("--brightness", type=int, default=0)
+    parser.add_argument("--contrast", type=float, default=1.0)
+    parser.add_argument("--blur", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--grayscale", action="store_true")
+    parser.add_argument("--edge", action="store_true")
+    parser.add_argument("--fourcc", default="mp4v")
+    parser.add_argument("--fps", type=float, help="output frame rate (defaults to the source rate)")
+    parser.add_argument("--frames", type=int, default=300, help="frame count for the synthetic source")
+    args = parser.parse_args()
+
+    # Configure the model like the sliders would
+    model = ImageModel()
+    model.brightness = args.brightness
+    model.contrast = args.contrast
+    model.blur = args.blur
+    model.scale = args.scale
+
+    # Synthetic 1080p source for real-time checks without a file
+    source = synthetic_frames(args.frames) if args.input == "synthetic" else args.input
+    pipeline = FramePipeline(model, source, args.output, fourcc=args.fourcc, fps=args.fps,
+                             grayscale=args.grayscale, edge=args.edge)
+    fps = pipeline.run()
+
+    # Report throughput against the real-time target
+    target = pipeline.fps or pipeline.source_fps or 30.0
+    verdict = "real time" if fps >= target else "below real time"
+    print(f"{pipeline.frames} frames at {fps:.1f} fps ({verdict}, target {target:.0f} fps)")
+
+
+if __name__ == "__main__":
+    main()
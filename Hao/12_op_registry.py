@@ -0,0 +1,294 @@
+"""
+Pluggable filter registry and fused chain executor.
+
+Each op declares how it works so the executor can run a chain with as
+few full-frame passes and allocations as possible:
+
+    pointwise (lut)      per-channel 8-bit lookup table; consecutive LUT
+                         ops are composed into one table and applied in
+                         place with cv2.LUT (16-bit and float frames use
+                         the table linearly interpolated to their range)
+    pointwise (matrix)   3x3 colour mix; consecutive matrix ops are
+                         multiplied into one matrix and applied with a
+                         single cv2.transform (saturating once, at the end)
+    neighbourhood        func(src, dst, **params) writing into dst
+
+Neighbourhood and matrix passes ping-pong between two scratch buffers, so
+a chain of any length allocates at most two frames. The input image is
+never modified.
+
+New filters are added with register_op(OpSpec(...)).
+"""
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# High-depth frames keep their type through every pass
+bit_depth_module = importlib.import_module("17_bit_depth")
+to_8bit = bit_depth_module.to_8bit
+to_depth = bit_depth_module.to_depth
+
+
+class OpSpec:
+    """
+    Declaration of one filter.
+
+    channels_in is 1, 3 or None (any); channels_out is 1, 3 or None
+    (same as input). inplace marks ops whose func may read and write
+    the same buffer. defaults holds the parameters shown in the GUI and
+    ranges their (min, max) slider limits.
+    halo is the neighbourhood radius in rows; neighbourhood ops without
+    one are never split into bands (see 13_parallel_tiles).
+    """
+
+    def __init__(self, name, kind, func=None, lut=None, matrix=None,
+                 channels_in=None, channels_out=None, inplace=False, defaults=None, halo=None, ranges=None):
+        """Initialize op declaration."""
+        # Exactly one implementation per kind
+        if kind == "pointwise" and (lut is None) == (matrix is None):
+            raise ValueError(f"Pointwise op '{name}' needs exactly one of lut or matrix")
+        if kind == "neighbourhood" and func is None:
+            raise ValueError(f"Neighbourhood op '{name}' needs func")
+        if kind not in ("pointwise", "neighbourhood"):
+            raise ValueError(f"Unknown op kind: {kind}")
+
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.lut = lut
+        self.matrix = matrix
+        self.channels_in = channels_in
+        self.channels_out = channels_out
+        self.inplace = inplace or lut is not None
+        self.defaults = defaults or {}
+        self.ranges = ranges or {}
+        self.halo = 0 if kind == "pointwise" else halo
+
+
+# Registered ops by name
+REGISTRY = {}
+
+
+def register_op(spec):
+    """Add or replace an op in the registry."""
+    REGISTRY[spec.name] = spec
+    return spec
+
+
+def get_op(name):
+    """Return the spec of a registered op."""
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise ValueError(f"Unknown filter: {name}")
+
+
+def _channels(img):
+    """Return channel count of an image."""
+    return 1 if img.ndim == 2 else img.shape[2]
+
+
+def _lut_table(spec, params, channels):
+    """Return the op's lookup table as a (256, channels) uint8 array."""
+    table = np.asarray(spec.lut(**params), dtype=np.uint8).reshape(256, -1)
+    if table.shape[1] == 1 and channels > 1:
+        table = np.repeat(table, channels, axis=1)
+    return table
+
+
+def _apply_lut(src, dst, table):
+    """Write the (256, channels) table applied to src into dst, for any bit depth."""
+    channels = table.shape[1]
+    if src.dtype == np.uint8:
+        lut = table.reshape(256, 1, channels) if channels > 1 else table.reshape(256)
+        return cv2.LUT(src, lut, dst=dst)
+
+    # Stretch the 8-bit curve over the frame's range, one channel at a time
+    white = 65535 if src.dtype == np.uint16 else 1.0
+    xs = np.arange(256) * (white / 255)
+    for c in range(channels):
+        ys = table[:, c] * (white / 255)
+        s = src[..., c] if src.ndim == 3 else src
+        d = dst[..., c] if dst.ndim == 3 else dst
+        if src.dtype == np.uint16:
+            # Full 16-bit table, then a single gather
+            full = np.rint(np.interp(np.arange(65536), xs, ys)).astype(np.uint16)
+            d[...] = full[s]
+        else:
+            d[...] = np.interp(s, xs, ys)
+    return dst
+
+
+class ChainExecutor:
+    """
+    Runs a list of (name, params) steps over an image.
+
+    Steps are grouped first: runs of LUT ops and runs of matrix ops are
+    fused, everything else runs one op per pass.
+    """
+
+    def __init__(self, registry=None, tiles=None):
+        """Initialize executor over a registry (the global one by default)."""
+        self.registry = REGISTRY if registry is None else registry
+        self.passes = 0
+
+        # Optional TileRunner for splitting large frames into bands
+        self.tiles = tiles
+
+    def _call(self, func, src, dst, halo, key):
+        """Run func(src, dst) directly or in bands when a TileRunner is set (key names the pass)."""
+        if self.tiles is None or halo is None:
+            return func(src, dst)
+        return self.tiles.apply(func, src, dst, halo, key=key)
+
+    def plan(self, steps):
+        """Return passes as (kind, [(spec, params), ...]) with fusable ops grouped."""
+        passes = []
+        for name, params in steps:
+            spec = self.registry.get(name)
+            if spec is None:
+                raise ValueError(f"Unknown filter: {name}")
+            params = {**spec.defaults, **(params or {})}
+
+            # Fusion group of this op
+            if spec.kind == "pointwise":
+                group = "lut" if spec.lut is not None else "matrix"
+            else:
+                group = "single"
+
+            # Extend the previous pass when it is the same fusable group
+            if passes and group != "single" and passes[-1][0] == group:
+                passes[-1][1].append((spec, params))
+            else:
+                passes.append((group, [(spec, params)]))
+        return passes
+
+    def run(self, img, steps, channels=None):
+        """Return img with all steps applied (converted to channels if given); img itself is not modified."""
+        self.passes = 0
+        buffers = [None, None]
+        current = img
+
+        def scratch(shape):
+            # Pick a scratch buffer that is not the current image
+            for i in range(2):
+                buf = buffers[i]
+                if buf is not None and buf is not current and buf.shape == shape:
+                    return buf
+            for i in range(2):
+                if buffers[i] is None or buffers[i] is not current:
+                    buffers[i] = np.empty(shape, img.dtype)
+                    return buffers[i]
+
+        for group, ops in self.plan(steps):
+            self.passes += 1
+
+            # Match the channel count the first op of the pass needs
+            need = ops[0][0].channels_in
+            have = _channels(current)
+            if need == 3 and have == 1:
+                current = cv2.cvtColor(current, cv2.COLOR_GRAY2BGR, dst=scratch(current.shape + (3,)))
+            elif need == 1 and have == 3:
+                current = cv2.cvtColor(current, cv2.COLOR_BGR2GRAY, dst=scratch(current.shape[:2]))
+
+            if group == "lut":
+                # Compose tables, then one lookup (in place once we own the buffer)
+                channels = _channels(current)
+                table = np.arange(256, dtype=np.uint8).reshape(256, 1).repeat(channels, axis=1)
+                for spec, params in ops:
+                    step = _lut_table(spec, params, channels)
+                    table = np.take_along_axis(step, table.astype(np.intp), axis=0)
+                dst = current if current is not img else scratch(current.shape)
+                current = self._call(lambda src, out: _apply_lut(src, out, table), current, dst, 0, "lut")
+
+            elif group == "matrix":
+                # Multiply colour matrices (later ops on the left)
+                m = np.eye(3)
+                for spec, params in ops:
+                    m = np.asarray(spec.matrix(**params), dtype=np.float64) @ m
+                current = self._call(lambda src, out: cv2.transform(src, m, dst=out), current, scratch(current.shape), 0,
+                                     "matrix")
+
+            else:
+                spec, params = ops[0]
+                out_ch = spec.channels_out or _channels(current)
+                shape = current.shape[:2] + ((out_ch,) if out_ch > 1 else ())
+                dst = current if spec.inplace and current is not img and current.shape == shape else scratch(shape)
+                current = self._call(lambda src, out: spec.func(src, out, **params), current, dst, spec.halo, spec.name)
+
+        # Convert the result to the channel count the caller expects
+        if channels == 3 and _channels(current) == 1:
+            current = cv2.cvtColor(current, cv2.COLOR_GRAY2BGR, dst=scratch(current.shape + (3,)))
+        elif channels == 1 and _channels(current) == 3:
+            current = cv2.cvtColor(current, cv2.COLOR_BGR2GRAY, dst=scratch(current.shape[:2]))
+
+        # Never hand back the caller's array
+        return current.copy() if current is img else current
+
+
+def _grayscale_matrix():
+    """BGR luma weights on every output channel."""
+    return [[0.114, 0.587, 0.299]] * 3
+
+
+def _sepia_matrix():
+    """Classic sepia tone in BGR order."""
+    return [[0.131, 0.534, 0.272],
+            [0.168, 0.686, 0.349],
+            [0.189, 0.769, 0.393]]
+
+
+def _saturation_matrix(amount=1.5):
+    """Blend between luma (0) and the original colour (1), extrapolating above 1."""
+    gray = np.array(_grayscale_matrix())
+    return gray + amount * (np.eye(3) - gray)
+
+
+def _invert_lut():
+    """Negative image."""
+    return 255 - np.arange(256)
+
+
+def _threshold_lut(level=128):
+    """Binary threshold at level."""
+    return np.where(np.arange(256) >= level, 255, 0)
+
+
+def _gamma_lut(gamma=1.0):
+    """Gamma curve (values above 1 brighten)."""
+    return np.clip(np.rint(255 * (np.arange(256) / 255.0) ** (1.0 / gamma)), 0, 255)
+
+
+def _sharpen(src, dst, amount=1.0):
+    """Laplacian sharpening with strength amount."""
+    a = float(amount)
+    kernel = np.array([[0, -a, 0], [-a, 1 + 4 * a, -a], [0, -a, 0]], dtype=np.float32)
+    return cv2.filter2D(src, -1, kernel, dst=dst)
+
+
+def _edge(src, dst, low=100, high=200):
+    """Canny edges (single-channel output; high-depth input is quantized first; no halo, as hysteresis follows edge chains across the whole frame)."""
+    if src.dtype == np.uint8:
+        return cv2.Canny(src, low, high, edges=dst)
+    edges = to_depth(cv2.Canny(to_8bit(src), low, high), src.dtype)
+    if dst is None:
+        return edges
+    dst[...] = edges
+    return dst
+
+
+# Built-in filters
+register_op(OpSpec("grayscale", "pointwise", matrix=_grayscale_matrix, channels_in=3, channels_out=3))
+register_op(OpSpec("sepia", "pointwise", matrix=_sepia_matrix, channels_in=3, channels_out=3))
+register_op(OpSpec("saturation", "pointwise", matrix=_saturation_matrix, channels_in=3, channels_out=3,
+                   defaults={"amount": 1.5}, ranges={"amount": (0.0, 3.0)}))
+register_op(OpSpec("invert", "pointwise", lut=_invert_lut))
+register_op(OpSpec("threshold", "pointwise", lut=_threshold_lut, defaults={"level": 128}, ranges={"level": (0, 255)}))
+register_op(OpSpec("gamma", "pointwise", lut=_gamma_lut, defaults={"gamma": 1.5}, ranges={"gamma": (0.2, 3.0)}))
+register_op(OpSpec("sharpen", "neighbourhood", func=_sharpen, defaults={"amount": 1.0}, halo=1,
+                   ranges={"amount": (0.0, 3.0)}))
+register_op(OpSpec("edge", "neighbourhood", func=_edge, channels_out=1,
+                   defaults={"low": 100, "high": 200}, ranges={"low": (0, 500), "high": (0, 500)}))
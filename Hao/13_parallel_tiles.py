@@ -0,0 +1,231 @@
+"""
+TileRunner class for intra-image parallelism.
+
+Splits one large frame into horizontal bands and runs an operation on
+each band on a thread pool (OpenCV releases the GIL while it works).
+Neighbourhood operations read a halo of extra rows above and below each
+band so the stitched result matches the whole-image call:
+
+    pointwise (halo 0)          exact
+    GaussianBlur / box filters  exact with halo = kernel radius
+    resize                      exact where the rows repeat their sampling
+                                phase every power-of-two output rows (2x,
+                                1/2x, ...): cv2.resize per band on the
+                                matching source rows; one call otherwise
+    Canny                       exact: Sobel gradients in bands (halo =
+                                aperture radius), suppression and hysteresis
+                                on the whole frame (see 14_edge_stage)
+
+Band threads and OpenCV's own worker threads share the cores:
+cv2.setNumThreads is set to cores // threads so the two levels of
+parallelism do not oversubscribe the machine. The setting is process
+global: shutdown() restores the count the runner found, so a short-lived
+runner (auto-tuning) leaves the one of a live runner intact.
+
+Bands do not pay off everywhere (one core, memory-bound passes, OpenCV
+already threading internally). An adaptive runner times each operation
+once in bands and once as a single call on real frames, and keeps bands
+only for operations where they took at most PAYOFF of the single call.
+"""
+import os
+import math
+import time
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# Brightness/contrast for every supported bit depth
+tone = importlib.import_module("17_bit_depth").tone
+
+# Largest fraction of the single-call time bands may take to be kept
+PAYOFF = 0.9
+
+
+class TileRunner:
+    """
+    Thread pool running operations over horizontal bands of an image.
+
+    Images smaller than min_pixels run as a single call, where band
+    overhead would outweigh the gain. With adaptive=False every large
+    image runs in bands (for tuning and tests that measure them).
+    """
+
+    def __init__(self, threads=None, cv_threads=None, min_pixels=4_000_000, adaptive=True):
+        """Initialize pool with band threads, the OpenCV threads per band and the payoff check."""
+        cores = os.cpu_count() or 1
+        self.threads = max(1, threads or cores)
+        self.min_pixels = min_pixels
+
+        # Give OpenCV the cores the band threads leave over (the previous
+        # count comes back on shutdown)
+        self.cv_threads = cv_threads if cv_threads is not None else max(1, cores // self.threads)
+        self._prev_cv_threads = cv2.getNumThreads()
+        cv2.setNumThreads(self.cv_threads)
+
+        self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="tile")
+
+        # Best seconds per pixel of each operation as (bands, single call)
+        self.adaptive = adaptive
+        self.timings = {}
+
+    def worth(self, img):
+        """Return True if img is large enough to split."""
+        return self.threads > 1 and img.shape[0] * img.shape[1] >= self.min_pixels
+
+    def use_bands(self, key):
+        """Return True if operation key is to run in bands (measured faster, or not measured yet)."""
+        if not self.adaptive:
+            return True
+        banded, single = self.timings.get(key, (None, None))
+        if banded is None:
+            return True
+        if single is None:
+            return False
+        return banded <= PAYOFF * single
+
+    def record(self, key, banded, seconds, pixels):
+        """Keep the best time per pixel of operation key with or without bands."""
+        rates = list(self.timings.get(key, (None, None)))
+        i = 0 if banded else 1
+        rate = seconds / max(1, pixels)
+        rates[i] = rate if rates[i] is None else min(rates[i], rate)
+        self.timings[key] = tuple(rates)
+
+    def banded_ops(self):
+        """Return (operations kept in bands, operations measured both ways)."""
+        measured = [t for t in self.timings.values() if None not in t]
+        return sum(1 for banded, single in measured if banded <= PAYOFF * single), len(measured)
+
+    def bands(self, h):
+        """Return (y0, y1) row ranges covering h rows, one per thread."""
+        n = min(self.threads, h)
+        edges = [h * i // n for i in range(n + 1)]
+        return [(edges[i], edges[i + 1]) for i in range(n)]
+
+    def apply(self, func, src, dst=None, halo=0, key=None):
+        """
+        Run func over bands of src and stitch the results into dst.
+
+        func(band, out) gets the source rows of a band (plus halo rows on
+        each side) and, for halo 0, the matching rows of dst to write
+        into; it returns the processed band. Output rows correspond to
+        input rows, so dst has src's height. key names the operation for
+        the payoff check (func's code by default).
+        """
+        # Small images, and operations bands do not speed up: one direct call
+        if not self.worth(src):
+            return self._single(func, src, dst)
+        key = key if key is not None else getattr(func, "__code__", func)
+        banded = self.use_bands(key)
+        start = time.perf_counter()
+        out = self._bands(func, src, dst, halo) if banded else self._single(func, src, dst)
+        self.record(key, banded, time.perf_counter() - start, src.shape[0] * src.shape[1])
+        return out
+
+    def _single(self, func, src, dst):
+        """Run func on the whole image into dst."""
+        out = func(src, dst)
+        if dst is not None and out is not dst:
+            dst[...] = out
+            return dst
+        return out
+
+    def _bands(self, func, src, dst, halo):
+        """Run func over bands of src on the pool and stitch the results into dst."""
+        h = src.shape[0]
+
+        def run(band):
+            y0, y1 = band
+            a, b = max(0, y0 - halo), min(h, y1 + halo)
+            part = func(src[a:b], dst[y0:y1] if halo == 0 and dst is not None else None)
+            return band, a, part
+
+        # Allocate output from the first band's type once all bands are known
+        results = list(self.pool.map(run, self.bands(h)))
+        if dst is None:
+            first = results[0][2]
+            dst = np.empty((h,) + first.shape[1:], first.dtype)
+
+        # Stitch the core rows of every band (halo rows are dropped)
+        for (y0, y1), a, part in results:
+            core = part[y0 - a:y0 - a + (y1 - y0)]
+            if not np.shares_memory(core, dst):
+                dst[y0:y1] = core
+        return dst
+
+    def gaussian_blur(self, img, k):
+        """Return cv2.GaussianBlur(img, (k, k), 0) computed in bands."""
+        return self.apply(lambda band, _out: cv2.GaussianBlur(band, (k, k), 0), img, halo=k // 2, key="gaussian_blur")
+
+    def box_blur(self, img, sizes):
+        """Return stacked cv2.blur passes with the given widths, computed in bands."""
+        def run(band, _out):
+            for size in sizes:
+                band = cv2.blur(band, (size, size))
+            return band
+        return self.apply(run, img, halo=sum(size // 2 for size in sizes), key="box_blur")
+
+    def sobel(self, img, dx, dy, aperture=3):
+        """Return the 16-bit Sobel derivative of img with the replicated border cv2.Canny uses, computed in bands."""
+        return self.apply(
+            lambda band, _out: cv2.Sobel(band, cv2.CV_16S, dx, dy, ksize=aperture, borderType=cv2.BORDER_REPLICATE),
+            img, halo=aperture // 2, key="sobel")
+
+    def canny(self, img, low, high, aperture=3):
+        """Return cv2.Canny(img, low, high) with its gradients computed in bands."""
+        # Hysteresis follows edge chains across the whole frame
+        gx = self.sobel(img, 1, 0, aperture)
+        gy = self.sobel(img, 0, 1, aperture)
+        return cv2.Canny(gx, gy, low, high)
+
+    def tone(self, img, contrast, brightness):
+        """Return bit_depth.tone(img, contrast, brightness) computed in bands."""
+        dst = np.empty_like(img)
+        return self.apply(lambda band, out: tone(band, contrast, brightness, dst=out), img, dst, key="tone")
+
+    def resize(self, img, size, interpolation=None):
+        """Return img resized to size (w, h) with cv2.resize, in output bands where that is exact; linear sampling only."""
+        w_out, h_out = size
+        h = img.shape[0]
+
+        # Output rows repeat their source phase every q rows (p source rows);
+        # only power-of-two q gives positions a band computes bit for bit
+        # as the whole call does (others round differently in the last bit)
+        g = math.gcd(h, h_out)
+        p, q = h // g, h_out // g
+        n = min(self.threads, h_out // q)
+        if (interpolation not in (None, cv2.INTER_LINEAR) or q & (q - 1) or n < 2
+                or w_out * h_out < self.min_pixels):
+            return cv2.resize(img, size, interpolation=interpolation or cv2.INTER_LINEAR)
+
+        # One call where bands were measured slower
+        banded = self.use_bands("resize")
+        start = time.perf_counter()
+        if not banded:
+            out = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+            self.record("resize", False, time.perf_counter() - start, w_out * h_out)
+            return out
+
+        # Bands start on period boundaries; one period of halo on each side
+        periods = h_out // q
+        edges = [periods * i // n * q for i in range(n)] + [h_out]
+        dst = np.empty((h_out, w_out) + img.shape[2:], img.dtype)
+
+        def run(band):
+            y0, y1 = band
+            a, b = max(0, y0 - q), min(h_out, y1 + q)
+            part = cv2.resize(img[a // q * p:b // q * p], (w_out, b - a), interpolation=cv2.INTER_LINEAR)
+            dst[y0:y1] = part[y0 - a:y1 - a]
+
+        list(self.pool.map(run, zip(edges[:-1], edges[1:])))
+        self.record("resize", True, time.perf_counter() - start, w_out * h_out)
+        return dst
+
+    def shutdown(self):
+        """Stop the pool and give OpenCV back the thread count it had before this runner."""
+        self.pool.shutdown(wait=True)
+        cv2.setNumThreads(self._prev_cv_threads)
@@ -0,0 +1,106 @@
+"""
+EdgeStage class for adjustable, cached Canny edge detection.
+
+Canny splits into an expensive part that does not depend on the
+thresholds (Sobel gradients) and the threshold-dependent non-maximum
+suppression and hysteresis. The stage caches the first part per input
+image and runs cv2.Canny on the stored gradients, so moving a threshold
+slider repeats only the second part. Gradients are taken per channel
+with Canny's own border handling, so the edges of a colour image are
+exactly those of cv2.Canny on the BGR image (strongest channel wins).
+"""
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# Thresholds are in 8-bit units, so high-depth input is quantized first
+bit_depth_module = importlib.import_module("17_bit_depth")
+to_8bit = bit_depth_module.to_8bit
+to_depth = bit_depth_module.to_depth
+
+
+class EdgeStage:
+    """
+    Canny edges of the most recent input with cached gradients.
+
+    smooth is an optional Gaussian kernel size applied to the input
+    before the gradients (0, the default, matches plain cv2.Canny);
+    aperture is the Sobel size. With a TileRunner in tiles the gradients
+    of large frames are computed in bands (exact: each band reads the
+    aperture radius around it).
+    """
+
+    def __init__(self, smooth=0, aperture=3):
+        """Initialize stage with smoothing kernel and Sobel aperture."""
+        self.smooth = smooth
+        self.aperture = aperture
+
+        # Optional TileRunner for splitting large frames into bands
+        self.tiles = None
+
+        # Threshold-independent work for the last input
+        self._source = None
+        self._dx = None
+        self._dy = None
+
+        # Last result and the thresholds that produced it
+        self._key = None
+        self._edges = None
+        self._bgr = None
+
+    def gradients(self, img):
+        """Return cached 16-bit (dx, dy) Sobel gradients of img, computing them on first use."""
+        if img is not self._source:
+            # 8-bit input with all its channels, optionally smoothed
+            src = to_8bit(img)
+            if self.smooth > 1:
+                src = (self.tiles.gaussian_blur(src, self.smooth) if self.tiles is not None
+                       else cv2.GaussianBlur(src, (self.smooth, self.smooth), 0))
+
+            # Gradients in the format cv2.Canny(dx, dy, ...) expects, with
+            # the replicated border cv2.Canny uses internally
+            if self.tiles is not None:
+                self._dx = self.tiles.sobel(src, 1, 0, self.aperture)
+                self._dy = self.tiles.sobel(src, 0, 1, self.aperture)
+            else:
+                self._dx = cv2.Sobel(src, cv2.CV_16S, 1, 0, ksize=self.aperture, borderType=cv2.BORDER_REPLICATE)
+                self._dy = cv2.Sobel(src, cv2.CV_16S, 0, 1, ksize=self.aperture, borderType=cv2.BORDER_REPLICATE)
+            self._source = img
+            self._key = None
+        return self._dx, self._dy
+
+    def edges(self, img, low, high):
+        """Return the single-channel edge map of img for the given thresholds."""
+        dx, dy = self.gradients(img)
+
+        # Only suppression and hysteresis depend on the thresholds
+        key = (low, high)
+        if key != self._key:
+            self._edges = cv2.Canny(dx, dy, low, high)
+            self._bgr = None
+            self._key = key
+        return self._edges
+
+    def apply(self, img, low, high):
+        """Return the edge map of img as a 3-channel BGR image of img's type (the same array while nothing changes)."""
+        edges = self.edges(img, low, high)
+        if self._bgr is None or self._bgr.dtype != img.dtype:
+            self._bgr = to_depth(cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR), img.dtype)
+        return self._bgr
+
+    def cache_bytes(self):
+        """Return the number of bytes held by cached gradients and edges."""
+        arrays = (self._dx, self._dy, self._edges, self._bgr)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def clear(self):
+        """Drop all cached work."""
+        self._source = None
+        self._dx = None
+        self._dy = None
+        self._key = None
+        self._edges = None
+        self._bgr = None
@@ -0,0 +1,131 @@
+"""
+LayerStack class for non-destructive adjustment layers.
+
+Each layer applies one registered filter (see 12_op_registry) to the
+output of the layer below it and caches its result together with the
+input it was computed from. Changing, toggling or moving layer k changes
+its cache key, so layers 0..k-1 reuse their outputs and only k..n are
+recomputed. The stack state is plain data (filter names, parameters and
+flags), so undo stores parameters instead of pixels.
+"""
+import importlib
+
+op_registry_module = importlib.import_module("12_op_registry")
+
+ChainExecutor = op_registry_module.ChainExecutor
+get_op = op_registry_module.get_op
+
+
+class Layer:
+    """One filter application with its parameters and visibility."""
+
+    def __init__(self, name, params=None, enabled=True):
+        """Initialize layer for registered filter name."""
+        # Fail early on unknown filters
+        spec = get_op(name)
+        self.name = name
+        self.params = {**spec.defaults, **(params or {})}
+        self.enabled = enabled
+
+    def key(self):
+        """Return a hashable description of everything that affects the output."""
+        return (self.name, self.enabled, tuple(sorted(self.params.items())))
+
+    def to_dict(self):
+        """Return the layer as plain data."""
+        return {"name": self.name, "params": dict(self.params), "enabled": self.enabled}
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create a layer from to_dict output."""
+        return cls(d["name"], d.get("params"), d.get("enabled", True))
+
+
+class LayerStack:
+    """
+    Ordered layers with per-layer cached outputs.
+
+    Layer 0 is applied first. Cache entry i holds (input, key, output)
+    and is reused while layer i sees the same input object with the
+    same key.
+    """
+
+    def __init__(self, executor=None):
+        """Initialize empty stack using executor to run filters."""
+        self.layers = []
+        self.executor = executor or ChainExecutor()
+
+        # Cached (input, key, output) per layer index
+        self._cache = []
+
+        # Layers recomputed by the last render
+        self.recomputed = 0
+
+    def __len__(self):
+        """Return the number of layers."""
+        return len(self.layers)
+
+    def add(self, name, params=None, index=None):
+        """Insert a layer (on top by default) and return it."""
+        layer = Layer(name, params)
+        self.layers.insert(len(self.layers) if index is None else index, layer)
+        return layer
+
+    def remove(self, index):
+        """Remove and return the layer at index."""
+        return self.layers.pop(index)
+
+    def move(self, index, new_index):
+        """Move the layer at index to new_index."""
+        layer = self.layers.pop(index)
+        self.layers.insert(new_index, layer)
+
+    def toggle(self, index):
+        """Flip the visibility of the layer at index."""
+        self.layers[index].enabled = not self.layers[index].enabled
+
+    def set_params(self, index, **params):
+        """Update parameters of the layer at index."""
+        self.layers[index].params.update(params)
+
+    def render(self, img):
+        """Return img with all enabled layers applied, reusing cached layer outputs."""
+        self.recomputed = 0
+        cache = []
+        current = img
+        for i, layer in enumerate(self.layers):
+            key = layer.key()
+
+            # Reuse while the input and the layer are unchanged
+            if i < len(self._cache) and self._cache[i][0] is current and self._cache[i][1] == key:
+                out = self._cache[i][2]
+            elif not layer.enabled:
+                out = current
+            else:
+                out = self.executor.run(current, [(layer.name, layer.params)], channels=3)
+                self.recomputed += 1
+            cache.append((current, key, out))
+            current = out
+
+        self._cache = cache
+        return current
+
+    def state(self):
+        """Return the stack as plain data for snapshots and journals."""
+        return [layer.to_dict() for layer in self.layers]
+
+    def load(self, state):
+        """Replace all layers from state() output (caches stay valid for unchanged layers)."""
+        self.layers = [Layer.from_dict(d) for d in state or []]
+
+    def cache_bytes(self):
+        """Return bytes held by cached layer outputs."""
+        total = 0
+        for inp, _key, out in self._cache:
+            if out is not inp:
+                total += out.nbytes
+        return total
+
+    def clear(self):
+        """Drop all cached layer outputs."""
+        self._cache = []
@@ -0,0 +1,234 @@
+"""
+Region-of-interest rendering with dirty-rectangle tracking.
+
+Rectangles are (x, y, w, h) tuples. RegionRenderer keeps full-size
+output frames whose pixels outside the selection are the unadjusted
+input. Adjustments run only on the selection plus the blur halo (see
+BlurEngine.blur_rect), so the selection matches a full render exactly.
+The display takes frames with take(), which also returns the rectangle
+in which the frame differs from the one taken before, so the view
+re-uploads only that patch.
+
+RegionEdits keeps the adjustments of earlier selections: when the
+selection changes, its blur and brightness/contrast stay on that
+rectangle as a masked layer instead of spreading to the whole image.
+"""
+import math
+import threading
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+
+# Brightness/contrast for every supported bit depth
+tone = importlib.import_module("17_bit_depth").tone
+
+
+def rect_union(a, b):
+    """Return the bounding rectangle of a and b (either may be None)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    x0, y0 = min(a[0], b[0]), min(a[1], b[1])
+    x1, y1 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def rect_clip(rect, shape):
+    """Return rect clipped to an image of the given shape, or None if nothing is left."""
+    h, w = shape[:2]
+    x0, y0 = max(0, rect[0]), max(0, rect[1])
+    x1, y1 = min(w, rect[0] + rect[2]), min(h, rect[1] + rect[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def rect_scale(rect, scale):
+    """Return rect with all coordinates multiplied by scale and rounded outwards."""
+    x0, y0 = math.floor(rect[0] * scale), math.floor(rect[1] * scale)
+    x1, y1 = math.ceil((rect[0] + rect[2]) * scale), math.ceil((rect[1] + rect[3]) * scale)
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def rect_transform(rect, op, shape):
+    """Return rect moved with the image by a rotation or flip op ("rotate90", "flip_h", ...) of an image of shape."""
+    x, y, w, h = rect
+    H, W = shape[:2]
+    if op == "rotate90":
+        return (H - (y + h), x, h, w)
+    if op == "rotate180":
+        return (W - (x + w), H - (y + h), w, h)
+    if op == "rotate270":
+        return (y, W - (x + w), h, w)
+    if op == "flip_h":
+        return (W - (x + w), y, w, h)
+    if op == "flip_v":
+        return (x, H - (y + h), w, h)
+    raise ValueError(f"Unknown geometry op: {op}")
+
+
+def rect_contains(outer, inner):
+    """Return True if inner lies completely within outer."""
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+class RegionRenderer:
+    """
+    Applies blur and brightness/contrast to one rectangle of a frame.
+
+    Frames are reused while the input frame stays the same object (a new
+    input starts new ones). A render never writes the frame the display
+    took last nor the frame it returned last, which may be taken at any
+    moment, so up to three frames rotate; a reused frame only gets its
+    old rectangle restored and the new one written.
+    """
+
+    def __init__(self, blur_engine):
+        """Initialize renderer blurring with blur_engine (strategy and cache of the full render)."""
+        self.blur_engine = blur_engine
+
+        # Input frame and its output frames as [frame, adjusted rect] pairs
+        self._source = None
+        self._frames = []
+
+        # Frame returned by the last render and the frame the display took
+        self._latest = None
+        self._shown = None
+        self._lock = threading.Lock()
+
+    def render(self, src, rect, blur=0, contrast=1.0, brightness=0):
+        """Return (output frame, pre-tonal selection) with rect of src adjusted; rect is in src pixels."""
+        rect = rect_clip(rect, src.shape)
+
+        # Pre-tonal selection, blurred as the full render would
+        core = None
+        if rect is not None:
+            x, y, w, h = rect
+            core = self.blur_engine.blur_rect(src, rect, blur) if blur > 0 else src[y:y + h, x:x + w]
+
+        # Pick a frame nobody else can be reading (new input: fresh copies)
+        with self._lock:
+            if src is not self._source:
+                self._source = src
+                self._frames = []
+                self._latest = None
+                self._shown = None
+            target = next((f for f in self._frames if f is not self._latest and f is not self._shown), None)
+            if target is None:
+                target = [src.copy(), None]
+                self._frames.append(target)
+
+        # Put back the unadjusted pixels of the rectangle this frame had
+        frame, old = target
+        if old is not None and old != rect:
+            x, y, w, h = old
+            frame[y:y + h, x:x + w] = src[y:y + h, x:x + w]
+
+        # Tonal adjustment straight into the frame
+        if rect is not None:
+            x, y, w, h = rect
+            tone(core, contrast, brightness, dst=frame[y:y + h, x:x + w])
+        target[1] = rect
+
+        with self._lock:
+            self._latest = target
+        return frame, core
+
+    def take(self):
+        """Return (frame, dirty, previous) for the display: the latest frame, the rectangle in which it differs from the previously taken one (None: all of it) and that frame."""
+        with self._lock:
+            latest, shown = self._latest, self._shown
+            if latest is None:
+                return None, None, None
+            self._shown = latest
+
+        # Both frames are the input outside their adjusted rectangles
+        if shown is None:
+            return latest[0], None, None
+        return latest[0], rect_union(shown[1], latest[1]), shown[0]
+
+    def cache_bytes(self):
+        """Return bytes held by the output frames."""
+        with self._lock:
+            return sum(frame.nbytes for frame, _rect in self._frames)
+
+    def clear(self):
+        """Drop the output frames (the display keeps the one it shows)."""
+        with self._lock:
+            self._source = None
+            self._frames = []
+            self._latest = None
+            self._shown = None
+
+
+class RegionEdits:
+    """
+    Committed local adjustments, applied in order as masked layers.
+
+    Each edit is {"rect": (x, y, w, h) in base image pixels, "blur": odd
+    kernel or 0, "contrast", "brightness"} and reads the output of the
+    edits before it. The output is cached for the last input, scale and
+    edits; the state is plain data, so undo and the journal store it.
+    """
+
+    def __init__(self, blur_engine):
+        """Initialize without edits, blurring with blur_engine's strategies."""
+        self.blur_engine = blur_engine
+        self.edits = []
+
+        # (input, key, output) of the last render
+        self._cache = None
+
+    def __len__(self):
+        """Return the number of edits."""
+        return len(self.edits)
+
+    def add(self, rect, blur, contrast, brightness):
+        """Keep an adjustment of rect on top of the earlier edits."""
+        self.edits.append({"rect": tuple(rect), "blur": blur, "contrast": contrast, "brightness": brightness})
+
+    def transform(self, op, shape):
+        """Move every rectangle with a rotation or flip op of a base image of shape."""
+        self.edits = [{**e, "rect": rect_transform(e["rect"], op, shape)} for e in self.edits]
+
+    def state(self):
+        """Return the edits as plain data for snapshots and journals."""
+        return [{**e, "rect": list(e["rect"])} for e in self.edits]
+
+    def load(self, state):
+        """Replace all edits from state() output (the cache stays valid for the same edits)."""
+        self.edits = [{**e, "rect": tuple(e["rect"])} for e in state or []]
+
+    def render(self, img, scale=1.0):
+        """Return img with every edit applied (rectangles scaled to img), or img itself without edits."""
+        if not self.edits:
+            return img
+        key = (scale, tuple((e["rect"], e["blur"], e["contrast"], e["brightness"]) for e in self.edits))
+        if self._cache is not None and self._cache[0] is img and self._cache[1] == key:
+            return self._cache[2]
+
+        # Each edit blurs (with its halo) what the edits before it produced
+        out = img.copy()
+        for e in self.edits:
+            rect = rect_clip(rect_scale(e["rect"], scale), out.shape)
+            if rect is None:
+                continue
+            x, y, w, h = rect
+            patch = out[y:y + h, x:x + w]
+            core = self.blur_engine.blur_rect(out, rect, e["blur"], cache=False) if e["blur"] > 0 else patch
+            tone(core, e["contrast"], e["brightness"], dst=patch)
+        self._cache = (img, key, out)
+        return out
+
+    def cache_bytes(self):
+        """Return bytes held by the cached output."""
+        return self._cache[2].nbytes if self._cache is not None else 0
+
+    def clear(self):
+        """Drop the cached output."""
+        self._cache = None
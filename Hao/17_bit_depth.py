@@ -0,0 +1,99 @@
+"""
+High-bit-depth helpers for the opt-in 16-bit / float pipeline.
+
+Images are loaded at their stored depth (IMREAD_ANYDEPTH, which unlike
+IMREAD_UNCHANGED still applies the EXIF orientation) and kept in their
+own type through the whole pipeline (uint16 stays uint16; float32 input, with
+white at 1.0, stays float32). Slider values keep their 8-bit meaning and
+are scaled to the image's white level. Pixels are quantized to 8 bits
+only for the display and when exporting to formats that cannot store
+more. uint16 frames cost twice the memory of 8-bit ones; float32 (four
+times) only appears when the input itself is float.
+"""
+import os
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+# Extensions that can store 16-bit integer and 32-bit float pixels
+HIGH_DEPTH_FORMATS = {".png": ("uint16",), ".tif": ("uint16", "float32"), ".tiff": ("uint16", "float32")}
+
+
+def white_level(dtype):
+    """Return the value of full white for an image type."""
+    if dtype == np.uint8:
+        return 255
+    if dtype == np.uint16:
+        return 65535
+    return 1.0
+
+
+def load_unchanged(path):
+    """Read path at its stored bit depth as a 3-channel BGR image (alpha is dropped, EXIF orientation applied)."""
+    # IMREAD_UNCHANGED would skip the orientation (camera JPEGs open sideways)
+    img = cv2.imread(path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+    if img is None:
+        return None
+
+    # Normalize channel layout to the BGR frames the pipeline expects
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+
+    # Other types are processed as float32
+    if img.dtype not in (np.uint8, np.uint16, np.float32):
+        img = img.astype(np.float32)
+    return img
+
+
+def tone(img, contrast=1.0, brightness=0, dst=None):
+    """Return img * contrast + brightness (8-bit units) in img's own type, saturated for integers."""
+    # 8-bit keeps the convertScaleAbs behaviour of the standard pipeline
+    if img.dtype == np.uint8:
+        return cv2.convertScaleAbs(img, dst=dst, alpha=contrast, beta=brightness)
+
+    # One vectorized pass, no float copy of the frame
+    beta = brightness * white_level(img.dtype) / 255
+    depth = cv2.CV_16U if img.dtype == np.uint16 else cv2.CV_32F
+    return cv2.addWeighted(img, contrast, img, 0, beta, dst=dst, dtype=depth)
+
+
+def to_8bit(img, dst=None):
+    """Return img quantized to uint8 (rounded, saturated); 8-bit input is returned as is."""
+    if img.dtype == np.uint8:
+        return img
+    if img.dtype == np.uint16:
+        return cv2.convertScaleAbs(img, dst=dst, alpha=255 / 65535)
+    return cv2.convertScaleAbs(cv2.max(img, 0.0), dst=dst, alpha=255)
+
+
+def to_depth(img, dtype):
+    """Return an 8-bit image converted to dtype with the same white level."""
+    if dtype == np.uint8:
+        return img
+    if dtype == np.uint16:
+        return img.astype(np.uint16) * 257
+    return img.astype(np.float32) * (1 / 255)
+
+
+def encodable(path, img):
+    """Return img at the highest bit depth the format of path supports."""
+    ext = os.path.splitext(path)[1].lower()
+    allowed = HIGH_DEPTH_FORMATS.get(ext, ())
+    if img.dtype == np.uint8 or img.dtype.name in allowed:
+        return img
+    if "uint16" in allowed:
+        # Float into a 16-bit container
+        return np.clip(img * 65535.0 + 0.5, 0, 65535).astype(np.uint16)
+    # 8-bit only formats (JPEG, BMP, WebP, ...)
+    return to_8bit(img)
+
+
+def export(path, img):
+    """Write img to path at the highest bit depth the format supports; return cv2.imwrite's result."""
+    return cv2.imwrite(path, encodable(path, img))
@@ -0,0 +1,181 @@
+"""
+Memory accounting and leak detection for long editing sessions.
+
+memory_report breaks down the bytes one document holds: the model's
+base image, colour backup and rendered frame, undo and redo history,
+render caches and the view's display buffers. Arrays shared between
+entries (a backup that is the base image, a frame that is the resized
+base) are counted once, under the first entry that holds them.
+
+MemoryProfiler takes tracemalloc snapshots on demand and lists the
+allocation sites that grew since the previous one (numpy and OpenCV
+frames are traced through numpy's allocator).
+
+LeakCheck is the debug assertion mode: it flags when the accounted
+usage grows by more than a tolerance while the number of history
+entries did not grow, i.e. memory that no undo step explains.
+"""
+import tracemalloc
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+np = lazy_import("numpy")
+
+
+def format_bytes(n):
+    """Return n bytes as a short human-readable string."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _owner(arr):
+    """Return the array that owns arr's memory (views share their base)."""
+    while isinstance(arr.base, np.ndarray):
+        arr = arr.base
+    return arr
+
+
+def memory_report(model, view=None):
+    """Return [(name, bytes)] for everything a document holds, with shared arrays counted once."""
+    seen = set()
+
+    def unique(*arrays):
+        # Bytes of arrays not already counted by an earlier entry
+        total = 0
+        for arr in arrays:
+            if arr is None:
+                continue
+            owner = _owner(arr)
+            if id(owner) not in seen:
+                seen.add(id(owner))
+                total += owner.nbytes
+        return total
+
+    # Frames first, so caches that alias them count as zero
+    rows = [
+        ("base image", unique(model.original_img)),
+        ("colour backup", unique(model.color_img)),
+        ("current image", unique(model.current_img)),
+        ("pre-tonal image", unique(model.pretonal_img)),
+        ("undo stack", model.undo_stack.nbytes),
+        ("redo stack", model.redo_stack.nbytes),
+        ("resized base", unique(model._scaled_img)),
+        ("blur cache", model.blur_engine.cache_bytes()),
+        ("edge cache", model.edge_stage.cache_bytes()),
+        ("layer cache", model.layers.cache_bytes()),
+        ("selection frames", model.region.cache_bytes()),
+        ("region edits", model.regions.cache_bytes()),
+        ("speculative results", unique(*[a for e in list(model.prepared.values())
+                                         for a in (e["base"], e.get("pretonal"), e.get("current"))])),
+        ("8-bit display copy", unique(model._display_img)),
+        ("image pyramid", model.pyramid.nbytes() if model.pyramid is not None else 0),
+    ]
+    if view is not None:
+        rows.append(("display buffers", view.display_bytes()))
+    return rows
+
+
+def format_report(rows):
+    """Return memory_report rows as aligned text with a total line."""
+    lines = [f"{name:<20} {format_bytes(n):>10}" for name, n in rows]
+    lines.append(f"{'total':<20} {format_bytes(sum(n for _, n in rows)):>10}")
+    return "\n".join(lines)
+
+
+class MemoryProfiler:
+    """
+    On-demand tracemalloc snapshots.
+
+    Tracing starts with the first snapshot (it slows allocation down, so
+    it is off until asked for); each later snapshot is compared with the
+    previous one.
+    """
+
+    def __init__(self, frames=8):
+        """Initialize profiler recording frames stack levels per allocation."""
+        self.frames = frames
+        self._last = None
+
+    def snapshot(self, limit=15):
+        """Take a snapshot and return text listing the top allocation sites (growth since the last one)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced: {format_bytes(current)} (peak {format_bytes(peak)})"]
+
+        # Growth since the previous snapshot, or the largest sites on the first one
+        if self._last is None:
+            lines.append("Largest allocation sites:")
+            lines += [str(stat) for stat in snap.statistics("lineno")[:limit]]
+        else:
+            lines.append("Growth since the last snapshot:")
+            lines += [str(stat) for stat in snap.compare_to(self._last, "lineno")[:limit]]
+        self._last = snap
+        return "\n".join(lines)
+
+    def stop(self):
+        """Stop tracing and forget the last snapshot."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._last = None
+
+
+# Report rows bounded on their own (history limits, one result per speculated op)
+BOUNDED = ("undo stack", "redo stack", "speculative results")
+
+
+class LeakCheck:
+    """
+    Flags memory growth that no new history entry explains.
+
+    Usage outside the undo and redo stacks and speculative results (which
+    are bounded on their own) is compared with the usage seen at the last
+    change in the number of history entries; caches may grow past it by
+    at most tolerance bytes, by default frames times the size of the
+    current image (the blur cache alone holds up to six frames). With
+    strict set, a flagged check raises AssertionError instead of
+    returning a message.
+    """
+
+    def __init__(self, tolerance=None, frames=8, strict=False):
+        """Initialize check allowing tolerance bytes (or frames images) of cache growth."""
+        self.tolerance = tolerance
+        self.frames = frames
+        self.strict = strict
+
+        # History entry count and usage at the last change, per model
+        self._baseline = {}
+
+    def check(self, model, view=None):
+        """Return a message if usage grew without new history entries (None if fine)."""
+        usage = sum(n for name, n in memory_report(model, view) if name not in BOUNDED)
+        entries = len(model.undo_stack) + len(model.redo_stack)
+        key = id(model)
+
+        # New history (or a first look) moves the baseline
+        last = self._baseline.get(key)
+        if last is None or entries != last[0]:
+            self._baseline[key] = (entries, usage)
+            return None
+
+        growth = usage - last[1]
+        frame = model.current_img.nbytes if model.current_img is not None else 0
+        tolerance = self.tolerance if self.tolerance is not None else self.frames * frame
+        if growth <= tolerance:
+            return None
+        message = (f"Memory grew by {format_bytes(growth)} to {format_bytes(usage)} "
+                   f"with no new history entries ({entries})")
+        if self.strict:
+            raise AssertionError(message)
+        return message
+
+    def forget(self, model):
+        """Drop the baseline of a closed document."""
+        self._baseline.pop(id(model), None)
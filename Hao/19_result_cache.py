@@ -0,0 +1,203 @@
+"""
+Content-addressed result cache with a disk size limit and LRU eviction.
+
+A result is stored under a key derived from what produced it: a hash of
+the source (the encoded file bytes, or the decoded pixels when the same
+picture may arrive in different files) plus the normalized op recipe
+and the output format. Equal inputs with equal edits therefore map to
+the same entry, whichever run or document asks.
+
+Entries are files in the cache directory; their modification time is
+the LRU order (touched on every hit), so the order survives restarts.
+Writes go through a temporary file and os.replace, so readers never see
+a partial entry.
+"""
+import io
+import os
+import json
+import hashlib
+import weakref
+import threading
+import importlib
+from pathlib import Path
+from collections import OrderedDict
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+np = lazy_import("numpy")
+
+
+# Default location shared by the GUI and batch runs
+CACHE_DIR = Path.home() / ".assignment3" / "cache"
+
+# Bump when an operation's output changes so old entries stop matching
+CACHE_VERSION = 1
+
+
+def bytes_key(data):
+    """Return a hex digest of encoded file bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def source_stamp(path):
+    """Return (absolute path, size, modification time) identifying a file's current contents."""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def pixel_key(img):
+    """Return a hex digest of decoded pixels, including shape and type."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.shape}{img.dtype}".encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+def _normalize(value):
+    """Return value with integral floats as ints and dict keys sorted (for stable JSON)."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {k: _normalize(value[k]) for k in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def normalize_recipe(recipe):
+    """Return recipe in one canonical form (single filters written as one-step chains)."""
+    steps = []
+    for step in recipe:
+        step = dict(step)
+        if step.get("op") == "filter" and "steps" not in step:
+            name = step.pop("name")
+            step = {"op": "filter", "steps": [[name, {k: v for k, v in step.items() if k != "op"}]]}
+        steps.append(_normalize(step))
+    return steps
+
+
+def result_key(source_key, recipe, fmt=""):
+    """Return the cache key of recipe applied to a source, encoded as fmt."""
+    text = json.dumps([CACHE_VERSION, source_key, normalize_recipe(recipe), fmt], separators=(",", ":"))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    Disk cache of encoded results and raw arrays, bounded by limit_bytes.
+
+    Safe to share between threads. hits and misses count lookups since
+    construction.
+    """
+
+    def __init__(self, directory=CACHE_DIR, limit_bytes=2 * 1024 ** 3):
+        """Initialize cache in directory, indexing existing entries oldest first."""
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.limit_bytes = limit_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # Entry name -> size, least recently used first
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        self._index = OrderedDict((name, size) for _mtime, name, size in sorted(entries))
+        self.nbytes = sum(self._index.values())
+        self._evict()
+
+        # Pixel keys of recently hashed arrays (hashing a large frame is not free)
+        self._recent_keys = []
+
+    def image_key(self, img):
+        """Return pixel_key(img), reusing it for an array hashed recently."""
+        for ref, key in self._recent_keys:
+            if ref() is img:
+                return key
+        key = pixel_key(img)
+        self._recent_keys = [(weakref.ref(img), key)] + self._recent_keys[:3]
+        return key
+
+    def _path(self, name):
+        """Return the file of an entry."""
+        return self.directory / name
+
+    def _read(self, name, reader):
+        """Return reader(path) for a stored entry (marking it most recently used), or None on a miss."""
+        with self._lock:
+            if name not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(name)
+        path = self._path(name)
+        try:
+            value = reader(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Removed by another process: forget it
+            with self._lock:
+                self.nbytes -= self._index.pop(name, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def get_bytes(self, key, ext=".bin"):
+        """Return the stored bytes for key, or None on a miss."""
+        return self._read(key + ext, Path.read_bytes)
+
+    def put_bytes(self, key, data, ext=".bin"):
+        """Store data under key and evict least recently used entries beyond the limit."""
+        # Larger than the whole cache: not worth storing
+        if len(data) > self.limit_bytes:
+            return
+        name = key + ext
+        tmp = self._path(f"{name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, self._path(name))
+        with self._lock:
+            self.nbytes += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+            self._evict()
+
+    def get_array(self, key):
+        """Return the stored array for key, or None on a miss."""
+        return self._read(key + ".npy", lambda path: np.load(path, allow_pickle=False))
+
+    def put_array(self, key, arr):
+        """Store arr under key."""
+        buf = io.BytesIO()
+        np.save(buf, arr, allow_pickle=False)
+        self.put_bytes(key, buf.getvalue(), ".npy")
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits its limit (lock held)."""
+        while self.nbytes > self.limit_bytes and self._index:
+            name, size = self._index.popitem(last=False)
+            self.nbytes -= size
+            try:
+                self._path(name).unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            for name in self._index:
+                try:
+                    self._path(name).unlink()
+                except OSError:
+                    pass
+            self._index.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        """Return the number of entries."""
+        return len(self._index)
+
@@ -4,7 +4,49 @@ ImageModel class for managing image processing operations.
 Handles image state, transformations (brightness, contrast, blur, resize),
 and undo/redo functionality using snapshot-based history.
 """
-import cv2
+import sys
+import time
+import weakref
+import importlib
+from pathlib import Path
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# Import helper modules dynamically
+blur_engine_module = importlib.import_module("4_blur_engine")
+image_pyramid_module = importlib.import_module("5_image_pyramid")
+image_stats_module = importlib.import_module("7_image_stats")
+history_module = importlib.import_module("9_history")
+op_registry_module = importlib.import_module("12_op_registry")
+edge_stage_module = importlib.import_module("14_edge_stage")
+layer_stack_module = importlib.import_module("15_layer_stack")
+region_module = importlib.import_module("16_region")
+bit_depth_module = importlib.import_module("17_bit_depth")
+result_cache_module = importlib.import_module("19_result_cache")
+
+BlurEngine = blur_engine_module.BlurEngine
+ImagePyramid = image_pyramid_module.ImagePyramid
+ImageStats = image_stats_module.ImageStats
+History = history_module.History
+CompressedFrame = history_module.CompressedFrame
+ChainExecutor = op_registry_module.ChainExecutor
+get_op = op_registry_module.get_op
+EdgeStage = edge_stage_module.EdgeStage
+LayerStack = layer_stack_module.LayerStack
+RegionRenderer = region_module.RegionRenderer
+RegionEdits = region_module.RegionEdits
+rect_scale = region_module.rect_scale
+load_unchanged = bit_depth_module.load_unchanged
+tone = bit_depth_module.tone
+to_8bit = bit_depth_module.to_8bit
+result_key = result_cache_module.result_key
+source_stamp = result_cache_module.source_stamp
 
 
 class ImageModel:
@@ -21,6 +63,7 @@ class ImageModel:
         self.original_img = None
         self.color_img = None
         self.current_img = None
+        self.pretonal_img = None
         self.img_path = ""
         
         # Adjustment parameters
@@ -29,25 +72,159 @@ class ImageModel:
         self.scale = 1.0
         self.blur = 0
         
-        # Undo/Redo history
-        self.undo_stack = []
-        self.redo_stack = []
+        # Non-destructive edge stage and its Canny thresholds
+        self.edge_on = False
+        self.edge_low = 100
+        self.edge_high = 200
+        
+        # Undo/Redo history (ring buffers bounded by bytes)
+        self.undo_stack = History()
+        self.redo_stack = History()
+        self.record_history = True
+        
+        # Snapshot compression: codec "png" or "zlib", level 0 stores raw copies
+        self.undo_codec = "png"
+        self.undo_level = 1
+        self._recent_frames = []
+        
+        # Optional crash-recovery journal (attached by the application)
+        self.journal = None
         
         # State flags
         self.is_modified = False
         self.is_grayscale = False
 
+        # Render caches (mip levels, resized base and blur results per kernel)
+        self.pyramid = None
+        self.blur_engine = BlurEngine()
+        self._scaled_img = None
+        self._scaled_src = None
+        self._scaled_scale = None
+
+        # Histogram cache (follows tonal changes without rescanning)
+        self.stats = ImageStats()
+
+        # Edge gradients of the base (only hysteresis reruns on threshold changes)
+        self.edge_stage = EdgeStage()
+
+        # Filter chain executor (registered ops, fused pointwise passes)
+        self.filters = ChainExecutor()
+
+        # Non-destructive filter layers on the resized base (cached per layer)
+        self.layers = LayerStack(self.filters)
+
+        # Optional TileRunner for intra-image parallel rendering
+        self.tiles = None
+
+        # Selection limiting the slider adjustments, in base image pixels
+        # (x, y, w, h), and the renderer tracking dirty rectangles
+        self.roi = None
+        self.region = RegionRenderer(self.blur_engine)
+
+        # Adjustments of earlier selections, kept as masked layers
+        self.regions = RegionEdits(self.blur_engine)
+
+        # Opt-in high-bit-depth mode: open files at their stored depth
+        # (uint16 / float32) and quantize to 8 bits only for the display
+        self.high_depth = False
+        self._display_src = None
+        self._display_img = None
+
+        # Optional ResultCache (see 19_result_cache): filter chains on the
+        # full-size base reuse results stored by earlier runs
+        self.result_cache = None
+
+        # Seconds per pixel of each chain run directly and of the last
+        # cache round trip (hash plus read or write): cheaper chains skip it
+        self._filter_seconds = {}
+        self._cache_seconds = None
+
+        # Optional RenderProcess (see 23_render_process): apply_all only
+        # marks the frame stale and render() fills current_img there, with
+        # the histogram the render process computed
+        self.renderer = None
+        self.frame_stale = False
+        self.rendered_histogram = None
+
+        # Speculative results (see 24_speculation): per destructive op, the
+        # base image it makes of the base (and grayscale state) it was
+        # derived from and, once rendered, its frame with the settings key
+        # it matches; entries are replaced, never changed in place
+        self.prepared = {}
+        self._adopt = None
+
+        # Rotations and flips since a file was opened, for lossless saves
+        # (see 25_metadata_save): (source stamp, whether the loader applied
+        # its EXIF orientation, op names), or None once pixels changed
+        self.geometry = None
+
+    def set_tiles(self, tiles):
+        """Render large images in parallel bands with a TileRunner (None turns it off)."""
+        self.tiles = tiles
+        self.blur_engine.tiles = tiles
+        self.edge_stage.tiles = tiles
+        self.filters.tiles = tiles
+        if self.pyramid is not None:
+            self.pyramid.tiles = tiles
+
+    def pack_frame(self, img):
+        """Return img as a history frame (compressed in the background unless disabled)."""
+        if img is None:
+            return None
+        if self.undo_level <= 0:
+            return img.copy()
+        
+        # Reuse the frame of an image packed recently (slider undo points
+        # and the colour backup rarely change between snapshots)
+        for src, frame in self._recent_frames:
+            if src() is img:
+                return frame
+        
+        # Images are replaced, never modified in place, so no copy is needed
+        frame = CompressedFrame(img, self.undo_codec, self.undo_level)
+        self._recent_frames = [(weakref.ref(img), frame)] + self._recent_frames[:1]
+        return frame
+
+    @staticmethod
+    def unpack_frame(frame):
+        """Return the ndarray stored in a history frame."""
+        if isinstance(frame, CompressedFrame):
+            return frame.decode()
+        return frame
+
+    def restore_frame(self, frame, current):
+        """Return the image of a history frame, reusing current if the frame was packed from it."""
+        if frame is None or isinstance(frame, np.ndarray):
+            return self.unpack_frame(frame)
+        
+        # Parameter-only steps share the frame of the image still on screen
+        for src, f in self._recent_frames:
+            if f is frame and src() is current:
+                return current
+        
+        # Decode and remember the pairing so the next snapshot reuses the frame
+        img = frame.decode()
+        self._recent_frames = [(weakref.ref(img), frame)] + self._recent_frames[:1]
+        return img
+
     def snapshot(self):
         """Create a snapshot of current state for undo/redo."""
-        # Copy image and parameters
+        # Pack image and copy parameters
         return {
-            "base": self.original_img.copy() if self.original_img is not None else None,
-            "color": self.color_img.copy() if self.color_img is not None else None,
+            "base": self.pack_frame(self.original_img),
+            "color": self.pack_frame(self.color_img),
             "brightness": self.brightness,
             "contrast": self.contrast,
             "scale": self.scale,
             "blur": self.blur,
-            "is_grayscale": self.is_grayscale
+            "edge_on": self.edge_on,
+            "edge_low": self.edge_low,
+            "edge_high": self.edge_high,
+            "layers": self.layers.state(),
+            "roi": self.roi,
+            "regions": self.regions.state(),
+            "is_grayscale": self.is_grayscale,
+            "geometry": self.geometry
         }
 
     def restore(self, s):
@@ -56,24 +233,36 @@ class ImageModel:
         if s["base"] is None: 
             return
         
-        # Restore all parameters
-        self.original_img = s["base"]
-        self.color_img = s.get("color")
+        # Restore images (decompressed only when they changed) and all parameters
+        self.original_img = self.restore_frame(s["base"], self.original_img)
+        self.color_img = self.restore_frame(s.get("color"), self.color_img)
         self.brightness = s["brightness"]
         self.contrast = s["contrast"]
         self.scale = s["scale"]
         self.blur = s["blur"]
+        self.edge_on = s.get("edge_on", False)
+        self.edge_low = s.get("edge_low", 100)
+        self.edge_high = s.get("edge_high", 200)
+        self.layers.load(s.get("layers"))
+        self.regions.load(s.get("regions"))
+        self.set_roi(s.get("roi"))
         self.is_grayscale = s.get("is_grayscale", False)
+        self.geometry = s.get("geometry")
         
         # Reapply transformations
         self.apply_all()
 
-    def push_undo(self):
-        """Push current state to undo stack."""
-        # Save state only if image exists
+    def push_undo(self, op=None, **params):
+        """Push current state to undo stack and journal the operation that follows."""
+        # Save state only if image exists (headless pipelines skip history)
         if self.original_img is not None:
-            self.undo_stack.append(self.snapshot())
-            self.redo_stack.clear()
+            if self.record_history:
+                self.undo_stack.push(self.snapshot())
+                self.redo_stack.clear()
+            
+            # Record op name and parameters (no pixels)
+            if self.journal is not None and op is not None:
+                self.journal.record(op, params)
 
     def undo(self):
         """Undo last action."""
@@ -82,10 +271,14 @@ class ImageModel:
             return False
         
         # Save current state to redo stack
-        self.redo_stack.append(self.snapshot())
+        self.redo_stack.push(self.snapshot())
         
         # Restore previous state
         self.restore(self.undo_stack.pop())
+        
+        # Journal the step
+        if self.journal is not None:
+            self.journal.record("undo")
         return True
 
     def redo(self):
@@ -95,36 +288,110 @@ class ImageModel:
             return False
         
         # Save current state to undo stack
-        self.undo_stack.append(self.snapshot())
+        self.undo_stack.push(self.snapshot())
         
         # Restore next state
         self.restore(self.redo_stack.pop())
+        
+        # Journal the step
+        if self.journal is not None:
+            self.journal.record("redo")
         return True
 
+    def history_bytes(self):
+        """Return bytes held by undo and redo snapshots."""
+        return self.undo_stack.nbytes + self.redo_stack.nbytes
+
+    def cache_bytes(self):
+        """Return bytes held by render caches and pyramid levels."""
+        total = self.blur_engine.cache_bytes() + self.edge_stage.cache_bytes() + self.layers.cache_bytes()
+        total += self.region.cache_bytes() + self.regions.cache_bytes()
+        if self._display_img is not None:
+            total += self._display_img.nbytes
+        if self._scaled_img is not None and self._scaled_img is not self.original_img:
+            total += self._scaled_img.nbytes
+        if self.pyramid is not None:
+            total += self.pyramid.nbytes()
+        return total + self.prepared_bytes()
+
+    def prepared_bytes(self):
+        """Return bytes held by speculative results (arrays shared between them counted once)."""
+        arrays = {id(a): a for entry in list(self.prepared.values())
+                  for a in (entry["base"], entry.get("pretonal"), entry.get("current")) if a is not None}
+        return sum(a.nbytes for a in arrays.values())
+
+    def memory_usage(self):
+        """Return total bytes held by images, caches and history."""
+        total = self.history_bytes() + self.cache_bytes()
+        seen = set()
+        for img in (self.original_img, self.color_img, self.current_img):
+            # The colour backup usually is the base image; count it once
+            if img is not None and id(img) not in seen:
+                seen.add(id(img))
+                total += img.nbytes
+        return total
+
+    def drop_caches(self):
+        """Release render caches and pyramid levels (rebuilt on demand)."""
+        self.blur_engine.clear()
+        self.edge_stage.clear()
+        self.layers.clear()
+        self.region.clear()
+        self.regions.clear()
+        self.stats.clear()
+        self.pyramid = None
+        self._scaled_img = None
+        self._scaled_src = None
+        self._scaled_scale = None
+        self.prepared = {}
+        self._adopt = None
+
+    def drop_oldest_undo(self):
+        """Discard the oldest undo snapshot; return False if none is left."""
+        return self.undo_stack.evict_oldest()
+
     def open_image(self, path):
         """Load image from file path."""
-        # Read image using OpenCV
-        img = cv2.imread(path)
+        # Identify the file contents before reading them
+        stamp = source_stamp(path)
+        
+        # Read image using OpenCV (at its stored bit depth in high-depth mode;
+        # both loaders apply the EXIF orientation)
+        img = load_unchanged(path) if self.high_depth else cv2.imread(path)
         
         # Raise error if image cannot be read
         if img is None:
             raise ValueError("Cannot read image file")
         
+        # Load decoded pixels, unedited so far
+        self.load_array(img, path)
+        self.geometry = (stamp, True, ())
+
+    def load_array(self, img, path=""):
+        """Load an already decoded BGR image, resetting parameters and history."""
         # Store image path
         self.img_path = path
         
         # Set original image
         self.original_img = img
         
-        # Store color version for toggle
-        self.color_img = img.copy()
+        # Store color version for toggle (frames are replaced, never modified
+        # in place, so the backup shares the loaded array)
+        self.color_img = img
         
         # Reset all parameters to defaults
         self.brightness = 0
         self.contrast = 1.0
         self.scale = 1.0
         self.blur = 0
+        self.edge_on = False
+        self.edge_low = 100
+        self.edge_high = 200
         self.is_grayscale = False
+        self.layers.load([])
+        self.regions.load([])
+        self.set_roi(None)
+        self.geometry = None
         
         # Clear undo/redo history
         self.undo_stack.clear()
@@ -142,22 +409,47 @@ class ImageModel:
         if self.original_img is None: 
             return
         
-        # Copy original image
-        img = self.original_img.copy()
+        # Rendered in the render process by the next render()
+        if self.renderer is not None:
+            self.frame_stale = True
+            self.is_modified = True
+            return
+        
+        # Frame rendered speculatively for this base and these settings
+        adopt, self._adopt = self._adopt, None
+        if adopt is not None and adopt["base"] is self.original_img and adopt["key"] == self.render_key():
+            self.pretonal_img = adopt["pretonal"]
+            self.current_img = adopt["current"]
+            self.is_modified = True
+            return
+        
+        # Resize, adjustment layers and edge stage (each cached)
+        img = self.blur_source()
 
-        # Apply resize transformation
-        if self.scale != 1.0:
-            img = cv2.resize(img, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_LINEAR)
+        # Ensure blur kernel size is odd
+        k = self.blur_kernel()
+
+        # Selection: blur and tone only the selected rectangle (plus the blur
+        # halo), written into a reused full-size frame
+        if self.roi is not None:
+            img, core = self.region.render(img, rect_scale(self.roi, self.scale), k, self.contrast, self.brightness)
+            self.pretonal_img = core if core is not None else img
+            self.current_img = img
+            self.is_modified = True
+            return
 
         # Apply blur transformation
-        if self.blur > 0:
-            k = int(self.blur)
-            # Ensure kernel size is odd
-            k = k if k % 2 == 1 else k + 1
-            img = cv2.GaussianBlur(img, (k, k), 0)
+        if k > 0:
+            img = self.blur_engine.blur(img, k)
 
-        # Apply brightness and contrast
-        img = cv2.convertScaleAbs(img, alpha=self.contrast, beta=self.brightness)
+        # Keep pre-tonal image for histogram remapping
+        self.pretonal_img = img
+
+        # Apply brightness and contrast (in the image's own bit depth)
+        if self.tiles is not None:
+            img = self.tiles.tone(img, self.contrast, self.brightness)
+        else:
+            img = tone(img, self.contrast, self.brightness)
         
         # Store result
         self.current_img = img
@@ -165,34 +457,288 @@ class ImageModel:
         # Mark as modified
         self.is_modified = True
 
+    def blur_source(self):
+        """Return the image apply_all blurs: the edge stage on the base, resized, through the layers."""
+        img = self.original_img
+
+        # Edge stage on the full-resolution base, like the destructive Canny it
+        # replaces (gradients cached, thresholds cheap)
+        if self.edge_on:
+            img = self.edge_stage.apply(img, self.edge_low, self.edge_high)
+
+        # Apply resize transformation (cached per source image and scale)
+        img = self.scaled_image(img)
+
+        # Adjustment layers (only layers from the first changed one are recomputed)
+        if self.layers:
+            img = self.layers.render(img)
+
+        # Adjustments kept from earlier selections (cached)
+        return self.regions.render(img, self.scale)
+
+    def blur_kernel(self):
+        """Return the odd blur kernel size of the blur setting (0 for none)."""
+        k = int(self.blur)
+        return k if k % 2 == 1 or k == 0 else k + 1
+
+    def render_key(self):
+        """Return the settings apply_all renders with, for matching speculative frames."""
+        return (self.brightness, self.contrast, self.scale, self.blur, self.edge_on,
+                self.edge_low, self.edge_high, self.layers.state(), self.roi, self.regions.state())
+
+    def op_base(self, op, source=None, is_grayscale=None):
+        """Return the base image a speculated op ("grayscale" toggle or "rotate90") makes of source (default: the current base)."""
+        source = self.original_img if source is None else source
+        is_grayscale = self.is_grayscale if is_grayscale is None else is_grayscale
+        if op == "grayscale":
+            if is_grayscale:
+                return self.color_img
+            g = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+            return cv2.cvtColor(g, cv2.COLOR_GRAY2BGR)
+        if op == "rotate90":
+            return cv2.rotate(source, cv2.ROTATE_90_CLOCKWISE)
+        raise ValueError(f"Unknown speculated op: {op}")
+
+    def take_prepared(self, op):
+        """Return op_base(op), from a speculative result if one was derived from the current base."""
+        entry = self.prepared.pop(op, None)
+        if (entry is None or entry["source"] is not self.original_img
+                or entry["is_grayscale"] != self.is_grayscale):
+            return self.op_base(op)
+        
+        # Its frame is used by the next apply_all if the settings still match
+        self._adopt = entry if "current" in entry else None
+        return entry["base"]
+
+    def render_detached(self, base):
+        """Return {"key", "pretonal", "current"} for base under the current settings, leaving this model's caches alone."""
+        # Throwaway model with the same settings and engines
+        shadow = ImageModel()
+        shadow.set_tiles(self.tiles)
+        shadow.blur_engine.box_from = self.blur_engine.box_from
+        shadow.blur_engine.pyr_from = self.blur_engine.pyr_from
+        shadow.original_img = base
+        for name in ("brightness", "contrast", "scale", "blur", "edge_on", "edge_low", "edge_high"):
+            setattr(shadow, name, getattr(self, name))
+        shadow.layers.load(self.layers.state())
+        shadow.regions.load(self.regions.state())
+        shadow.roi = self.roi
+        
+        # Key from the copied settings, so it matches what was rendered
+        key = shadow.render_key()
+        shadow.apply_all()
+        return {"key": key, "pretonal": shadow.pretonal_img, "current": shadow.current_img}
+
+    def render(self):
+        """Bring current_img up to date, in the render process when one is attached."""
+        if self.renderer is not None:
+            self.renderer.render(self)
+        else:
+            self.apply_all()
+
+    def set_roi(self, rect):
+        """Limit slider adjustments to rect (x, y, w, h in base image pixels); None edits the whole image."""
+        if rect is not None:
+            rect = tuple(int(v) for v in rect)
+            if rect[2] <= 0 or rect[3] <= 0:
+                rect = None
+        self.roi = rect
+        
+        # Leaving selection mode: the next frame is a fresh full render
+        if rect is None:
+            self.region.clear()
+
+    def keep_adjustment(self):
+        """Keep the slider blur and brightness/contrast on the selection (the whole image without one) as a region edit and reset those sliders."""
+        k = self.blur_kernel()
+        if self.original_img is None or (k, self.contrast, self.brightness) == (0, 1.0, 0):
+            return False
+        h, w = self.original_img.shape[:2]
+        self.regions.add(self.roi or (0, 0, w, h), k, self.contrast, self.brightness)
+        self.blur, self.contrast, self.brightness = 0, 1.0, 0
+        return True
+
+    def select(self, rect):
+        """Limit slider adjustments to rect (None: the whole image) as one undo step; the adjustment made so far stays where it was made."""
+        if rect is not None:
+            rect = tuple(int(v) for v in rect)
+            if rect[2] <= 0 or rect[3] <= 0:
+                rect = None
+        if rect == self.roi:
+            return False
+        
+        # Save state to undo stack
+        self.push_undo("select", rect=list(rect) if rect is not None else None)
+        
+        # Earlier adjustment becomes a masked layer; the sliders start afresh
+        self.keep_adjustment()
+        self.set_roi(rect)
+        
+        # Reapply transformations
+        self.apply_all()
+        return True
+
+    def follow_geometry(self, op):
+        """Keep the selection's adjustment and move the region edits with a rotation or flip op of the base image."""
+        if self.roi is not None:
+            self.keep_adjustment()
+        
+        # The selection itself does not follow the geometry change
+        self.set_roi(None)
+        self.regions.transform(op, self.original_img.shape)
+
+    def take_frame(self):
+        """Return (frame, dirty, previous) for the view: current_img, the rectangle in which it differs from previous (None: all of it) and the frame taken before."""
+        # Frames from full renders and the render process are new arrays every time
+        if self.roi is None or self.renderer is not None:
+            return self.current_img, None, None
+        frame, dirty, previous = self.region.take()
+        if frame is None:
+            return self.current_img, None, None
+        return frame, dirty, previous
+
+    def display_image(self, img, dirty=None, previous=None):
+        """Return (8-bit image, dirty, previous) for the view; only the dirty rectangle is re-quantized after a selection edit."""
+        if img is None or img.dtype == np.uint8:
+            return img, dirty, previous
+
+        # Selection edit of the frame quantized last: refresh the patch
+        if dirty is not None and previous is self._display_src and self._display_img.shape == img.shape:
+            x, y, w, h = dirty
+            to_8bit(img[y:y + h, x:x + w], dst=self._display_img[y:y + h, x:x + w])
+            self._display_src = img
+            return self._display_img, dirty, self._display_img
+
+        # New frame: quantize it whole, reusing the display buffer
+        if self._display_img is None or self._display_img.shape != img.shape:
+            self._display_img = np.empty(img.shape, np.uint8)
+        to_8bit(img, dst=self._display_img)
+        self._display_src = img
+        return self._display_img, None, None
+
+    def frame_shape(self, shape):
+        """Return the output shape process_frame produces for an input frame shape."""
+        h, w = shape[:2]
+        if self.scale == 1.0:
+            return (h, w, 3)
+        return (max(1, int(round(h * self.scale))), max(1, int(round(w * self.scale))), 3)
+
+    def process_frame(self, frame, buffers, out=None, grayscale=False, edge=False):
+        """Run the apply_all stages on one video frame, reusing work arrays in buffers and writing into out.
+
+        grayscale and edge act like the Grayscale button and the edge stage
+        on the base image, so a frame comes out as apply_all renders it.
+        Layers and selections belong to the edited image and are not
+        applied; nothing is cached between frames.
+        """
+        # Allocate a work array once per name, shape and type
+        def buf(name, shape, dtype=frame.dtype):
+            arr = buffers.get(name)
+            if arr is None or arr.shape != shape or arr.dtype != dtype:
+                arr = buffers[name] = np.empty(shape, dtype)
+            return arr
+        
+        img = frame
+        h, w = frame.shape[:2]
+        
+        # Grayscale first, as it replaces the base image in the editor
+        gray = None
+        if grayscale:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=buf("gray", (h, w)))
+            img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=buf("effect", (h, w, 3)))
+        
+        # Edge stage at full resolution (EdgeStage matches cv2.Canny exactly;
+        # its gradient cache only pays off on one image, so frames use Canny).
+        # Canny keeps the strongest channel, so the gray plane gives the same
+        # edges as its three equal copies
+        if edge:
+            edges = cv2.Canny(img if gray is None else gray, self.edge_low, self.edge_high, edges=buf("edges", (h, w)))
+            img = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR, dst=buf("edge_map", (h, w, 3)))
+        
+        # Resize like the base image (from a pyramid) or the edge map (directly)
+        if self.scale != 1.0:
+            img = self.resample(img, None if edge else ImagePyramid(img, tiles=self.tiles))
+        
+        # Blur with the engine's strategy for the kernel, outside its cache
+        k = self.blur_kernel()
+        if k > 0:
+            img = self.blur_engine.blur(img, k, cache=False)
+        
+        # Brightness and contrast into the output buffer
+        if out is None or out.shape != img.shape:
+            out = buf("out", img.shape, np.uint8)
+        return tone(img, self.contrast, self.brightness, dst=out)
+
+    def histogram(self):
+        """Return (histogram, per-channel stats) of the current image, or None if nothing is loaded."""
+        # Computed with the frame in the render process
+        if self.renderer is not None:
+            return self.rendered_histogram
+
+        # Skip if nothing rendered yet
+        if self.pretonal_img is None:
+            return None
+
+        # Remap the cached pre-tonal histogram through brightness/contrast
+        hist = self.stats.histogram(self.pretonal_img, self.contrast, self.brightness)
+        return hist, self.stats.statistics(hist)
+
+    def get_pyramid(self):
+        """Return the mip pyramid of the base image, rebuilding it after loads or destructive ops."""
+        # Levels are only built when a zoom or thumbnail asks for them
+        if self.pyramid is None or self.pyramid.base is not self.original_img:
+            self.pyramid = ImagePyramid(self.original_img, tiles=self.tiles)
+        return self.pyramid
+
+    def scaled_image(self, src=None):
+        """Return src (the base image by default) resized by scale, reusing it while src and scale are unchanged."""
+        if src is None:
+            src = self.original_img
+
+        # No resize needed at 1.0 (later stages never write in place)
+        if self.scale == 1.0:
+            return src
+
+        # Rebuild only when the source image or scale changed
+        if self._scaled_src is not src or self._scaled_scale != self.scale:
+            self._scaled_img = self.resample(src, self.get_pyramid() if src is self.original_img else None)
+            self._scaled_src = src
+            self._scaled_scale = self.scale
+        return self._scaled_img
+
+    def resample(self, src, pyramid=None):
+        """Return src resized by scale, from pyramid (built over src) if given, else with one linear resize."""
+        if pyramid is not None:
+            return pyramid.resample(self.scale)
+
+        # Derived images (the edge map) resize directly to the pyramid's size
+        h, w = src.shape[:2]
+        size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        if self.tiles is not None:
+            return self.tiles.resize(src, size, cv2.INTER_LINEAR)
+        return cv2.resize(src, size, interpolation=cv2.INTER_LINEAR)
+
     def grayscale(self):
         """Convert image to grayscale (apply only once)."""
         # Save state to undo stack
-        self.push_undo()
+        self.push_undo("grayscale")
         
-        if self.is_grayscale:
-            # Toggle back to color
-            self.original_img = self.color_img.copy()
-            self.is_grayscale = False
-        else:
-            # Convert to grayscale then back to BGR (3 channels)
-            g = cv2.cvtColor(self.original_img, cv2.COLOR_BGR2GRAY)
-            self.original_img = cv2.cvtColor(g, cv2.COLOR_GRAY2BGR)
-            self.is_grayscale = True
+        # Toggle back to color, or convert to grayscale and back to BGR
+        # (3 channels); taken from the speculative result when ready
+        self.original_img = self.take_prepared("grayscale")
+        self.is_grayscale = not self.is_grayscale
+        self.geometry = None
         
         # Reapply transformations
         self.apply_all()
 
     def edge(self):
-        """Apply edge detection using Canny algorithm."""
-        # Save state to undo stack
-        self.push_undo()
-        
-        # Apply Canny edge detection
-        e = cv2.Canny(self.original_img, 100, 200)
+        """Toggle the non-destructive Canny edge stage."""
+        # Save state to undo stack (the base image is unchanged, so its frame is shared)
+        self.push_undo("edge")
         
-        # Convert edges to BGR format
-        self.original_img = cv2.cvtColor(e, cv2.COLOR_GRAY2BGR)
+        # Switch the stage; thresholds come from edge_low and edge_high
+        self.edge_on = not self.edge_on
         
         # Reapply transformations
         self.apply_all()
@@ -200,15 +746,20 @@ class ImageModel:
     def rotate(self, angle):
         """Rotate image by specified angle (90, 180, or 270 degrees)."""
         # Save state to undo stack
-        self.push_undo()
+        self.push_undo("rotate", angle=angle)
+        
+        # Region edits turn with the image
+        if angle in (90, 180, 270):
+            self.follow_geometry(f"rotate{angle}")
         
         # Apply rotation based on angle
         if angle == 90: 
-            self.original_img = cv2.rotate(self.original_img, cv2.ROTATE_90_CLOCKWISE)
+            self.original_img = self.take_prepared("rotate90")
         elif angle == 180: 
             self.original_img = cv2.rotate(self.original_img, cv2.ROTATE_180)
         elif angle == 270: 
             self.original_img = cv2.rotate(self.original_img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        self.record_geometry(f"rotate{angle}")
         
         # Reapply transformations
         self.apply_all()
@@ -216,10 +767,14 @@ class ImageModel:
     def flip_h(self):
         """Flip image horizontally."""
         # Save state to undo stack
-        self.push_undo()
+        self.push_undo("flip_h")
+        
+        # Region edits flip with the image
+        self.follow_geometry("flip_h")
         
         # Flip horizontally (1 = horizontal axis)
         self.original_img = cv2.flip(self.original_img, 1)
+        self.record_geometry("flip_h")
         
         # Reapply transformations
         self.apply_all()
@@ -227,10 +782,177 @@ class ImageModel:
     def flip_v(self):
         """Flip image vertically."""
         # Save state to undo stack
-        self.push_undo()
+        self.push_undo("flip_v")
+        
+        # Region edits flip with the image
+        self.follow_geometry("flip_v")
         
         # Flip vertically (0 = vertical axis)
         self.original_img = cv2.flip(self.original_img, 0)
+        self.record_geometry("flip_v")
         
         # Reapply transformations
         self.apply_all()
+
+    def record_geometry(self, op):
+        """Add a rotation or flip to the geometry edits of the opened file."""
+        if self.geometry is not None:
+            stamp, applied, ops = self.geometry
+            self.geometry = (stamp, applied, ops + (op,))
+
+    def apply_filter(self, name, **params):
+        """Apply a registered filter (see 12_op_registry) as one undo step."""
+        self.apply_filters([(name, params)])
+
+    def apply_filters(self, steps):
+        """Apply a chain of (name, params) filters as one undo step, fusing pointwise ops."""
+        # Validate the chain before recording anything
+        self.filters.plan(steps)
+        
+        # Save state to undo stack
+        self.push_undo("filter", steps=[[name, dict(params or {})] for name, params in steps])
+        
+        # Run the chain (or reuse a stored result); the output stays 3-channel BGR
+        self.original_img = self.run_filters(self.original_img, steps)
+        self.geometry = None
+        
+        # Reapply transformations
+        self.apply_all()
+
+    def run_filters(self, img, steps):
+        """Return img with the filter chain applied, through the result cache when the chain costs more than a cache round trip."""
+        chain = [[n, dict(p or {})] for n, p in steps]
+        name = repr(chain)
+        pixels = img.shape[0] * img.shape[1]
+        
+        # Pointwise chains are one fused pass, no dearer than hashing the
+        # frame; others skip the cache once timed cheaper than a round trip
+        cost = self._filter_seconds.get(name)
+        if (self.result_cache is None or all(get_op(n).kind == "pointwise" for n, _p in steps)
+                or (cost is not None and self._cache_seconds is not None and cost <= self._cache_seconds)):
+            start = time.perf_counter()
+            out = self.filters.run(img, steps, channels=3)
+            self._filter_seconds[name] = (time.perf_counter() - start) / pixels
+            return out
+        
+        # Key: pixels of the input plus the normalized chain
+        start = time.perf_counter()
+        key = result_key(self.result_cache.image_key(img), [{"op": "filter", "steps": chain}])
+        out = self.result_cache.get_array(key)
+        if out is not None:
+            self._cache_seconds = (time.perf_counter() - start) / pixels
+            return out
+        
+        # Miss: time the chain apart from hashing and writing
+        run_start = time.perf_counter()
+        out = self.filters.run(img, steps, channels=3)
+        ran = time.perf_counter() - run_start
+        self._filter_seconds[name] = ran / pixels
+        self.result_cache.put_array(key, out)
+        self._cache_seconds = (time.perf_counter() - start - ran) / pixels
+        return out
+
+    def edit_layer(self, action, index=None, name=None, params=None, new_index=None):
+        """Change the layer stack as one undo step: add, remove, move, toggle or params."""
+        # Validate before recording anything
+        if action not in ("add", "remove", "move", "toggle", "params"):
+            raise ValueError(f"Unknown layer action: {action}")
+        if action != "add" and not (isinstance(index, int) and 0 <= index < len(self.layers)):
+            raise ValueError(f"No layer at index {index}")
+        if action == "add":
+            get_op(name)
+            if index is not None and not (isinstance(index, int) and 0 <= index <= len(self.layers)):
+                raise ValueError(f"Cannot insert a layer at index {index}")
+        if action == "move" and not (isinstance(new_index, int) and 0 <= new_index < len(self.layers)):
+            raise ValueError(f"Cannot move a layer to index {new_index}")
+        if params is not None and not isinstance(params, dict):
+            raise ValueError("Layer params must be a dict")
+        
+        # Save state to undo stack (layer parameters only; the base frame is shared)
+        self.push_undo("layer", **{k: v for k, v in (
+            ("action", action), ("index", index), ("name", name), ("params", params), ("new_index", new_index)
+        ) if v is not None})
+        
+        # Apply the change
+        if action == "add":
+            self.layers.add(name, params, index)
+        elif action == "remove":
+            self.layers.remove(index)
+        elif action == "move":
+            self.layers.move(index, new_index)
+        elif action == "toggle":
+            self.layers.toggle(index)
+        else:
+            self.layers.set_params(index, **(params or {}))
+        
+        # Reapply transformations
+        self.apply_all()
+
+    def apply_op(self, op, params=None):
+        """Apply a named operation with parameters, as recorded in a journal."""
+        params = params or {}
+        
+        if op == "adjust":
+            # Slider values, then the undo point the GUI sets on release
+            self.brightness = params.get("brightness", self.brightness)
+            self.contrast = params.get("contrast", self.contrast)
+            self.blur = params.get("blur", self.blur)
+            self.scale = params.get("scale", self.scale)
+            self.edge_low = params.get("edge_low", self.edge_low)
+            self.edge_high = params.get("edge_high", self.edge_high)
+            if "roi" in params:
+                self.set_roi(params["roi"])
+            self.apply_all()
+            self.push_undo("adjust", **params)
+        elif op == "select":
+            self.select(params.get("rect"))
+        elif op == "grayscale":
+            self.grayscale()
+        elif op == "edge":
+            self.edge()
+        elif op == "filter":
+            # Either a chain of [name, params] pairs or a single named filter
+            if "steps" in params:
+                self.apply_filters([(name, p) for name, p in params["steps"]])
+            else:
+                self.apply_filter(params["name"], **{k: v for k, v in params.items() if k != "name"})
+        elif op == "layer":
+            self.edit_layer(**params)
+        elif op == "rotate":
+            self.rotate(params["angle"])
+        elif op == "flip_h":
+            self.flip_h()
+        elif op == "flip_v":
+            self.flip_v()
+        elif op == "undo":
+            self.undo()
+        elif op == "redo":
+            self.redo()
+        else:
+            raise ValueError(f"Unknown operation: {op}")
+
+    def apply_recipe(self, recipe):
+        """Apply a list of {"op": name, **params} steps in order."""
+        for step in recipe:
+            params = {k: v for k, v in step.items() if k != "op"}
+            self.apply_op(step["op"], params)
+
+    def replay(self, records):
+        """Rebuild image, parameters and history from journal records."""
+        # Records must start from the source image
+        if not records or records[0]["op"] != "open":
+            raise ValueError("Journal does not start with an open record")
+        
+        # Replay without journaling the replayed steps again, loading the
+        # source in the mode it was edited in (older journals: 8-bit)
+        journal, self.journal = self.journal, None
+        try:
+            self.high_depth = bool(records[0]["params"].get("high_depth", False))
+            self.open_image(records[0]["params"]["path"])
+            for rec in records[1:]:
+                self.apply_op(rec["op"], rec.get("params"))
+        finally:
+            self.journal = journal
+        
+        # Recovered edits are unsaved
+        self.is_modified = len(records) > 1
@@ -0,0 +1,200 @@
+"""
+Batch processing with content-addressed result caching.
+
+Applies one op recipe to many images. Each result is stored in the
+ResultCache (see 19_result_cache) under the hash of its source plus the
+recipe and format, so a repeated nightly run only processes sources or
+edits that changed; identical sources within one run are processed once.
+Usage:
+
+    python 20_batch.py IMAGES_OR_DIRS... --out DIR --recipe '[{"op": "adjust", "blur": 5}]'
+                       [--recipe-file FILE] [--format png] [--key file|pixels]
+                       [--workers 4] [--cache DIR] [--cache-mb 2048] [--no-cache]
+
+--key file hashes the encoded bytes (no decode on a hit); --key pixels
+hashes the decoded image, which also matches the same picture saved with
+different metadata or compression. Outputs keep each input's path
+relative to the inputs' common directory (d1/a.jpg -> OUT/d1/a.png); a
+run whose inputs would write the same output (a.jpg and a.png) is refused.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+# Import modules dynamically
+image_server_module = importlib.import_module("10_image_server")
+result_cache_module = importlib.import_module("19_result_cache")
+
+process_image = image_server_module.process_image
+FORMATS = image_server_module.FORMATS
+ResultCache = result_cache_module.ResultCache
+bytes_key = result_cache_module.bytes_key
+pixel_key = result_cache_module.pixel_key
+result_key = result_cache_module.result_key
+CACHE_DIR = result_cache_module.CACHE_DIR
+
+
+# Input files picked up from directories
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+def collect_inputs(paths):
+    """Return image files named directly or found (non-recursively) in directories, sorted."""
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files += sorted(f for f in p.iterdir() if f.suffix.lower() in IMAGE_EXTENSIONS)
+        elif p.is_file():
+            files.append(p)
+        else:
+            print(f"Skipping {p}: not found", file=sys.stderr)
+    return files
+
+
+def output_stems(files):
+    """Return each file's output path without suffix, relative to the files' common directory; raise ValueError on collisions."""
+    if not files:
+        return []
+    parents = [f.resolve().parent for f in files]
+    root = Path(os.path.commonpath(parents))
+    stems = [parent.relative_to(root) / f.stem for f, parent in zip(files, parents)]
+
+    # Two different sources must not overwrite each other's output
+    seen = {}
+    for f, stem in zip(files, stems):
+        other = seen.setdefault(stem, f)
+        if other.resolve() != f.resolve():
+            raise ValueError(f"{other} and {f} would both be written as {stem}")
+    return stems
+
+
+def decode(data):
+    """Return data decoded as a BGR image, or raise ValueError."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("could not decode image")
+    return img
+
+
+def file_key(path, recipe, fmt, key_mode):
+    """Return the result key of recipe applied to one input file."""
+    data = path.read_bytes()
+    source = pixel_key(decode(data)) if key_mode == "pixels" else bytes_key(data)
+    return result_key(source, recipe, fmt)
+
+
+def render(path, key, recipe, fmt, cache):
+    """Return (encoded result, True if taken from the cache) for one input file."""
+    ext = FORMATS[fmt][0]
+    if cache is not None:
+        out = cache.get_bytes(key, ext)
+        if out is not None:
+            return out, True
+
+    # Miss: run the recipe headless and store the encoded result
+    out, _content_type = process_image(decode(path.read_bytes()), recipe, fmt)
+    if cache is not None:
+        cache.put_bytes(key, out, ext)
+    return out, False
+
+
+def run_batch(files, recipe, out_dir, fmt="png", key_mode="file", cache=None, workers=None):
+    """Process files into out_dir and return counts {"cached", "processed", "duplicates", "failed"}."""
+    # Refuse colliding output names before any work
+    stems = dict(zip(files, output_stems(files)))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ext = FORMATS[fmt][0]
+    counts = {"cached": 0, "processed": 0, "duplicates": 0, "failed": 0}
+
+    def fail(path, error):
+        print(f"{path}: {error}", file=sys.stderr)
+        counts["failed"] += 1
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2) as pool:
+        # Hash every input first, so identical sources are rendered once
+        key_futures = [(path, pool.submit(file_key, path, recipe, fmt, key_mode)) for path in files]
+        keys = []
+        for path, fut in key_futures:
+            try:
+                keys.append((path, fut.result()))
+            except Exception as e:
+                fail(path, e)
+
+        # One render per distinct key
+        renders = {}
+        for path, key in keys:
+            if key not in renders:
+                renders[key] = pool.submit(render, path, key, recipe, fmt, cache)
+
+        # Write results in input order
+        done = set()
+        for path, key in keys:
+            try:
+                data, cached = renders[key].result()
+            except Exception as e:
+                fail(path, e)
+                continue
+            stem = stems[path]
+            target = out_dir / stem.parent / (stem.name + ext)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            if key in done:
+                counts["duplicates"] += 1
+            else:
+                counts["cached" if cached else "processed"] += 1
+                done.add(key)
+    return counts
+
+
+def main():
+    """Parse arguments and run the batch."""
+    parser = argparse.ArgumentParser(description="Apply one recipe to many images with result caching")
+    parser.add_argument("inputs", nargs="+", help="image files or directories")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--recipe", default="[]", help="JSON list of ImageModel.apply_op steps")
+    parser.add_argument("--recipe-file", help="read the recipe from a JSON file instead")
+    parser.add_argument("--format", default="png", choices=sorted(FORMATS))
+    parser.add_argument("--key", default="file", choices=("file", "pixels"), help="hash file bytes or decoded pixels")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=str(CACHE_DIR), help="cache directory")
+    parser.add_argument("--cache-mb", type=int, default=2048, help="cache size limit")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    recipe = json.loads(Path(args.recipe_file).read_text() if args.recipe_file else args.recipe)
+    if not isinstance(recipe, list):
+        parser.error("recipe must be a JSON list of steps")
+
+    # Without the cache only duplicates within this run are skipped
+    cache = None if args.no_cache else ResultCache(args.cache, args.cache_mb * 1024 ** 2)
+    files = collect_inputs(args.inputs)
+    try:
+        output_stems(files)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    counts = run_batch(files, recipe, args.out, args.format.lower(), args.key, cache, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(files)} files in {elapsed:.2f}s: {counts['processed']} processed, {counts['cached']} from cache, "
+          f"{counts['duplicates']} duplicates, {counts['failed']} failed")
+    if cache is not None:
+        print(f"Cache: {len(cache)} entries, {cache.nbytes / 1024 ** 2:.1f} MB of {args.cache_mb} MB")
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
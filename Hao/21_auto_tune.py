@@ -0,0 +1,265 @@
+"""
+Auto-tuned performance profile for this host.
+
+The fastest settings depend on the machine: how many band threads pay
+off and from which image size, where the box and pyramid blurs overtake
+the exact Gaussian, which undo compression keeps up, and how large a
+histogram proxy fits in a frame. calibrate() micro-benchmarks those
+pipeline stages on a synthetic image and returns a profile; the GUI
+loads it at startup (tuning once on first start) and applies it to every
+document. Usage:
+
+    python 21_auto_tune.py [--megapixels 4] [--show] [--profile FILE]
+
+Approximate blurs are only chosen within the kernel ranges their
+documented error bounds cover (see 4_blur_engine), so tuning changes
+speed, never the accuracy guarantees.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+from pathlib import Path
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+# Tuned profile of this host
+PROFILE_PATH = Path.home() / ".assignment3" / "profile.json"
+
+# Bump when the profile keys or their meaning change
+PROFILE_VERSION = 2
+
+# Settings used when no profile exists (the engine's own defaults)
+DEFAULTS = {
+    "tile_threads": 1,
+    "tile_min_pixels": 4_000_000,
+    "blur_box_from": 13,
+    "blur_pyr_from": 17,
+    "undo_codec": "png",
+    "undo_level": 1,
+    "stats_proxy_pixels": 1_000_000,
+}
+
+# Largest kernel the Blur slider produces, and a threshold that never triggers
+MAX_KERNEL = 21
+NEVER = MAX_KERNEL + 2
+
+# Smallest kernels the box and pyramid error bounds are measured for
+BOX_FLOOR = 13
+PYR_FLOOR = 17
+
+# Time a histogram may take while dragging a slider
+PROXY_BUDGET_MS = 4.0
+
+
+def host():
+    """Return a description of this machine; a profile from another host is not reused."""
+    return {"platform": platform.platform(), "machine": platform.machine(),
+            "cpus": os.cpu_count() or 1, "opencv": cv2.__version__}
+
+
+def best_ms(func, repeat=3):
+    """Return the best wall time of func in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def thread_candidates(cpus):
+    """Return band thread counts worth trying: powers of two up to cpus, plus cpus."""
+    counts = {1, cpus}
+    n = 2
+    while n < cpus:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def tune_tiles(img, repeat, log):
+    """Return (band threads, min pixels) for the fastest full render of img."""
+    TileRunner = importlib.import_module("13_parallel_tiles").TileRunner
+
+    def render(tiles, src):
+        # Blur and tonal pass as in ImageModel.apply_all
+        out = tiles.gaussian_blur(src, 9)
+        return tiles.tone(out, 1.2, 10)
+
+    # Thread count for a large frame
+    times = {}
+    for threads in thread_candidates(os.cpu_count() or 1):
+        tiles = TileRunner(threads, min_pixels=0, adaptive=False)
+        times[threads] = best_ms(lambda: render(tiles, img), repeat)
+        tiles.shutdown()
+        log(f"  tiles {threads:>3} threads: {times[threads]:.1f} ms")
+    threads = min(times, key=times.get)
+    if threads == 1 or times[threads] > 0.9 * times[1]:
+        return 1, DEFAULTS["tile_min_pixels"]
+
+    # Smallest image size from which bands stay at least 10% faster
+    min_pixels = img.shape[0] * img.shape[1]
+    for fraction in (0.5, 0.25, 0.125, 0.0625):
+        h = max(1, int(img.shape[0] * fraction))
+        part = img[:h]
+        single = TileRunner(1, min_pixels=0, adaptive=False)
+        one = best_ms(lambda: render(single, part), repeat)
+        single.shutdown()
+        tiles = TileRunner(threads, min_pixels=0, adaptive=False)
+        many = best_ms(lambda: render(tiles, part), repeat)
+        tiles.shutdown()
+        if many > 0.9 * one:
+            break
+        min_pixels = h * img.shape[1]
+    return threads, min_pixels
+
+
+def tune_blur(img, repeat, log):
+    """Return (box_from, pyr_from) kernel thresholds for BlurEngine."""
+    BlurEngine = importlib.import_module("4_blur_engine").BlurEngine
+    engine = BlurEngine()
+    kernels = list(range(BOX_FLOOR, MAX_KERNEL + 1, 2))
+
+    # Time every strategy for the kernels where approximations are allowed
+    gauss, box, pyr = {}, {}, {}
+    for k in kernels:
+        gauss[k] = best_ms(lambda: cv2.GaussianBlur(img, (k, k), 0), repeat)
+        box[k] = best_ms(lambda: engine._box_blur(img, k), repeat)
+        pyr[k] = best_ms(lambda: engine._pyramid_blur(img, k), repeat)
+        log(f"  blur k={k:>2}: gaussian {gauss[k]:.1f}  box {box[k]:.1f}  pyramid {pyr[k]:.1f} ms")
+
+    # Lowest threshold from which the faster method wins for every larger kernel
+    def threshold(floor, faster, slower):
+        for t in kernels:
+            if t >= floor and all(faster[k] < slower(k) for k in kernels if k >= t):
+                return t
+        return NEVER
+
+    box_from = threshold(BOX_FLOOR, box, lambda k: gauss[k])
+    pyr_from = threshold(PYR_FLOOR, pyr, lambda k: box[k] if k >= box_from else gauss[k])
+    return box_from, pyr_from
+
+
+def tune_undo(img, log):
+    """Return (codec, level) with the smallest frames among options within twice the fastest round trip."""
+    CompressedFrame = importlib.import_module("9_history").CompressedFrame
+    results = []
+    # Level 0 is not a candidate: the model stores uncompressed copies there
+    for codec, level in (("png", 1), ("png", 3), ("zlib", 1)):
+        start = time.perf_counter()
+        frame = CompressedFrame(img, codec, level)
+        frame._future.result()
+        encode = (time.perf_counter() - start) * 1000
+        decode = best_ms(frame.decode, 1)
+        results.append((codec, level, encode + decode, frame.nbytes))
+        log(f"  undo {codec} {level}: {encode:.1f} + {decode:.1f} ms, {frame.nbytes / 1024 ** 2:.1f} MB")
+
+    fastest = min(ms for _c, _l, ms, _n in results)
+    codec, level, _ms, _n = min((r for r in results if r[2] <= 2 * fastest), key=lambda r: r[3])
+    return codec, level
+
+
+def tune_proxy(img, log):
+    """Return the largest histogram proxy (in pixels) computed within the slider budget."""
+    ImageStats = importlib.import_module("7_image_stats").ImageStats
+    best = 250_000
+    for pixels in (250_000, 500_000, 1_000_000, 2_000_000, 4_000_000):
+        if pixels > img.shape[0] * img.shape[1]:
+            break
+        stats = ImageStats(pixels)
+        ms = best_ms(lambda: (stats.clear(), stats.base_histogram(img)), 3)
+        log(f"  histogram proxy {pixels / 1e6:.2f} MP: {ms:.2f} ms")
+        if ms > PROXY_BUDGET_MS:
+            break
+        best = pixels
+    return best
+
+
+def calibrate(megapixels=4.0, repeat=2, log=print):
+    """Benchmark the pipeline stages on this host and return a profile dict."""
+    synthetic_image = importlib.import_module("benchmark").synthetic_image
+    img = synthetic_image(megapixels)
+    log(f"Calibrating on {img.shape[1]} x {img.shape[0]} ({megapixels:.1f} MP)")
+
+    start = time.perf_counter()
+    threads, min_pixels = tune_tiles(img, repeat, log)
+    box_from, pyr_from = tune_blur(img, repeat, log)
+    codec, level = tune_undo(img, log)
+    proxy = tune_proxy(img, log)
+    return {
+        "version": PROFILE_VERSION,
+        "host": host(),
+        "seconds": round(time.perf_counter() - start, 2),
+        "tile_threads": threads,
+        "tile_min_pixels": min_pixels,
+        "blur_box_from": box_from,
+        "blur_pyr_from": pyr_from,
+        "undo_codec": codec,
+        "undo_level": level,
+        "stats_proxy_pixels": proxy,
+    }
+
+
+def load_profile(path=PROFILE_PATH):
+    """Return the saved profile, or None if missing, outdated or from another host."""
+    try:
+        profile = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+    if profile.get("version") != PROFILE_VERSION or profile.get("host") != host():
+        return None
+    return profile
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    """Write profile to path."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(profile, indent=2))
+
+
+def apply_profile(model, profile):
+    """Configure an ImageModel's blur, undo and histogram settings from a profile (defaults for missing keys)."""
+    settings = {**DEFAULTS, **(profile or {})}
+    model.blur_engine.box_from = settings["blur_box_from"]
+    model.blur_engine.pyr_from = settings["blur_pyr_from"]
+    model.blur_engine.clear()
+    model.undo_codec = settings["undo_codec"]
+    model.undo_level = settings["undo_level"]
+    model.stats.proxy_pixels = settings["stats_proxy_pixels"]
+    model.stats.clear()
+
+
+def main():
+    """Parse arguments, calibrate and save the profile."""
+    parser = argparse.ArgumentParser(description="Tune the image engine for this host")
+    parser.add_argument("--megapixels", type=float, default=4.0, help="size of the calibration image")
+    parser.add_argument("--repeat", type=int, default=2, help="timing runs per measurement")
+    parser.add_argument("--profile", default=str(PROFILE_PATH), help="profile file")
+    parser.add_argument("--show", action="store_true", help="print the saved profile and exit")
+    args = parser.parse_args()
+
+    if args.show:
+        profile = load_profile(args.profile)
+        print(json.dumps(profile, indent=2) if profile else "No profile for this host")
+        return
+
+    profile = calibrate(args.megapixels, args.repeat)
+    save_profile(profile, args.profile)
+    print(json.dumps({k: v for k, v in profile.items() if k != "host"}, indent=2))
+    print(f"Saved to {args.profile}")
+
+
+if __name__ == "__main__":
+    main()
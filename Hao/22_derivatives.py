@@ -0,0 +1,168 @@
+"""
+Derivative (web size / thumbnail) generation with area resampling.
+
+Each source is decoded once. Every requested long-edge size is resampled
+from an ImagePyramid (see 5_image_pyramid): a cascade of exact 2x2 area
+reductions, built once per source and shared by all sizes, followed by
+one INTER_AREA step of less than 2x. Every output pixel averages all
+the source pixels it covers, so fine detail does not alias the way a
+single INTER_LINEAR downscale does, and each extra size costs one small
+resize instead of another pass over the full image. Encoding and
+writing run on a thread pool. Usage:
+
+    python 22_derivatives.py SOURCES... --out DIR [--sizes 2048,1024,256]
+                             [--format jpg] [--quality 85] [--workers 4]
+
+Outputs are named <stem>_<size>.<ext> under each source's path relative
+to the sources' common directory (d1/a.jpg -> OUT/d1/a_256.jpg); sources
+that would write the same names (a.jpg and a.png) are refused. Sources
+are never upscaled: a size at or above the source's long edge is written
+at the source size.
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+
+# Import modules dynamically
+image_pyramid_module = importlib.import_module("5_image_pyramid")
+batch_module = importlib.import_module("20_batch")
+
+ImagePyramid = image_pyramid_module.ImagePyramid
+collect_inputs = batch_module.collect_inputs
+output_stems = batch_module.output_stems
+
+
+# Encoder parameters per output format
+ENCODE_PARAMS = {
+    "jpg": lambda quality: [cv2.IMWRITE_JPEG_QUALITY, quality],
+    "png": lambda quality: [cv2.IMWRITE_PNG_COMPRESSION, 3],
+    "webp": lambda quality: [cv2.IMWRITE_WEBP_QUALITY, quality],
+}
+
+
+def derivatives(img, sizes):
+    """Return {size: img resized so its long edge is size} from one shared area cascade, largest first."""
+    pyramid = ImagePyramid(img, min_side=1)
+    long_edge = max(img.shape[:2])
+    out = {}
+    for size in sorted(set(sizes), reverse=True):
+        out[size] = pyramid.resample(min(1.0, size / long_edge), interpolation=cv2.INTER_AREA)
+    return out
+
+
+def generate(path, stem, sizes, out_dir, fmt, quality, writer, pending, release):
+    """Decode one source, resample all sizes and queue their encodes (named after stem) on writer; release() runs after the last one."""
+    img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("could not decode image")
+    params = ENCODE_PARAMS[fmt](quality)
+    outputs = derivatives(img, sizes)
+    del img
+
+    # The slot is freed once every resized copy of this source is written
+    remaining = [len(outputs)]
+    lock = threading.Lock()
+
+    def finished(_fut):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            release()
+
+    (out_dir / stem.parent).mkdir(parents=True, exist_ok=True)
+    for size, resized in outputs.items():
+        target = out_dir / stem.parent / f"{stem.name}_{size}.{fmt}"
+        fut = writer.submit(write_image, target, resized, params)
+        fut.add_done_callback(finished)
+        pending.append(fut)
+
+
+def write_image(path, img, params):
+    """Encode and write one derivative; raise on failure."""
+    ok, buf = cv2.imencode(path.suffix, img, params)
+    if not ok:
+        raise ValueError(f"could not encode {path.name}")
+    path.write_bytes(buf.tobytes())
+
+
+def run(files, sizes, out_dir, fmt="jpg", quality=85, workers=None):
+    """Generate derivatives of files into out_dir; return (sources done, outputs written, failures)."""
+    # Refuse colliding output names before any work
+    stems = output_stems(files)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 2
+
+    # Decode/resample and encode/write on separate pools; at most two
+    # sources per worker are in flight (bounded memory)
+    slots = threading.BoundedSemaphore(2 * workers)
+    done, written, failed = 0, 0, 0
+    with ThreadPoolExecutor(workers, thread_name_prefix="derive") as decoder, \
+            ThreadPoolExecutor(workers, thread_name_prefix="encode") as writer:
+        jobs = []
+        for path, stem in zip(files, stems):
+            slots.acquire()
+            pending = []
+
+            def task(path=path, stem=stem, pending=pending):
+                try:
+                    generate(path, stem, sizes, out_dir, fmt, quality, writer, pending, slots.release)
+                except Exception:
+                    slots.release()
+                    raise
+
+            jobs.append((path, decoder.submit(task), pending))
+
+        for path, job, pending in jobs:
+            try:
+                job.result()
+                for fut in pending:
+                    fut.result()
+                    written += 1
+                done += 1
+            except Exception as e:
+                print(f"{path}: {e}", file=sys.stderr)
+                failed += 1
+    return done, written, failed
+
+
+def main():
+    """Parse arguments and generate derivatives."""
+    parser = argparse.ArgumentParser(description="Generate long-edge derivatives with area resampling")
+    parser.add_argument("inputs", nargs="+", help="image files or directories")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--sizes", default="2048,1024,256", help="comma-separated long-edge sizes")
+    parser.add_argument("--format", default="jpg", choices=sorted(ENCODE_PARAMS))
+    parser.add_argument("--quality", type=int, default=85, help="JPEG/WebP quality")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    if not sizes or min(sizes) < 1:
+        parser.error("sizes must be positive integers")
+    files = collect_inputs(args.inputs)
+    try:
+        output_stems(files)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    done, written, failed = run(files, sizes, args.out, args.format, args.quality, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{done} sources, {written} derivatives in {elapsed:.2f}s ({failed} failed)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Render process: documents rendered outside the GUI process.
+
+A heavy render in the Tk process competes for the GIL with the event loop
+wherever the pipeline runs Python. With a RenderProcess attached, a
+document's slider pipeline (ImageModel.apply_all) runs on a model in a
+separate process instead, and the GUI only blits finished frames.
+
+Frames never travel through the pipe. The GUI process creates (and
+unlinks) every multiprocessing.shared_memory segment: per document one
+segment holding the base image, rewritten only when the base changes
+(load, rotation, filter, undo), and a ring of RING_SLOTS segments the
+rendered frames are written to in turn. The pipe carries small control
+messages only: segment names, shapes, slider values and the histogram.
+The GUI model's current_img is a view of a ring slot, which is reused
+RING_SLOTS renders later, when the view already shows a newer frame.
+Usage:
+
+    python 3_main.py --render-process
+
+Destructive ops (rotation, filters, grayscale) still change the base
+image in the GUI process; the renders they trigger run in the render
+process like slider changes.
+"""
+import sys
+import weakref
+import threading
+import traceback
+import importlib
+import multiprocessing
+from pathlib import Path
+from multiprocessing import shared_memory
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+np = lazy_import("numpy")
+
+
+# Rendered frames per document before a ring slot is reused
+RING_SLOTS = 3
+
+# Slider values copied to the render process model on every render
+PARAMS = ("brightness", "contrast", "scale", "blur", "edge_on", "edge_low", "edge_high")
+
+
+# Arrays created over each segment (numpy holds no buffer export, so a
+# segment closed under a live array would unmap its pixels)
+_VIEWS = weakref.WeakKeyDictionary()
+
+
+def _view(shm, shape, dtype):
+    """Return an array over a segment, remembered so the segment stays mapped while it lives."""
+    arr = np.ndarray(shape, dtype, buffer=shm.buf)
+    _VIEWS[shm] = [ref for ref in _VIEWS.get(shm, ()) if ref() is not None] + [weakref.ref(arr)]
+    return arr
+
+
+def _close(shm, retired):
+    """Close a segment, or keep it in retired while arrays (or views of them) still use it."""
+    refs = [ref for ref in _VIEWS.get(shm, ()) if ref() is not None]
+    if refs:
+        _VIEWS[shm] = refs
+        retired.append(shm)
+        return
+    _VIEWS.pop(shm, None)
+    shm.close()
+
+
+def _close_retired(retired):
+    """Close retired segments no array views any more."""
+    still = []
+    for shm in retired:
+        _close(shm, still)
+    retired[:] = still
+
+
+class _Worker:
+    """
+    Render loop of the render process.
+
+    Keeps one ImageModel per document and the segments it attached,
+    closing those the GUI released once no cached array views them.
+    """
+
+    def __init__(self, conn, profile):
+        """Initialize worker answering requests on conn."""
+        self.conn = conn
+        self.documents = {}
+        self.retired = []
+        self.tiles = None
+        self.profile = None
+        self.set_profile(profile)
+
+    def set_profile(self, profile):
+        """Apply a tuned profile to the band threads and every model."""
+        TileRunner = importlib.import_module("13_parallel_tiles").TileRunner
+        apply_profile = importlib.import_module("21_auto_tune").apply_profile
+        self.profile = profile
+        if self.tiles is not None:
+            self.tiles.shutdown()
+        settings = profile or {}
+        threads = settings.get("tile_threads") or 1
+        self.tiles = TileRunner(threads, min_pixels=settings.get("tile_min_pixels", 4_000_000)) if threads > 1 else None
+        for doc in self.documents.values():
+            doc["model"].set_tiles(self.tiles)
+            apply_profile(doc["model"], profile)
+
+    def document(self, key):
+        """Return the state of one document, creating its model on first use."""
+        doc = self.documents.get(key)
+        if doc is None:
+            ImageModel = importlib.import_module("1_image_processing").ImageModel
+            apply_profile = importlib.import_module("21_auto_tune").apply_profile
+            model = ImageModel()
+            model.record_history = False
+            model.set_tiles(self.tiles)
+            apply_profile(model, self.profile)
+            doc = self.documents[key] = {"model": model, "generation": None, "segments": {}}
+        return doc
+
+    def attach(self, doc, name):
+        """Return the segment called name, attaching it on first use."""
+        shm = doc["segments"].get(name)
+        if shm is None:
+            shm = doc["segments"][name] = shared_memory.SharedMemory(name)
+        return shm
+
+    def release(self, doc, names):
+        """Detach segments the GUI no longer uses."""
+        for name in names:
+            shm = doc["segments"].pop(name, None)
+            if shm is not None:
+                _close(shm, self.retired)
+
+    def render(self, key, request):
+        """Render one document from request and deliver the frame."""
+        doc = self.document(key)
+        model = doc["model"]
+        self.release(doc, request["release"])
+
+        # New base image: wrap the shared segment (no copy)
+        name, shape, dtype, generation = request["base"]
+        if generation != doc["generation"]:
+            model.original_img = _view(self.attach(doc, name), shape, dtype)
+            doc["generation"] = generation
+
+        # Slider values, layers, kept region edits and selection as in the GUI model
+        for param in PARAMS:
+            setattr(model, param, request[param])
+        model.layers.load(request["layers"])
+        model.regions.load(request["regions"])
+        if request["roi"] != model.roi:
+            model.set_roi(request["roi"])
+
+        model.apply_all()
+        return self.deliver(doc, *request["out"])
+
+    def deliver(self, doc, name, capacity):
+        """Copy the rendered frame into the output segment, or ask for a larger one."""
+        model = doc["model"]
+        img = model.current_img
+        if img.nbytes > capacity:
+            return ("grow", img.nbytes)
+        np.copyto(_view(self.attach(doc, name), img.shape, img.dtype), img)
+        return ("done", img.shape, img.dtype.str, model.histogram())
+
+    def forget(self, key):
+        """Drop a closed document's model and segments."""
+        doc = self.documents.pop(key, None)
+        if doc is not None:
+            doc["model"] = None
+            self.release(doc, list(doc["segments"]))
+
+    def run(self):
+        """Answer requests until the GUI closes the pipe or sends close."""
+        while True:
+            try:
+                msg = self.conn.recv()
+            except EOFError:
+                break
+            kind = msg[0]
+            if kind == "close":
+                break
+
+            # Requests without a reply
+            if kind == "profile":
+                self.set_profile(msg[1])
+                continue
+            if kind == "forget":
+                self.forget(msg[1])
+                continue
+
+            # Render and copy requests are answered with the frame's shape
+            # and histogram, a larger segment request or the error
+            try:
+                if kind == "render":
+                    reply = self.render(msg[1], msg[2])
+                else:
+                    reply = self.deliver(self.document(msg[1]), msg[2], msg[3])
+            except Exception:
+                reply = ("error", traceback.format_exc())
+            self.conn.send(reply)
+            _close_retired(self.retired)
+
+        if self.tiles is not None:
+            self.tiles.shutdown()
+
+
+def serve(conn, profile=None):
+    """Entry point of the render process."""
+    _Worker(conn, profile).run()
+
+
+class _Buffers:
+    """Shared segments of one document in the GUI process."""
+
+    def __init__(self):
+        """Initialize without segments."""
+        # Base image segment, the array it holds a copy of and its generation
+        self.base = None
+        self.base_src = None
+        self.generation = 0
+
+        # Output ring and the slot the next frame goes to
+        self.ring = [None] * RING_SLOTS
+        self.slot = 0
+
+        # Segments unlinked since the last request (the worker detaches them)
+        self.released = []
+
+    def segments(self):
+        """Return every segment held."""
+        return [shm for shm in [self.base] + self.ring if shm is not None]
+
+
+class RenderProcess:
+    """
+    Render process serving every document of the GUI.
+
+    render(model) blocks the calling thread (a Session pool thread) on the
+    pipe, not on the GIL. Renders of different documents are serialized,
+    as the process renders one frame at a time.
+    """
+
+    def __init__(self, profile=None):
+        """Start the render process with an optional tuned profile."""
+        # Spawned, not forked: the GUI process runs Tk and worker threads
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=serve, args=(child, profile), name="render", daemon=True)
+        self._process.start()
+        child.close()
+
+        # One request at a time on the pipe
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._retired = []
+
+    def _call(self, msg):
+        """Send a request and return its reply (lock held)."""
+        try:
+            self._conn.send(msg)
+            reply = self._conn.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError("Render process exited") from e
+        if reply[0] == "error":
+            raise RuntimeError(f"Render process failed:\n{reply[1]}")
+        return reply
+
+    def _create(self, nbytes):
+        """Return a new segment of at least nbytes."""
+        return shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+
+    def _discard(self, buffers, shm):
+        """Unlink a segment and detach it once nothing views it."""
+        buffers.released.append(shm.name)
+        shm.unlink()
+        _close(shm, self._retired)
+
+    def _share_base(self, buffers, img):
+        """Copy the base image into its segment when it changed; return (name, shape, dtype, generation)."""
+        if buffers.base_src is not img:
+            if buffers.base is None or buffers.base.size < img.nbytes:
+                if buffers.base is not None:
+                    self._discard(buffers, buffers.base)
+                buffers.base = self._create(img.nbytes)
+            np.copyto(_view(buffers.base, img.shape, img.dtype), img)
+            buffers.base_src = img
+            buffers.generation += 1
+        return buffers.base.name, img.shape, img.dtype.str, buffers.generation
+
+    def render(self, model):
+        """Render model's current frame in the render process and point current_img at it."""
+        img = model.original_img
+        if img is None:
+            return
+        with self._lock:
+            buffers = self._buffers.setdefault(id(model), _Buffers())
+            model.frame_stale = False
+
+            # Next ring slot, sized for a frame like the base until it grows
+            slot = buffers.slot
+            buffers.slot = (slot + 1) % RING_SLOTS
+            out = buffers.ring[slot]
+            if out is None:
+                out = buffers.ring[slot] = self._create(img.nbytes)
+
+            # Control message: segment names and parameters, no pixels
+            request = {param: getattr(model, param) for param in PARAMS}
+            request.update(
+                base=self._share_base(buffers, img),
+                out=(out.name, out.size),
+                layers=model.layers.state(),
+                regions=model.regions.state(),
+                roi=model.roi,
+                release=buffers.released,
+            )
+            buffers.released = []
+            reply = self._call(("render", id(model), request))
+
+            # Larger than the slot (upscaled): replace it, copy the frame again
+            if reply[0] == "grow":
+                self._discard(buffers, out)
+                out = buffers.ring[slot] = self._create(reply[1])
+                reply = self._call(("copy", id(model), out.name, out.size))
+
+            _kind, shape, dtype, histogram = reply
+            model.current_img = _view(out, shape, dtype)
+            model.pretonal_img = None
+            model.rendered_histogram = histogram
+            _close_retired(self._retired)
+
+    def set_profile(self, profile):
+        """Apply a tuned profile in the render process."""
+        with self._lock:
+            self._conn.send(("profile", profile))
+
+    def forget(self, model):
+        """Free a closed document's model and segments."""
+        with self._lock:
+            buffers = self._buffers.pop(id(model), None)
+            if buffers is None:
+                return
+            self._conn.send(("forget", id(model)))
+            for shm in buffers.segments():
+                shm.unlink()
+                _close(shm, self._retired)
+
+    def close(self):
+        """Stop the render process and unlink all segments (mapped ones stay valid until unused)."""
+        with self._lock:
+            try:
+                self._conn.send(("close",))
+            except OSError:
+                pass
+            self._process.join(timeout=2)
+            if self._process.is_alive():
+                self._process.terminate()
+            for buffers in self._buffers.values():
+                for shm in buffers.segments():
+                    shm.unlink()
+                    _close(shm, self._retired)
+            self._buffers.clear()
+            self._conn.close()
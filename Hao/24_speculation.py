@@ -0,0 +1,151 @@
+"""
+Idle-time speculation: likely next renders computed before they are asked for.
+
+When the app goes idle after a slider release or an image load, a
+Speculator uses the spare CPU on what the next action most likely needs:
+
+    1. the two neighbouring blur kernels (one slider step either way),
+       into the BlurEngine cache;
+    2. the grayscale toggle and a 90 degree rotation: their base image,
+       then their frame under the current settings, into
+       ImageModel.prepared, where grayscale() and rotate() take them if
+       they were derived from the current base.
+
+The work runs on one thread at the lowest priority the OS gives a thread
+(Linux), in steps of one image operation. cancel() returns at once: the
+step in flight finishes in the background, and nothing waits for it.
+Steps compute into their own arrays and publish a result in one
+assignment (blur results under the BlurEngine lock), and a result is
+only used while the base image, grayscale state and settings it was
+computed for are still current, so a step never blocks or corrupts a
+render. Documents rendered in a render process (see 23_render_process)
+are not speculated on.
+"""
+import os
+import sys
+import threading
+import importlib
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# Largest kernel the Blur slider produces
+MAX_KERNEL = importlib.import_module("21_auto_tune").MAX_KERNEL
+
+# Destructive ops speculated on, most likely first (ImageModel.op_base names)
+OPS = ("grayscale", "rotate90")
+
+
+def _lower_priority():
+    """Run the calling thread at the lowest CPU priority (Linux sets nice per thread)."""
+    if sys.platform.startswith("linux"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError:
+            pass
+
+
+def prune(model):
+    """Forget speculative results derived from an older base image or grayscale state."""
+    for op, entry in list(model.prepared.items()):
+        if entry["source"] is not model.original_img or entry["is_grayscale"] != model.is_grayscale:
+            model.prepared.pop(op, None)
+
+
+def prefetch_blur(model, k):
+    """Blur the last blurred image (the current blur input) with kernel k into the BlurEngine cache."""
+    model.blur_engine.prefetch(k)
+
+
+def prepare_base(model, op):
+    """Store the base image op would make, unless already stored for the current base."""
+    is_grayscale = model.is_grayscale
+    source = model.original_img
+    entry = model.prepared.get(op)
+    if entry is not None and entry["source"] is source and entry["is_grayscale"] == is_grayscale:
+        return
+    base = model.op_base(op, source, is_grayscale)
+    model.prepared[op] = {"source": source, "is_grayscale": is_grayscale, "base": base}
+
+
+def prepare_frame(model, op):
+    """Render the prepared base of op under the current settings, unless already rendered for them."""
+    entry = model.prepared.get(op)
+    if entry is None or entry.get("key") == model.render_key():
+        return
+    model.prepared[op] = {**entry, **model.render_detached(entry["base"])}
+
+
+def speculative_steps(model):
+    """Yield the speculation steps for model, most likely next action first."""
+    if model.original_img is None or model.renderer is not None:
+        return
+    yield partial(prune, model)
+
+    # Neighbouring blur kernels (a selection blurs its own patch, uncached)
+    if model.roi is None and model.blur_kernel() > 0:
+        k = model.blur_kernel()
+        for n in (k + 2, k - 2):
+            if 3 <= n <= MAX_KERNEL:
+                yield partial(prefetch_blur, model, n)
+
+    # Bases first: they also help when the settings change before the click
+    for op in OPS:
+        yield partial(prepare_base, model, op)
+    if model.roi is None:
+        for op in OPS:
+            yield partial(prepare_frame, model, op)
+
+
+class Speculator:
+    """
+    Low-priority runner of speculation steps for one model at a time.
+
+    start() and cancel() are called from the GUI thread. A failed step
+    only ends that run of speculation.
+    """
+
+    def __init__(self):
+        """Initialize speculator with its low-priority thread."""
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate", initializer=_lower_priority)
+
+        # Cancel flag of the latest run
+        self._cancel = threading.Event()
+        self._future = None
+
+        # Steps completed since construction
+        self.steps = 0
+
+    def start(self, model):
+        """Cancel any earlier run and speculate on model."""
+        self._cancel.set()
+        self._cancel = threading.Event()
+        self._future = self.pool.submit(self._run, model, self._cancel)
+
+    def _run(self, model, cancel):
+        """Run steps until done or cancelled."""
+        for step in speculative_steps(model):
+            if cancel.is_set():
+                return
+            step()
+            self.steps += 1
+
+    def cancel(self):
+        """Stop speculating after the step in flight (returns at once)."""
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        """Block until the latest run finished or was cancelled; return False on timeout (for scripts)."""
+        if self._future is None:
+            return True
+        try:
+            self._future.result(timeout)
+        except TimeoutError:
+            return False
+        except Exception:
+            pass
+        return True
+
+    def shutdown(self):
+        """Cancel and stop the thread."""
+        self.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,372 @@
+"""
+Metadata-preserving save with a lossless path for JPEG orientation edits.
+
+export (see 17_bit_depth) re-encodes through cv2.imwrite, which drops the
+EXIF and ICC metadata, and a rotated JPEG pays a full decode, re-encode
+and generation loss. save_image picks the cheapest faithful way:
+
+    orientation  the only edits since the JPEG was opened are rotations
+                 and flips and the target is a JPEG: the source bytes are
+                 copied and only the EXIF Orientation tag changes (no
+                 pixel is decoded or re-encoded)
+    reencode     any other edit: the image is encoded as before, and the
+                 source's EXIF (Orientation reset, as the pixels are
+                 written upright) and ICC profile are carried into JPEG
+                 and PNG output; other formats are written without them
+
+ImageModel.geometry records the rotations and flips applied since a file
+was opened, stamped with the file's size and modification time, so a
+source changed on disk since then is never copied. The same lossless
+re-orientation corrects whole photo archives without decoding them:
+
+    python 25_metadata_save.py PHOTOS_OR_DIRS... --ops rotate90[,flip_h...]
+                               [--out DIR]
+
+Files are rewritten in place unless --out is given; there they keep their
+path relative to the inputs' common directory.
+"""
+import os
+import sys
+import zlib
+import time
+import struct
+import argparse
+import importlib
+from pathlib import Path
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+# Import helper modules dynamically
+bit_depth_module = importlib.import_module("17_bit_depth")
+result_cache_module = importlib.import_module("19_result_cache")
+
+encodable = bit_depth_module.encodable
+export = bit_depth_module.export
+source_stamp = result_cache_module.source_stamp
+
+
+# EXIF tag of the display orientation (values 1-8)
+ORIENTATION = 0x0112
+
+# JPEG extensions (both ends of a lossless save)
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+
+# How a viewer turns stored pixels upright for each Orientation value
+DISPLAY = {
+    1: lambda a: a,
+    2: lambda a: a[:, ::-1],
+    3: lambda a: a[::-1, ::-1],
+    4: lambda a: a[::-1],
+    5: lambda a: a.swapaxes(0, 1),
+    6: lambda a: np.rot90(a, -1),
+    7: lambda a: a.swapaxes(0, 1)[::-1, ::-1],
+    8: lambda a: np.rot90(a, 1),
+}
+
+# The geometry ops ImageModel records, on an upright image
+OPS = {
+    "rotate90": lambda a: np.rot90(a, -1),
+    "rotate180": lambda a: a[::-1, ::-1],
+    "rotate270": lambda a: np.rot90(a, 1),
+    "flip_h": lambda a: a[:, ::-1],
+    "flip_v": lambda a: a[::-1],
+}
+
+
+def compose(orientation, ops):
+    """Return the Orientation value that shows the stored pixels as ops applied to their current display."""
+    # Follow a small asymmetric probe through the display transform and the ops
+    probe = np.arange(6).reshape(2, 3)
+    target = DISPLAY.get(orientation, DISPLAY[1])(probe)
+    for op in ops:
+        target = OPS[op](target)
+    for value, display in DISPLAY.items():
+        shown = display(probe)
+        if shown.shape == target.shape and (shown == target).all():
+            return value
+    raise AssertionError("rotations and flips always map to an orientation")
+
+
+def _segments(data):
+    """Yield (marker, start, end) of the JPEG header segments before the scan data."""
+    if data[:2] != b"\xff\xd8":
+        raise ValueError("not a JPEG file")
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("corrupt JPEG header")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        yield marker, pos, pos + 2 + length
+        if marker == 0xDA:
+            return
+        pos += 2 + length
+
+
+def _exif_segment(data):
+    """Return (start, end, TIFF bytes) of a JPEG's EXIF segment, or None."""
+    for marker, start, end in _segments(data):
+        if marker == 0xE1 and data[start + 4:start + 10] == b"Exif\x00\x00":
+            return start, end, data[start + 10:end]
+    return None
+
+
+def _orientation_field(tiff):
+    """Return (byte offset, struct byte order) of the Orientation value in EXIF TIFF data, or None."""
+    order = {b"II": "<", b"MM": ">"}.get(bytes(tiff[:2]))
+    if order is None or len(tiff) < 8:
+        return None
+    ifd = struct.unpack_from(order + "I", tiff, 4)[0]
+    if ifd + 2 > len(tiff):
+        return None
+    count = struct.unpack_from(order + "H", tiff, ifd)[0]
+    for i in range(count):
+        entry = ifd + 2 + 12 * i
+        if entry + 12 > len(tiff):
+            break
+        tag, kind, n = struct.unpack_from(order + "HHI", tiff, entry)
+        # One SHORT, stored in the entry itself
+        if tag == ORIENTATION and kind == 3 and n == 1:
+            return entry + 8, order
+    return None
+
+
+def get_orientation(tiff):
+    """Return the Orientation value of EXIF TIFF data (1 if absent or invalid)."""
+    field = _orientation_field(tiff) if tiff else None
+    if field is None:
+        return 1
+    value = struct.unpack_from(field[1] + "H", tiff, field[0])[0]
+    return value if value in DISPLAY else 1
+
+
+def set_orientation(tiff, value):
+    """Return EXIF TIFF data (new if tiff is None) with its Orientation set to value."""
+    field = _orientation_field(tiff) if tiff else None
+    if field is not None:
+        # Patch the two bytes in place: every other offset stays valid
+        out = bytearray(tiff)
+        struct.pack_into(field[1] + "H", out, field[0], value)
+        return bytes(out)
+    if value == 1 and tiff:
+        return tiff
+
+    # No tag yet: rebuild IFD0 with it
+    exif = Image.Exif()
+    if tiff:
+        exif.load(tiff)
+    exif[ORIENTATION] = value
+    data = exif.tobytes()
+    return data[6:] if data.startswith(b"Exif\x00\x00") else data
+
+
+def _app1(tiff):
+    """Return a JPEG APP1 segment holding EXIF TIFF data."""
+    payload = b"Exif\x00\x00" + tiff
+    if len(payload) + 2 > 0xFFFF:
+        raise ValueError("EXIF data too large for a JPEG segment")
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _app2_icc(icc):
+    """Return the JPEG APP2 segments holding an ICC profile (split into numbered chunks)."""
+    size = 0xFFFF - 2 - 14
+    chunks = [icc[i:i + size] for i in range(0, len(icc), size)]
+    if len(chunks) > 255:
+        return b""
+    out = b""
+    for i, chunk in enumerate(chunks, 1):
+        payload = b"ICC_PROFILE\x00" + bytes((i, len(chunks))) + chunk
+        out += b"\xff\xe2" + struct.pack(">H", len(payload) + 2) + payload
+    return out
+
+
+def _header_end(data):
+    """Return the offset after SOI and any JFIF APP0 segment (where metadata segments go)."""
+    pos = 2
+    for marker, start, end in _segments(data):
+        if marker != 0xE0:
+            break
+        pos = end
+    return pos
+
+
+def reorient_jpeg(data, ops, applied=True):
+    """Return JPEG data shown rotated/flipped by ops, by changing only its EXIF Orientation.
+
+    applied tells whether the ops were chosen on the image as displayed
+    (its orientation applied, as cv2.imread does) or on the stored pixels.
+    """
+    found = _exif_segment(data)
+    tiff = found[2] if found is not None else None
+    current = get_orientation(tiff)
+    orientation = compose(current if applied else 1, ops)
+
+    # Nothing to change (also keeps files without EXIF byte-identical)
+    if orientation == current:
+        return data
+
+    segment = _app1(set_orientation(tiff, orientation))
+    if found is not None:
+        return data[:found[0]] + segment + data[found[1]:]
+    pos = _header_end(data)
+    return data[:pos] + segment + data[pos:]
+
+
+def read_metadata(path):
+    """Return (EXIF TIFF bytes or None, ICC profile or None) of an image file."""
+    try:
+        with Image.open(path) as im:
+            exif = im.info.get("exif")
+            icc = im.info.get("icc_profile")
+    except (OSError, ValueError):
+        return None, None
+    if exif is not None and exif.startswith(b"Exif\x00\x00"):
+        exif = exif[6:]
+    return exif or None, icc or None
+
+
+def embed_jpeg(data, exif=None, icc=None):
+    """Return encoded JPEG data with EXIF and ICC segments added after its header."""
+    segments = b""
+    if exif:
+        try:
+            segments += _app1(exif)
+        except ValueError:
+            pass
+    if icc:
+        segments += _app2_icc(icc)
+    pos = _header_end(data)
+    return data[:pos] + segments + data[pos:]
+
+
+def _png_chunk(kind, payload):
+    """Return one PNG chunk."""
+    return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload))
+
+
+def embed_png(data, exif=None, icc=None):
+    """Return encoded PNG data with eXIf and iCCP chunks added before the image data."""
+    chunks = b""
+    if icc:
+        chunks += _png_chunk(b"iCCP", b"ICC profile\x00\x00" + zlib.compress(icc))
+    if exif:
+        chunks += _png_chunk(b"eXIf", exif)
+    pos = data.find(b"IDAT") - 4
+    if pos < 8:
+        raise ValueError("not a PNG file")
+    return data[:pos] + chunks + data[pos:]
+
+
+def geometry_ops(model):
+    """Return the rotations and flips that are the model's only edits of its source file, or None."""
+    if model.geometry is None or model.current_img is None:
+        return None
+    stamp, _applied, ops = model.geometry
+
+    # Any pixel-changing setting rules it out
+    if (model.brightness, model.contrast, model.scale, model.blur) != (0, 1.0, 1.0, 0):
+        return None
+    if model.edge_on or model.is_grayscale or model.regions.edits or any(layer.enabled for layer in model.layers.layers):
+        return None
+
+    # The source must still hold what was opened
+    try:
+        if source_stamp(stamp[0]) != stamp:
+            return None
+    except OSError:
+        return None
+    return ops
+
+
+def _write(path, data):
+    """Write data to path through a temporary file (the source may be the target)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def save_image(model, path):
+    """Write the model's current image to path, losslessly when its edits allow; return the method used."""
+    ext = os.path.splitext(path)[1].lower()
+    ops = geometry_ops(model)
+    source = model.geometry[0][0] if model.geometry is not None else model.img_path
+
+    # Rotations and flips of a JPEG: copy it with a new Orientation tag
+    if ops is not None and ext in JPEG_EXTENSIONS and source.lower().endswith(JPEG_EXTENSIONS):
+        _write(path, reorient_jpeg(Path(source).read_bytes(), ops, model.geometry[1]))
+
+        # The written file now shows exactly the current image
+        model.geometry = (source_stamp(path), True, ())
+        return "orientation"
+
+    # Re-encode; the written pixels are upright, so the carried EXIF is too
+    exif, icc = read_metadata(source) if source and os.path.exists(source) else (None, None)
+    if ext not in JPEG_EXTENSIONS + (".png",) or not (exif or icc):
+        if not export(path, model.current_img):
+            raise ValueError(f"Could not encode {path}")
+        return "reencode"
+    if exif:
+        exif = set_orientation(exif, 1)
+    ok, buf = cv2.imencode(ext, encodable(path, model.current_img))
+    if not ok:
+        raise ValueError(f"Could not encode {path}")
+    data = buf.tobytes()
+    _write(path, embed_jpeg(data, exif, icc) if ext in JPEG_EXTENSIONS else embed_png(data, exif, icc))
+    return "reencode"
+
+
+def main():
+    """Parse arguments and re-orient JPEG files losslessly."""
+    batch_module = importlib.import_module("20_batch")
+    parser = argparse.ArgumentParser(description="Rotate or flip JPEG files losslessly through EXIF orientation")
+    parser.add_argument("inputs", nargs="+", help="JPEG files or directories")
+    parser.add_argument("--ops", required=True, help=f"comma-separated ops from {', '.join(OPS)}")
+    parser.add_argument("--out", help="output directory (default: rewrite in place)")
+    args = parser.parse_args()
+
+    ops = [op.strip() for op in args.ops.split(",") if op.strip()]
+    unknown = [op for op in ops if op not in OPS]
+    if unknown:
+        parser.error(f"unknown ops: {', '.join(unknown)}")
+    out_dir = Path(args.out) if args.out else None
+    if out_dir is not None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    # With --out, files keep their path relative to the inputs' common
+    # directory (equally named files from two directories stay apart)
+    files = [path for path in batch_module.collect_inputs(args.inputs) if path.suffix.lower() in JPEG_EXTENSIONS]
+    root = Path(os.path.commonpath([path.resolve().parent for path in files])) if files else None
+
+    start = time.perf_counter()
+    done, failed = 0, 0
+    for path in files:
+        try:
+            data = reorient_jpeg(path.read_bytes(), ops)
+            target = path
+            if out_dir is not None:
+                target = out_dir / path.resolve().relative_to(root)
+                target.parent.mkdir(parents=True, exist_ok=True)
+            _write(target, data)
+            done += 1
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            failed += 1
+    print(f"{done} files re-oriented in {time.perf_counter() - start:.2f}s ({failed} failed)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,47 @@
 """
 ScrollableImageCanvas class for displaying images with scrollbars.
 
-Provides a canvas with vertical and horizontal scrollbars for viewing
-images that may be larger than the available display area.
+Provides a canvas with vertical and horizontal scrollbars and its own
+zoom and pan for viewing images that may be larger than the available
+display area, a HistogramPanel for live tonal statistics and a
+LayersPanel for the adjustment layer stack.
 """
+import importlib
 import tkinter as tk
 import customtkinter as ctk
-import cv2
-from PIL import Image, ImageTk
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+ImageTk = lazy_import("PIL.ImageTk")
+
+# Rectangle helpers shared with the engine and the view-side pyramid
+rect_contains = importlib.import_module("16_region").rect_contains
+ImagePyramid = importlib.import_module("5_image_pyramid").ImagePyramid
 
 
 class ScrollableImageCanvas(ctk.CTkFrame):
     """
     Custom frame widget for displaying images with scrollbars.
     
-    Displays images with automatic scaling and provides both vertical
-    and horizontal scrollbars for navigation.
+    Shows the image at a view zoom that is independent of the edit
+    scale: only the visible viewport is sampled (from a pyramid of the
+    displayed frame when zoomed out) and uploaded. The mouse wheel zooms
+    around the cursor, dragging pans, and the view fits the window until
+    the user zooms. Partial updates are drawn as patch overlays, and
+    Shift+drag selects a rectangle.
     """
     
+    # View zoom limits and wheel step
+    MIN_ZOOM = 0.02
+    MAX_ZOOM = 32.0
+    ZOOM_STEP = 1.25
+    
+    # Canvas background (also used for areas outside the image)
+    BG = "#1a1a1a"
+    
     def __init__(self, master, **kwargs):
         """Initialize scrollable canvas with configured layout."""
         super().__init__(master, **kwargs)
@@ -27,44 +51,475 @@ class ScrollableImageCanvas(ctk.CTkFrame):
         self.grid_columnconfigure(0, weight=1)
 
         # Create main canvas
-        self.canvas = tk.Canvas(self, bg="#1a1a1a", highlightthickness=0)
+        self.canvas = tk.Canvas(self, bg=self.BG, highlightthickness=0)
         self.canvas.grid(row=0, column=0, sticky="nsew")
 
         # Create vertical scrollbar
-        self.v_scroll = ctk.CTkScrollbar(self, orientation="vertical", command=self.canvas.yview)
+        self.v_scroll = ctk.CTkScrollbar(self, orientation="vertical", command=self.yview)
         self.v_scroll.grid(row=0, column=1, sticky="ns")
         
         # Create horizontal scrollbar
-        self.h_scroll = ctk.CTkScrollbar(self, orientation="horizontal", command=self.canvas.xview)
+        self.h_scroll = ctk.CTkScrollbar(self, orientation="horizontal", command=self.xview)
         self.h_scroll.grid(row=1, column=0, sticky="ew")
-
-        # Bind scrollbars to canvas
-        self.canvas.configure(yscrollcommand=self.v_scroll.set, xscrollcommand=self.h_scroll.set)
         
         # Store reference to current Tkinter image
         self.current_tk_image = None
+        
+        # Displayed frame and its pyramid (levels built when zoomed out)
+        self.image = None
+        self.pyramid = None
+        
+        # View transform: canvas point (u, v) shows image point (ox + u / zoom, oy + v / zoom)
+        self.zoom = 1.0
+        self.ox = 0.0
+        self.oy = 0.0
+        self.fit_mode = True
+        
+        # Patch overlays drawn over the viewport: (canvas rect, item, Tkinter image)
+        self.patches = []
+        
+        # Called with the new zoom after the view changes (set by the App)
+        self.on_view_change = None
+        
+        # Shift+drag selects a rectangle; on_select(rect or None) is set by the App
+        self.on_select = None
+        self._drag_start = None
+        self.canvas.bind("<Shift-ButtonPress-1>", self.on_select_start)
+        self.canvas.bind("<Shift-B1-Motion>", self.on_select_drag)
+        self.canvas.bind("<Shift-ButtonRelease-1>", self.on_select_end)
+        
+        # Plain drag pans, the wheel zooms (Button-4/5 on X11)
+        self._pan_start = None
+        self.canvas.bind("<ButtonPress-1>", self.on_pan_start)
+        self.canvas.bind("<B1-Motion>", self.on_pan_drag)
+        self.canvas.bind("<ButtonRelease-1>", self.on_pan_end)
+        self.canvas.bind("<MouseWheel>", lambda e: self.on_wheel(e, 1 if e.delta > 0 else -1))
+        self.canvas.bind("<Button-4>", lambda e: self.on_wheel(e, 1))
+        self.canvas.bind("<Button-5>", lambda e: self.on_wheel(e, -1))
+        
+        # Selection outline in image pixels (redrawn when the view moves)
+        self.selection = None
 
-    def update_image(self, cv_img):
-        """Update canvas to display new image."""
+    def viewport_size(self):
+        """Return the canvas size in pixels."""
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def update_image(self, cv_img, dirty=None, previous=None):
+        """Show a new frame, or only its dirty (x, y, w, h) rectangle if it differs from the shown frame (previous) only there."""
         # Clear canvas if image is None
         if cv_img is None:
             self.canvas.delete("all")
+            self.patches = []
+            self.image = None
+            self.pyramid = None
+            self.current_tk_image = None
+            return
+        
+        # Same frame changed in place, or a frame differing from the shown
+        # one only inside dirty: refresh pyramid levels and redraw that area
+        if (dirty is not None and self.current_tk_image is not None
+                and (cv_img is self.image or previous is self.image)
+                and cv_img.shape == self.image.shape):
+            self.image = cv_img
+            self.pyramid.rebase(cv_img, dirty)
+            self.redraw_rect(dirty)
             return
+        
+        # New frame: keep the view unless the size changed while fitting
+        resized = self.image is None or self.image.shape[:2] != cv_img.shape[:2]
+        self.image = cv_img
+        self.pyramid = ImagePyramid(cv_img)
+        if self.fit_mode and resized:
+            self.fit()
+        else:
+            self.clamp_view()
+            self.redraw()
+
+    def display_bytes(self):
+        """Return bytes held by the view: pyramid levels and uploaded Tkinter images (4 bytes per pixel)."""
+        total = self.pyramid.nbytes() if self.pyramid is not None else 0
+        photos = [self.current_tk_image] + [tk_img for _rect, _item, tk_img in self.patches]
+        for photo in photos:
+            if photo is not None:
+                total += photo.width() * photo.height() * 4
+        return total
+
+    def sample(self, u0, v0, w, h):
+        """Return the BGR view pixels of canvas rectangle (u0, v0, w, h)."""
+        # Smallest pyramid level still at least as dense as the screen
+        level = 0
+        while level < self.pyramid.max_level() and 0.5 ** (level + 1) >= self.zoom:
+            level += 1
+        src = self.pyramid.level(level)
+        f = src.shape[1] / self.image.shape[1]
+        
+        # Pixel-centre mapping from canvas pixels to level pixels (same for
+        # the whole viewport and any patch, so patches line up exactly)
+        a = f / self.zoom
+        m = np.array([
+            [a, 0, (self.ox + (u0 + 0.5) / self.zoom) * f - 0.5],
+            [0, a, (self.oy + (v0 + 0.5) / self.zoom) * f - 0.5],
+        ])
+        interp = cv2.INTER_NEAREST if self.zoom >= 2 else cv2.INTER_LINEAR
+        bg = tuple(int(self.BG[i:i + 2], 16) for i in (5, 3, 1))
+        return cv2.warpAffine(src, m, (w, h), flags=interp | cv2.WARP_INVERSE_MAP,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=bg)
+
+    def to_photo(self, bgr):
+        """Convert BGR pixels to a Tkinter image."""
+        # Convert BGR to RGB color space, then to PIL and Tkinter formats
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        return ImageTk.PhotoImage(Image.fromarray(rgb))
+
+    def redraw(self):
+        """Sample and upload the whole viewport."""
+        if self.image is None:
+            return
+        w, h = self.viewport_size()
+        self.current_tk_image = self.to_photo(self.sample(0, 0, w, h))
+        
+        # Clear previous image and overlays, then display the viewport
+        self.canvas.delete("all")
+        self.patches = []
+        self.canvas.create_image(0, 0, anchor="nw", image=self.current_tk_image)
+        self.draw_selection()
+        self.update_scrollbars()
+        if self.on_view_change is not None:
+            self.on_view_change(self.zoom)
 
-        # Convert BGR to RGB color space
-        rgb = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
+    def redraw_rect(self, rect):
+        """Upload the viewport area showing image rectangle rect as an overlay patch."""
+        # Image rectangle in canvas pixels, clipped to the viewport
+        x, y, w, h = rect
+        cw, ch = self.viewport_size()
+        u0 = max(0, int((x - self.ox) * self.zoom))
+        v0 = max(0, int((y - self.oy) * self.zoom))
+        u1 = min(cw, int(np.ceil((x + w - self.ox) * self.zoom)))
+        v1 = min(ch, int(np.ceil((y + h - self.oy) * self.zoom)))
+        if u1 <= u0 or v1 <= v0:
+            return
         
-        # Convert to PIL Image format
-        pil = Image.fromarray(rgb)
+        crect = (u0, v0, u1 - u0, v1 - v0)
+        tk_img = self.to_photo(self.sample(*crect))
         
-        # Convert to Tkinter-compatible format
-        self.current_tk_image = ImageTk.PhotoImage(pil)
+        # Drop overlays the new patch hides completely
+        keep = []
+        for old_rect, item, old_img in self.patches:
+            if rect_contains(crect, old_rect):
+                self.canvas.delete(item)
+            else:
+                keep.append((old_rect, item, old_img))
+        
+        # New patch on top, below the selection outline
+        item = self.canvas.create_image(u0, v0, anchor="nw", image=tk_img)
+        self.patches = keep + [(crect, item, tk_img)]
+        self.canvas.tag_raise("selection")
+
+    def fit(self):
+        """Fit the whole image into the window (never enlarging it) and redraw."""
+        self.fit_mode = True
+        if self.image is None:
+            return
+        cw, ch = self.viewport_size()
+        h, w = self.image.shape[:2]
+        self.zoom = min(1.0, cw / w, ch / h)
+        self.clamp_view()
+        self.redraw()
+
+    def set_zoom(self, zoom, anchor=None):
+        """Zoom to zoom around canvas point anchor (the viewport centre by default) and redraw."""
+        if self.image is None:
+            return
+        cw, ch = self.viewport_size()
+        u, v = anchor if anchor is not None else (cw / 2, ch / 2)
         
-        # Clear previous image
+        # Keep the image point under the anchor in place
+        zoom = min(self.MAX_ZOOM, max(self.MIN_ZOOM, zoom))
+        ix, iy = self.ox + u / self.zoom, self.oy + v / self.zoom
+        self.zoom = zoom
+        self.ox, self.oy = ix - u / zoom, iy - v / zoom
+        self.fit_mode = False
+        self.clamp_view()
+        self.redraw()
+
+    def clamp_view(self):
+        """Keep the image on screen: centred when smaller than the viewport, inside it otherwise."""
+        if self.image is None:
+            return
+        cw, ch = self.viewport_size()
+        h, w = self.image.shape[:2]
+        vw, vh = cw / self.zoom, ch / self.zoom
+        self.ox = (w - vw) / 2 if vw >= w else min(max(self.ox, 0.0), w - vw)
+        self.oy = (h - vh) / 2 if vh >= h else min(max(self.oy, 0.0), h - vh)
+
+    def update_scrollbars(self):
+        """Show the visible fraction of the image on the scrollbars."""
+        cw, ch = self.viewport_size()
+        h, w = self.image.shape[:2]
+        self.h_scroll.set(max(0.0, self.ox / w), min(1.0, (self.ox + cw / self.zoom) / w))
+        self.v_scroll.set(max(0.0, self.oy / h), min(1.0, (self.oy + ch / self.zoom) / h))
+
+    def scroll(self, axis, *args):
+        """Handle scrollbar commands ('moveto', fraction) and ('scroll', n, 'units' | 'pages')."""
+        if self.image is None:
+            return
+        size = self.image.shape[1] if axis == "x" else self.image.shape[0]
+        span = (self.viewport_size()[0] if axis == "x" else self.viewport_size()[1]) / self.zoom
+        pos = self.ox if axis == "x" else self.oy
+        if args[0] == "moveto":
+            pos = float(args[1]) * size
+        elif args[0] == "scroll":
+            step = span * 0.9 if args[2] == "pages" else 40 / self.zoom
+            pos += int(args[1]) * step
+        if axis == "x":
+            self.ox = pos
+        else:
+            self.oy = pos
+        self.clamp_view()
+        self.redraw()
+
+    def xview(self, *args):
+        """Horizontal scrollbar command."""
+        self.scroll("x", *args)
+
+    def yview(self, *args):
+        """Vertical scrollbar command."""
+        self.scroll("y", *args)
+
+    def on_wheel(self, event, direction):
+        """Zoom in or out around the cursor."""
+        factor = self.ZOOM_STEP if direction > 0 else 1 / self.ZOOM_STEP
+        self.set_zoom(self.zoom * factor, (event.x, event.y))
+
+    def on_pan_start(self, event):
+        """Begin dragging the view."""
+        self._pan_start = (event.x, event.y, self.ox, self.oy)
+
+    def on_pan_drag(self, event):
+        """Move the view with the pointer."""
+        if self._pan_start is None or self.image is None:
+            return
+        x, y, ox, oy = self._pan_start
+        self.ox = ox - (event.x - x) / self.zoom
+        self.oy = oy - (event.y - y) / self.zoom
+        self.clamp_view()
+        self.redraw()
+
+    def on_pan_end(self, event):
+        """Finish dragging the view."""
+        self._pan_start = None
+
+    def on_resize(self):
+        """Re-fit (or re-clamp) the view after the window size changed; no edit work is redone."""
+        if self.fit_mode:
+            self.fit()
+        else:
+            self.clamp_view()
+            self.redraw()
+
+    def to_image(self, u, v):
+        """Return the image coordinates of canvas point (u, v)."""
+        return self.ox + u / self.zoom, self.oy + v / self.zoom
+
+    def show_selection(self, rect):
+        """Set the selection outline to rect (x, y, w, h in image pixels), or remove it for None."""
+        self.selection = rect
+        self.draw_selection()
+
+    def draw_selection(self):
+        """Draw the selection outline at the current view transform."""
+        self.canvas.delete("selection")
+        if self.selection is not None:
+            x, y, w, h = self.selection
+            u0, v0 = (x - self.ox) * self.zoom, (y - self.oy) * self.zoom
+            u1, v1 = (x + w - self.ox) * self.zoom, (y + h - self.oy) * self.zoom
+            self.canvas.create_rectangle(u0, v0, u1, v1, outline="#4a90ff", dash=(4, 2), width=2, tags="selection")
+
+    def on_select_start(self, event):
+        """Begin a Shift+drag selection."""
+        self._drag_start = self.to_image(event.x, event.y)
+
+    def on_select_drag(self, event):
+        """Show the selection rectangle while dragging."""
+        if self._drag_start is not None:
+            self.show_selection(self.drag_rect(event))
+
+    def on_select_end(self, event):
+        """Report the finished selection (a plain Shift+click clears it)."""
+        if self._drag_start is None:
+            return
+        rect = self.drag_rect(event)
+        self._drag_start = None
+        if rect is not None and (rect[2] < 2 or rect[3] < 2):
+            rect = None
+        self.show_selection(rect)
+        if self.on_select is not None:
+            self.on_select(rect)
+
+    def drag_rect(self, event):
+        """Return the (x, y, w, h) image rectangle between the drag start and event, clipped to the image."""
+        if self.image is None:
+            return None
+        x0, y0 = self._drag_start
+        x1, y1 = self.to_image(event.x, event.y)
+        h, w = self.image.shape[:2]
+        xa, xb = sorted((min(max(x0, 0), w), min(max(x1, 0), w)))
+        ya, yb = sorted((min(max(y0, 0), h), min(max(y1, 0), h)))
+        return (int(xa), int(ya), int(xb - xa), int(yb - ya))
+
+
+class HistogramPanel(ctk.CTkFrame):
+    """
+    Compact live histogram with per-channel statistics.
+    
+    Draws one curve per channel and lists min, max, mean and clipped
+    percentage below it.
+    """
+    
+    # Curve colours for BGR channels (single channel drawn in gray)
+    CHANNEL_COLORS = ("#4a90ff", "#4ade80", "#ff5a5a")
+    
+    def __init__(self, master, width=256, height=90, **kwargs):
+        """Initialize histogram canvas and statistics label."""
+        super().__init__(master, **kwargs)
+        
+        # Plot area size
+        self.plot_w = width
+        self.plot_h = height
+        
+        # Create histogram canvas
+        self.canvas = tk.Canvas(self, width=width, height=height, bg="#1a1a1a", highlightthickness=0)
+        self.canvas.pack(pady=(0, 4))
+        
+        # Create statistics label
+        self.stats_label = ctk.CTkLabel(self, text="", font=("Courier", 10), justify="left", anchor="w")
+        self.stats_label.pack(fill="x")
+
+    def update_histogram(self, result):
+        """Redraw from a (histogram, stats) pair as returned by ImageModel.histogram."""
+        # Clear previous plot
         self.canvas.delete("all")
+        if result is None:
+            self.stats_label.configure(text="")
+            return
         
-        # Display new image
-        self.canvas.create_image(0, 0, anchor="nw", image=self.current_tk_image)
+        hist, stats = result
+        
+        # Shared vertical scale, ignoring the clipped end bins so they don't flatten the curve
+        peak = max(float(hist[:, 1:255].max()), 1.0)
+        
+        # Draw one polyline per channel
+        single = hist.shape[0] == 1
+        for c, row in enumerate(hist):
+            color = "#cccccc" if single else self.CHANNEL_COLORS[c % 3]
+            xs = np.linspace(0, self.plot_w - 1, 256)
+            ys = self.plot_h - 1 - np.minimum(row / peak, 1.0) * (self.plot_h - 2)
+            self.canvas.create_line(*np.column_stack([xs, ys]).ravel().tolist(), fill=color)
+        
+        # Format per-channel statistics
+        names = ("L",) if single else ("B", "G", "R")
+        lines = [
+            f"{n} min {s['min']:3d} max {s['max']:3d} mean {s['mean']:5.1f} clip {s['clipped']:4.1f}%"
+            for n, s in zip(names, stats)
+        ]
+        self.stats_label.configure(text="\n".join(lines))
+
+
+class LayersPanel(ctk.CTkFrame):
+    """
+    Editor for a LayerStack.
+    
+    Lists layers top-down (last applied first) with a visibility switch,
+    reorder and delete buttons and one slider per parameter. Changes are
+    reported through callbacks; the panel never touches the model.
+    
+    on_action(action, index=None, name=None, params=None, new_index=None)
+    commits an edit; on_preview(index, params) is called while a
+    parameter slider is dragged.
+    """
+    
+    def __init__(self, master, filters, on_action, on_preview, **kwargs):
+        """Initialize add row and empty layer list."""
+        super().__init__(master, **kwargs)
+        
+        # Registered filters by name and the App callbacks
+        self.filters = filters
+        self.on_action = on_action
+        self.on_preview = on_preview
+        
+        # Add row: filter menu and button
+        add_row = ctk.CTkFrame(self, fg_color="transparent")
+        add_row.pack(fill="x", pady=(0, 6))
+        self.add_var = ctk.StringVar(value=next(iter(filters)))
+        ctk.CTkOptionMenu(add_row, values=list(filters), variable=self.add_var, width=130).pack(side="left", padx=(0, 5))
+        ctk.CTkButton(add_row, text="Add Layer", width=90,
+                      command=lambda: self.on_action("add", name=self.add_var.get())).pack(side="left")
+        
+        # Layer rows
+        self.list_frame = ctk.CTkScrollableFrame(self, width=320, height=300)
+        self.list_frame.pack(fill="both", expand=True)
+
+    def update_layers(self, state):
+        """Rebuild the rows from LayerStack.state() output."""
+        for child in self.list_frame.winfo_children():
+            child.destroy()
+        
+        # Empty stack hint
+        if not state:
+            ctk.CTkLabel(self.list_frame, text="No layers", text_color="gray").pack(pady=10)
+            return
+        
+        # Topmost layer first, like an image editor's layer list
+        for index in reversed(range(len(state))):
+            self.build_row(index, state[index], len(state))
+
+    def build_row(self, index, layer, count):
+        """Create the controls for one layer."""
+        row = ctk.CTkFrame(self.list_frame, corner_radius=8)
+        row.pack(fill="x", pady=3, padx=2)
+        
+        # Header: visibility, name, order and delete buttons
+        head = ctk.CTkFrame(row, fg_color="transparent")
+        head.pack(fill="x", padx=5, pady=(4, 0))
+        visible = ctk.BooleanVar(value=layer["enabled"])
+        ctk.CTkCheckBox(head, text=layer["name"], variable=visible, width=140,
+                        command=lambda: self.on_action("toggle", index=index)).pack(side="left")
+        ctk.CTkButton(head, text="✕", width=26, command=lambda: self.on_action("remove", index=index)).pack(side="right", padx=1)
+        if index > 0:
+            ctk.CTkButton(head, text="▼", width=26,
+                          command=lambda: self.on_action("move", index=index, new_index=index - 1)).pack(side="right", padx=1)
+        if index < count - 1:
+            ctk.CTkButton(head, text="▲", width=26,
+                          command=lambda: self.on_action("move", index=index, new_index=index + 1)).pack(side="right", padx=1)
+        
+        # One slider per parameter with a declared range
+        ranges = self.filters[layer["name"]].ranges
+        for key, value in layer["params"].items():
+            if key in ranges:
+                self.build_param(row, index, key, value, ranges[key])
+
+    def build_param(self, parent, index, key, value, limits):
+        """Create a labelled slider for one layer parameter."""
+        sub = ctk.CTkFrame(parent, fg_color="transparent")
+        sub.pack(fill="x", padx=5, pady=(0, 4))
+        integer = isinstance(value, int)
+        
+        # Label with current value
+        fmt = (lambda v: f"{key}: {int(v)}") if integer else (lambda v: f"{key}: {v:.2f}")
+        lbl = ctk.CTkLabel(sub, text=fmt(value), width=90, anchor="w", font=("Arial", 11))
+        lbl.pack(side="left")
+        
+        # Preview while dragging, commit one undo step on release
+        def on_drag(v):
+            v = int(v) if integer else float(v)
+            lbl.configure(text=fmt(v))
+            self.on_preview(index, {key: v})
+        
+        def on_release(_event):
+            v = int(slider.get()) if integer else float(slider.get())
+            self.on_action("params", index=index, params={key: v})
         
-        # Update scroll region based on image size
-        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+        slider = ctk.CTkSlider(sub, from_=limits[0], to=limits[1], height=16, command=on_drag)
+        slider.set(value)
+        slider.pack(side="left", fill="x", expand=True, padx=5)
+        slider.bind("<ButtonRelease-1>", on_release)
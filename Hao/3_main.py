@@ -4,6 +4,11 @@ Main application class for image editor GUI.
 Provides a complete graphical interface for image processing with controls
 for effects, adjustments, transformations, and file operations.
 """
+import time
+
+# Startup timer (before any heavy import)
+STARTUP_T0 = time.perf_counter()
+
 import sys
 import os
 from pathlib import Path
@@ -14,16 +19,49 @@ sys.path.insert(0, str(Path(__file__).parent))
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
-import cv2
-from PIL import Image, ImageTk, ImageDraw
 import importlib
+import threading
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
 
 # Import modules dynamically (updated names)
 image_processing_module = importlib.import_module("1_image_processing")
 image_display_module = importlib.import_module("2_image_display")
+session_module = importlib.import_module("6_session")
+edit_journal_module = importlib.import_module("8_edit_journal")
+op_registry_module = importlib.import_module("12_op_registry")
+memory_profiler_module = importlib.import_module("18_memory_profiler")
+result_cache_module = importlib.import_module("19_result_cache")
+auto_tune_module = importlib.import_module("21_auto_tune")
+render_process_module = importlib.import_module("23_render_process")
+metadata_save_module = importlib.import_module("25_metadata_save")
 
 ImageModel = image_processing_module.ImageModel
 ScrollableImageCanvas = image_display_module.ScrollableImageCanvas
+HistogramPanel = image_display_module.HistogramPanel
+LayersPanel = image_display_module.LayersPanel
+Session = session_module.Session
+RenderError = session_module.RenderError
+rect_scale = importlib.import_module("16_region").rect_scale
+EditJournal = edit_journal_module.EditJournal
+FILTERS = op_registry_module.REGISTRY
+MemoryProfiler = memory_profiler_module.MemoryProfiler
+LeakCheck = memory_profiler_module.LeakCheck
+memory_report = memory_profiler_module.memory_report
+format_report = memory_profiler_module.format_report
+ResultCache = result_cache_module.ResultCache
+calibrate = auto_tune_module.calibrate
+load_profile = auto_tune_module.load_profile
+save_profile = auto_tune_module.save_profile
+RenderProcess = render_process_module.RenderProcess
+save_image = metadata_save_module.save_image
+
+
+# Menu icons already rasterized at their display size
+ICON_SIZE = 18
+ICON_CACHE_DIR = Path.home() / ".assignment3" / "icons"
 
 
 # Set application theme
@@ -39,7 +77,8 @@ class App(ctk.CTk):
     between the model and view components.
     """
     
-    def __init__(self):
+    def __init__(self, tile_threads=None, high_depth=False, memory_debug=False, auto_tune=True,
+                 render_process=False, speculate=True):
         """Initialize main application window."""
         super().__init__()
 
@@ -48,10 +87,43 @@ class App(ctk.CTk):
         self.geometry("1100x750")
         self.protocol("WM_DELETE_WINDOW", self.confirm_exit)
 
-        # Initialize model
-        self.model = ImageModel()
+        # Initialize session (documents share a render pool and memory budget)
+        # with the performance profile tuned for this machine, if any
+        profile = load_profile()
+        self.session = Session(tile_threads=tile_threads, profile=profile, speculate=speculate)
+        self._tuning = None
+        
+        # Idle time before likely next renders are speculated on (any
+        # input cancels the speculation and restarts the timer)
+        self.speculate_after_ms = 400
+        self._speculate_job = None
+        
+        # Optional render process: documents render outside the Tk process
+        # and hand frames over through shared memory
+        self.renderer = RenderProcess(profile) if render_process else None
+        
+        # Open new files at their stored bit depth (16-bit / float)
+        self.high_depth = tk.BooleanVar(value=high_depth)
+        
+        # Memory report window, tracemalloc snapshots and the optional
+        # debug check that asserts on growth without new history entries
+        self.profiler = MemoryProfiler()
+        self.leak_check = LeakCheck(strict=True) if memory_debug else None
+        self.memory_window = None
+        self.memory_text = None
+        
+        # Disk cache of filter results shared with batch runs (off if not writable)
+        try:
+            self.result_cache = ResultCache()
+        except OSError:
+            self.result_cache = None
         
         # UI state
+        self._resize_jobs = {}
+        self.layers_window = None
+        self.layers_panel = None
+        self._layers_shown = None
+        self._layer_preview = None
         self.menu_icons = {}
         self.load_menu_icons()
         self.slider_labels = {} 
@@ -61,15 +133,251 @@ class App(ctk.CTk):
         self.build_status_bar()
         self.build_controls()
         
-        # Add image display area
-        self.image_area = ScrollableImageCanvas(self, fg_color="#1a1a1a", corner_radius=0)
-        self.image_area.pack(side="top", fill="both", expand=True)
+        # Add tabbed image display area with one empty document
+        self.tabs = ctk.CTkTabview(self, fg_color="#1a1a1a", corner_radius=0, command=self.on_tab_change)
+        self.tabs.pack(side="top", fill="both", expand=True)
+        self.new_tab()
 
         # Bind resize event
         self.bind("<Configure>", self.on_resize)
+        self.bind("<Escape>", lambda e: self.on_select(None))
+        for sequence in ("<Any-KeyPress>", "<Any-ButtonPress>", "<MouseWheel>"):
+            self.bind_all(sequence, self.on_input, add="+")
+
+        # Start polling for finished background renders
+        self.after(16, self.poll_renders)
+
+        # Offer to recover edits from sessions that crashed
+        self.after(200, self.offer_recovery)
+
+        # First start on this machine: tune in the background
+        if profile is None and auto_tune:
+            self.after(1000, self.tune_performance)
+
+        # Seconds from process start until the window was first drawn
+        self.startup_time = None
+
+    @property
+    def model(self):
+        """Return the model of the active document."""
+        return self.session.active.model
+
+    @property
+    def image_area(self):
+        """Return the canvas of the active document."""
+        return self.session.active.view
+
+    def new_tab(self):
+        """Create an empty document with its own tab and canvas."""
+        # Register document in the session
+        doc = self.session.new_document()
+        doc.model.result_cache = self.result_cache
+        doc.model.renderer = self.renderer
+
+        # Build the tab and its canvas
+        tab = self.tabs.add(doc.name)
+        doc.view = ScrollableImageCanvas(tab, fg_color="#1a1a1a", corner_radius=0)
+        doc.view.pack(fill="both", expand=True)
+        doc.view.on_select = self.on_select
+        doc.view.on_view_change = self.update_status
+        self.tabs.set(doc.name)
+        return doc
+
+    def close_tab(self):
+        """Close the active document, asking to save unsaved changes."""
+        doc = self.session.active
+        
+        # Check for unsaved changes
+        if self.model.is_modified and self.model.current_img is not None:
+            answer = messagebox.askyesnocancel(
+                "Unsaved Changes", 
+                f"Save changes to {doc.title()} before closing?"
+            )
+            
+            # Handle user response
+            if answer is True:
+                # Cancel if save failed
+                if not self.save(): 
+                    return 
+            elif answer is None:
+                # Cancel operation
+                return
+
+        # Closed cleanly, so nothing to recover
+        if doc.model.journal is not None:
+            doc.model.journal.discard()
+            doc.model.journal = None
+
+        # Remove tab and document
+        if self.leak_check is not None:
+            self.leak_check.forget(doc.model)
+        self.session.close_document(doc)
+        if self.renderer is not None:
+            self.renderer.forget(doc.model)
+        self.tabs.delete(doc.name)
+
+        # Always keep one (possibly empty) document open
+        if not self.session.documents:
+            self.new_tab()
+        self.tabs.set(self.session.active.name)
+        self.on_tab_change()
+
+    def on_tab_change(self):
+        """Activate the document of the selected tab."""
+        # Find document by tab name
+        name = self.tabs.get()
+        for doc in self.session.documents:
+            if doc.name == name:
+                self.session.active = doc
+
+        # Show its state
+        self.sync_sliders()
+        self.refresh()
+
+    def start_journal(self, path):
+        """Begin a fresh edit journal for the active document."""
+        if self.model.journal is not None:
+            self.model.journal.discard()
+        self.model.journal = EditJournal.create(path, high_depth=self.model.high_depth)
+
+    def offer_recovery(self):
+        """Offer to replay journals left behind by a crash or forced close."""
+        for path in EditJournal.pending():
+            records = EditJournal.read(path)
+            
+            # Nothing to recover without edits after the open record
+            if len(records) < 2:
+                path.unlink()
+                continue
+            
+            # Ask user about recovering
+            source = records[0]["params"]["path"]
+            if not messagebox.askyesno(
+                "Recover Edits", 
+                f"{len(records) - 1} unsaved edit(s) to {os.path.basename(source)} were found. Recover them?"
+            ):
+                path.unlink()
+                continue
+            
+            # Replay into an empty tab
+            if self.model.original_img is not None:
+                self.new_tab()
+            try:
+                self.model.replay(records)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not recover edits: {e}")
+                path.unlink()
+                continue
+            
+            # Keep appending to the recovered journal
+            self.model.journal = EditJournal(path)
+            doc = self.session.active
+            name = self.session.unique_name(doc.title())
+            self.tabs.rename(doc.name, name)
+            doc.name = name
+            self.sync_sliders()
+            self.refresh()
+
+    def report_startup(self, quit_after=False):
+        """Measure time from process start to the first drawn window."""
+        # Make sure the window is actually on screen
+        self.update_idletasks()
+        self.startup_time = time.perf_counter() - STARTUP_T0
+        
+        # Show in status bar and console
+        self.status_label.configure(text=f"Ready (started in {self.startup_time:.2f} s)")
+        print(f"Startup time: {self.startup_time * 1000:.0f} ms")
+        
+        if quit_after:
+            self.shutdown()
+
+    def tune_performance(self):
+        """Benchmark this machine on a background thread, then save and apply the profile."""
+        if self._tuning is not None:
+            return
+        result = {}
+        
+        def run():
+            # Errors are reported on the UI thread
+            try:
+                result["profile"] = calibrate(log=lambda _msg: None)
+            except Exception as e:
+                result["error"] = e
+        
+        self._tuning = threading.Thread(target=run, name="auto-tune", daemon=True)
+        self._tuning.start()
+        self.status_label.configure(text="Tuning performance for this machine...")
+        self.after(250, self.poll_tuning, result)
+
+    def poll_tuning(self, result):
+        """Apply the tuned profile once calibration has finished."""
+        if self._tuning.is_alive():
+            self.after(250, self.poll_tuning, result)
+            return
+        self._tuning = None
+        if "error" in result:
+            self.status_label.configure(text=f"Performance tuning failed: {result['error']}")
+            return
+        
+        # Settings change under no render (the band runner may be replaced)
+        for doc in self.session.documents:
+            self.session.wait(doc)
+        self.session.set_profile(result["profile"])
+        if self.renderer is not None:
+            self.renderer.set_profile(result["profile"])
+        try:
+            save_profile(result["profile"])
+        except OSError:
+            pass
+        profile = result["profile"]
+        self.status_label.configure(
+            text=f"Tuned in {profile['seconds']:.1f} s: {profile['tile_threads']} band threads, "
+                 f"blur box from {profile['blur_box_from']}, pyramid from {profile['blur_pyr_from']}, "
+                 f"undo {profile['undo_codec']} {profile['undo_level']}"
+        )
+
+    def shutdown(self):
+        """Discard journals of a clean exit and quit."""
+        for doc in self.session.documents:
+            if doc.model.journal is not None:
+                doc.model.journal.discard()
+        if self.renderer is not None:
+            self.renderer.close()
+        
+        # Stop the render pool, speculation and band threads (restores the
+        # OpenCV thread count)
+        self.session.shutdown()
+        self.quit()
+
+    def render(self, layer=None, **settings):
+        """Re-render the active document on the shared worker pool with new model settings."""
+        self.session.render(self.session.active, layer, **settings)
+
+    def poll_renders(self):
+        """Show finished background renders and reschedule polling."""
+        try:
+            # Failed renders do not hold back the documents collected with them
+            failed = None
+            try:
+                finished = self.session.collect()
+            except RenderError as e:
+                finished, failed = e.finished, e
+
+            # Refresh only when the active document changed
+            if self.session.active in finished:
+                self.refresh()
+
+            # After the refresh, which resets the status bar
+            if failed is not None:
+                self.status_label.configure(text=f"Render failed: {failed}")
+        except Exception as e:
+            # A failed render must not stop polling for the next ones
+            self.status_label.configure(text=f"Render failed: {e}")
+        finally:
+            self.after(16, self.poll_renders)
 
     def load_menu_icons(self):
-        """Load or create menu icons from files."""
+        """Load menu icons from the on-disk cache, rasterizing missing or stale ones."""
         # Icon names to load
         icon_names = ["open", "save", "save_as", "undo", "redo", "close"]
         
@@ -77,37 +385,61 @@ class App(ctk.CTk):
         base_dir = os.path.dirname(os.path.abspath(__file__))
         icon_path = os.path.join(base_dir, "icons") 
 
-        # Load or create each icon
+        # Load each icon (Tk decodes the cached PNG directly, no PIL needed)
         for name in icon_names:
             path = os.path.join(icon_path, f"{name}.png")
+            cached = ICON_CACHE_DIR / f"{name}_{ICON_SIZE}.png"
             
-            # Load from file if exists, otherwise create placeholder
-            if os.path.exists(path):
-                img = Image.open(path)
-            else:
-                # Create blank white rectangle as placeholder
-                img = Image.new('RGBA', (20, 20), (0, 0, 0, 0))
-                d = ImageDraw.Draw(img)
-                d.rectangle([2,2,18,18], fill="white")
-            
-            # Resize icon to 18x18 pixels
-            img = img.resize((18, 18), Image.Resampling.LANCZOS)
-            
-            # Ensure RGBA format
-            if img.mode != 'RGBA': 
-                img = img.convert('RGBA')
-            
-            # Extract alpha channel
-            r, g, b, a = img.split()
-            
-            # Create white background
-            white_bg = Image.new('RGB', img.size, (255, 255, 255))
-            
-            # Combine with alpha for proper display
-            img = Image.merge('RGBA', (*white_bg.split(), a))
+            # Rebuild cache entry if missing or older than the source
+            stale = not cached.exists() or (
+                os.path.exists(path) and os.path.getmtime(path) > cached.stat().st_mtime
+            )
+            if stale:
+                try:
+                    self.rasterize_icon(path, cached)
+                except OSError:
+                    # Cache not writable: fall back to an in-memory icon
+                    from PIL import ImageTk
+                    self.menu_icons[name] = ImageTk.PhotoImage(self.rasterize_icon(path))
+                    continue
             
-            # Convert to PhotoImage
-            self.menu_icons[name] = ImageTk.PhotoImage(img)
+            self.menu_icons[name] = tk.PhotoImage(file=str(cached))
+
+    def rasterize_icon(self, path, cached=None):
+        """Render icon file (or a placeholder) at ICON_SIZE as white-on-alpha and optionally cache it."""
+        # PIL is only needed when the cache is cold
+        from PIL import Image, ImageDraw
+        
+        # Load from file if exists, otherwise create placeholder
+        if os.path.exists(path):
+            img = Image.open(path)
+        else:
+            # Create blank white rectangle as placeholder
+            img = Image.new('RGBA', (20, 20), (0, 0, 0, 0))
+            d = ImageDraw.Draw(img)
+            d.rectangle([2,2,18,18], fill="white")
+        
+        # Resize icon to 18x18 pixels
+        img = img.resize((ICON_SIZE, ICON_SIZE), Image.Resampling.LANCZOS)
+        
+        # Ensure RGBA format
+        if img.mode != 'RGBA': 
+            img = img.convert('RGBA')
+        
+        # Extract alpha channel
+        r, g, b, a = img.split()
+        
+        # Create white background
+        white_bg = Image.new('RGB', img.size, (255, 255, 255))
+        
+        # Combine with alpha for proper display
+        img = Image.merge('RGBA', (*white_bg.split(), a))
+        
+        # Store in the cache for the next launch
+        if cached is not None:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            img.save(cached)
+        return img
 
     def build_native_menu(self):
         """Build native menu bar with File and Edit menus."""
@@ -131,6 +463,9 @@ class App(ctk.CTk):
         file_menu.add_command(label=" Open", image=self.menu_icons["open"], compound="left", command=self.open_image)
         file_menu.add_command(label=" Save", image=self.menu_icons["save"], compound="left", command=self.save)
         file_menu.add_command(label=" Save As", image=self.menu_icons["save_as"], compound="left", command=self.save_as)
+        file_menu.add_command(label=" Close Tab", image=self.menu_icons["close"], compound="left", command=self.close_tab)
+        file_menu.add_separator()
+        file_menu.add_checkbutton(label=" 16-bit Mode", variable=self.high_depth)
         file_menu.add_separator()
         file_menu.add_command(label=" Exit", image=self.menu_icons["close"], compound="left", command=self.confirm_exit)
 
@@ -139,6 +474,24 @@ class App(ctk.CTk):
         menubar.add_cascade(label="Edit", menu=edit_menu)
         edit_menu.add_command(label=" Undo", image=self.menu_icons["undo"], compound="left", command=self.undo)
         edit_menu.add_command(label=" Redo", image=self.menu_icons["redo"], compound="left", command=self.redo)
+        edit_menu.add_separator()
+        edit_menu.add_command(label=" Layers...", command=self.show_layers)
+
+        # View menu (display zoom only; the Resize slider changes the image)
+        view_menu = tk.Menu(menubar, **menu_theme)
+        menubar.add_cascade(label="View", menu=view_menu)
+        view_menu.add_command(label=" Fit to Window", accelerator="Ctrl+0", command=lambda: self.image_area.fit())
+        view_menu.add_command(label=" Actual Pixels", accelerator="Ctrl+1", command=lambda: self.image_area.set_zoom(1.0))
+        view_menu.add_command(label=" Zoom In", accelerator="Ctrl++", command=lambda: self.zoom_view(1))
+        view_menu.add_command(label=" Zoom Out", accelerator="Ctrl+-", command=lambda: self.zoom_view(-1))
+        self.bind("<Control-0>", lambda e: self.image_area.fit())
+        self.bind("<Control-1>", lambda e: self.image_area.set_zoom(1.0))
+        self.bind("<Control-equal>", lambda e: self.zoom_view(1))
+        self.bind("<Control-plus>", lambda e: self.zoom_view(1))
+        self.bind("<Control-minus>", lambda e: self.zoom_view(-1))
+        view_menu.add_separator()
+        view_menu.add_command(label=" Memory Report...", command=self.show_memory)
+        view_menu.add_command(label=" Tune Performance", command=self.tune_performance)
 
     def build_status_bar(self):
         """Build status bar at bottom of window."""
@@ -176,6 +529,12 @@ class App(ctk.CTk):
         ctk.CTkButton(col1, text="Grayscale", width=100, command=self.grayscale).pack(pady=5)
         ctk.CTkButton(col1, text="Edge Detect", width=100, command=self.edge).pack(pady=5)
 
+        # Registered filters (those without a dedicated button), applied with defaults
+        names = [n for n in FILTERS if n not in ("grayscale", "edge")]
+        self.filter_var = ctk.StringVar(value=names[0])
+        ctk.CTkOptionMenu(col1, values=names, variable=self.filter_var, width=100).pack(pady=5)
+        ctk.CTkButton(col1, text="Apply Filter", width=100, command=self.apply_filter).pack(pady=5)
+
         # Middle column - Adjustments
         col2 = ctk.CTkFrame(control_frame, fg_color="transparent")
         col2.pack(side="left", fill="x", expand=True, padx=20, pady=10)
@@ -199,7 +558,7 @@ class App(ctk.CTk):
             # Update label text on drag
             def on_drag_wrapper(val):
                 # Format value for display
-                if name == "Blur" or name == "Brightness": 
+                if name in ("Blur", "Brightness", "Edge Low", "Edge High"): 
                     display_val = int(val)
                 else: 
                     display_val = f"{val:.2f}"
@@ -256,6 +615,8 @@ class App(ctk.CTk):
         self.s_ct = make_slider(col2, "Contrast", 0.5, 2.0, 1.0, self.on_ct_change, self.on_release, show_reset=True)
         self.s_bl = make_slider(col2, "Blur", 0, 20, 0, self.on_bl_change, self.on_release, show_reset=True)
         self.s_sz = make_slider(col2, "Resize", 0.1, 3.0, 1.0, self.on_sz_change, self.on_release, show_reset=True)
+        self.s_el = make_slider(col2, "Edge Low", 0, 500, 100, self.on_el_change, self.on_release, show_reset=True)
+        self.s_eh = make_slider(col2, "Edge High", 0, 500, 200, self.on_eh_change, self.on_release, show_reset=True)
 
         # Right column - Transformations
         col3 = ctk.CTkFrame(control_frame, fg_color="transparent")
@@ -271,14 +632,79 @@ class App(ctk.CTk):
         ctk.CTkButton(row, text="Flip H", width=60, command=self.flip_h).pack(side="left", padx=2)
         ctk.CTkButton(row, text="Flip V", width=60, command=self.flip_v).pack(side="left", padx=2)
 
+        # Histogram column (packed after TRANSFORM so it sits left of it)
+        col4 = ctk.CTkFrame(control_frame, fg_color="transparent")
+        col4.pack(side="right", fill="y", padx=10, pady=10)
+        
+        # Histogram section
+        ctk.CTkLabel(col4, text="HISTOGRAM", font=("Arial", 12, "bold")).pack(anchor="w", pady=(0,5))
+        self.histogram = HistogramPanel(col4, fg_color="transparent")
+        self.histogram.pack()
+
     def refresh(self):
         """Update display and status information."""
+        # Render process mode: ops only mark the frame stale; show the
+        # current one now and the new one when it arrives
+        if self.model.frame_stale:
+            self.render()
+        
         # Skip if no image loaded
         if self.model.current_img is None: 
+            self.histogram.update_histogram(None)
+            self.title("Assignment 3")
+            self.status_label.configure(text="Ready")
             return
         
-        # Update canvas with current image
-        self.image_area.update_image(self.model.current_img)
+        # Update canvas with current image (only the changed rectangle in selection mode)
+        self.image_area.update_image(*self.model.display_image(*self.model.take_frame()))
+        roi = rect_scale(self.model.roi, self.model.scale) if self.model.roi is not None else None
+        self.image_area.show_selection(roi)
+        
+        # Update histogram from the cached pre-tonal statistics
+        self.histogram.update_histogram(self.model.histogram())
+        
+        # Keep the layers window in step with undo, redo and tab changes
+        self.update_layers_panel()
+        
+        # Status bar and window title
+        self.update_status()
+
+        # Keep all documents within the shared memory budget
+        self.session.enforce_budget()
+        
+        # Debug mode: growth without new history entries raises here
+        if self.leak_check is not None:
+            self.leak_check.check(self.model, self.image_area)
+        self.update_memory_report()
+        
+        # Use the idle time that follows for likely next renders
+        self.schedule_speculation()
+
+    def schedule_speculation(self):
+        """(Re)start the idle timer after which the active document is speculated on."""
+        if self.session.speculator is None:
+            return
+        if self._speculate_job is not None:
+            self.after_cancel(self._speculate_job)
+        self._speculate_job = self.after(self.speculate_after_ms, self.start_speculation)
+
+    def start_speculation(self):
+        """Speculate on the active document if nothing is rendering."""
+        self._speculate_job = None
+        doc = self.session.active
+        if doc is not None and not doc.model.frame_stale:
+            self.session.speculate(doc)
+
+    def on_input(self, _event=None):
+        """Cancel speculation on any key, click or wheel event and wait for idle time again."""
+        if self.session.speculator is not None:
+            self.session.cancel_speculation()
+            self.schedule_speculation()
+
+    def update_status(self, _zoom=None):
+        """Show file, resolution, view zoom, edit scale and selection in the status bar."""
+        if self.model.current_img is None:
+            return
         
         # Get image dimensions
         h, w = self.model.current_img.shape[:2]
@@ -289,9 +715,14 @@ class App(ctk.CTk):
         # Get filename for display
         file_name = os.path.basename(self.model.img_path) if self.model.img_path else "Untitled"
         
-        # Update status bar with file info and image stats
+        # Selection size, if adjustments are limited to one
+        roi = rect_scale(self.model.roi, self.model.scale) if self.model.roi is not None else None
+        selection = f"  |  Selection: {roi[2]} x {roi[3]} px" if roi is not None else ""
+        
+        # View zoom only changes the display; edit scale changes the saved pixels
         self.status_label.configure(
-            text=f"File: {file_name}{mod_mark}  |  Resolution: {w} x {h} px  |  Zoom: {self.model.scale:.1f}x"
+            text=f"File: {file_name}{mod_mark}  |  Resolution: {w} x {h} px  |  "
+                 f"View: {self.image_area.zoom * 100:.0f}%  |  Edit scale: {self.model.scale:.2f}x{selection}"
         )
         
         # Update window title
@@ -304,67 +735,87 @@ class App(ctk.CTk):
         self.s_ct.set(self.model.contrast)
         self.s_bl.set(self.model.blur)
         self.s_sz.set(self.model.scale)
+        self.s_el.set(self.model.edge_low)
+        self.s_eh.set(self.model.edge_high)
         
         # Update slider labels
         self.slider_labels["Brightness"].configure(text=f"Brightness: {self.model.brightness}")
         self.slider_labels["Contrast"].configure(text=f"Contrast: {self.model.contrast:.2f}")
         self.slider_labels["Blur"].configure(text=f"Blur: {self.model.blur}")
         self.slider_labels["Resize"].configure(text=f"Resize: {self.model.scale:.2f}")
+        self.slider_labels["Edge Low"].configure(text=f"Edge Low: {self.model.edge_low}")
+        self.slider_labels["Edge High"].configure(text=f"Edge High: {self.model.edge_high}")
 
     def on_resize(self, event):
-        """Handle window resize event."""
-        pass
+        """Re-fit the view whose canvas changed size (the edit pipeline is not re-run)."""
+        # Configure fires for every widget; only image canvases matter
+        for doc in self.session.documents:
+            if doc.view is not None and event.widget is doc.view.canvas:
+                # Coalesce the burst of events during a drag-resize
+                job = self._resize_jobs.pop(doc.view, None)
+                if job is not None:
+                    self.after_cancel(job)
+                self._resize_jobs[doc.view] = self.after(50, self.resize_view, doc.view)
+
+    def resize_view(self, view):
+        """Apply a pending resize to view."""
+        self._resize_jobs.pop(view, None)
+        if view.winfo_exists():
+            view.on_resize()
     
     def confirm_exit(self):
         """Ask user to save before exiting if there are unsaved changes."""
+        # Collect documents with unsaved changes
+        unsaved = [d for d in self.session.documents if d.model.is_modified and d.model.current_img is not None]
+        
         # Check for unsaved changes
-        if self.model.is_modified and self.model.current_img is not None:
+        if unsaved:
             # Ask user about saving
             answer = messagebox.askyesnocancel(
                 "Unsaved Changes", 
-                "You have unsaved changes. Do you want to save before exiting?"
+                f"You have unsaved changes in {len(unsaved)} image(s). Do you want to save before exiting?"
             )
             
             # Handle user response
             if answer is True:
-                # Save and exit if successful
-                if self.save(): 
-                    self.quit()
+                # Save each document and exit if all succeeded
+                for doc in unsaved:
+                    self.tabs.set(doc.name)
+                    self.on_tab_change()
+                    if not self.save():
+                        return
+                self.shutdown()
             elif answer is False:
                 # Exit without saving
-                self.quit()
+                self.shutdown()
         else:
             # Ask confirmation if no changes
             if messagebox.askyesno("Confirm Exit", "Are you sure you want to exit?"):
-                self.quit()
+                self.shutdown()
 
     def open_image(self):
-        """Open image file dialog and load image."""
-        # Check for unsaved changes
-        if self.model.is_modified and self.model.current_img is not None:
-            # Ask about saving
-            answer = messagebox.askyesnocancel(
-                "Unsaved Changes", 
-                "You have unsaved changes. Save before opening new image?"
-            )
-            
-            # Handle user response
-            if answer is True:
-                # Cancel if save failed
-                if not self.save(): 
-                    return 
-            elif answer is None:
-                # Cancel operation
-                return
-
+        """Open image file dialog and load image into a new tab."""
         # Show file dialog
-        p = filedialog.askopenfilename(filetypes=[("Images", "*.jpg *.png *.bmp")])
+        p = filedialog.askopenfilename(filetypes=[("Images", "*.jpg *.png *.bmp *.tif *.tiff")])
         
         # Load image if selected
         if p:
+            # Reuse the active tab only if it is still empty
+            new_doc = self.model.original_img is not None
+            if new_doc:
+                self.new_tab()
+            
             try:
-                # Load image
+                # Load image (at full depth in 16-bit mode) and start its edit journal
+                self.model.high_depth = self.high_depth.get()
                 self.model.open_image(p)
+                self.start_journal(p)
+                
+                # Name the tab after the file
+                doc = self.session.active
+                name = self.session.unique_name(doc.title())
+                self.tabs.rename(doc.name, name)
+                doc.name = name
                 
                 # Update UI
                 self.sync_sliders()
@@ -372,12 +823,19 @@ class App(ctk.CTk):
             except ValueError:
                 # Handle corrupted files
                 messagebox.showerror("Error", "Could not load image. The file might be corrupted or unsupported.")
+                if new_doc:
+                    self.close_tab()
             except Exception as e:
                 # Handle other errors
                 messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+                if new_doc:
+                    self.close_tab()
     
     def save(self):
         """Save image to current file path."""
+        # Save the latest settings, not a frame still being rendered
+        self.session.wait(self.session.active)
+        
         # Check if image exists
         if self.model.current_img is None:
             messagebox.showwarning("Warning", "No image loaded to save!")
@@ -386,11 +844,13 @@ class App(ctk.CTk):
         # Save to existing path
         if self.model.img_path:
             try:
-                # Write image
-                cv2.imwrite(self.model.img_path, self.model.current_img)
+                # Write image (losslessly if only rotated/flipped, with the source's metadata)
+                save_image(self.model, self.model.img_path)
                 
-                # Update state
+                # Update state (the saved file becomes the journal source)
                 self.model.is_modified = False
+                if self.model.journal is not None:
+                    self.model.journal.reset(self.model.img_path, self.model.high_depth)
                 
                 # Update display
                 self.refresh()
@@ -408,6 +868,9 @@ class App(ctk.CTk):
             
     def save_as(self):
         """Save image to new file path."""
+        # Save the latest settings, not a frame still being rendered
+        self.session.wait(self.session.active)
+        
         # Check if image exists
         if self.model.current_img is None:
             messagebox.showwarning("Warning", "No image loaded to save!")
@@ -416,18 +879,20 @@ class App(ctk.CTk):
         # Show save dialog
         p = filedialog.asksaveasfilename(
             defaultextension=".jpg", 
-            filetypes=[("JPEG", "*.jpg"), ("PNG", "*.png"), ("BMP", "*.bmp")]
+            filetypes=[("JPEG", "*.jpg"), ("PNG", "*.png"), ("TIFF", "*.tif"), ("BMP", "*.bmp")]
         )
         
         # Save if path selected
         if p:
             try:
-                # Write image
-                cv2.imwrite(p, self.model.current_img)
+                # Write image (losslessly if only rotated/flipped, with the source's metadata)
+                save_image(self.model, p)
                 
-                # Update path and state
+                # Update path and state (the saved file becomes the journal source)
                 self.model.img_path = p
                 self.model.is_modified = False
+                if self.model.journal is not None:
+                    self.model.journal.reset(p, self.model.high_depth)
                 
                 # Update display
                 self.refresh()
@@ -445,6 +910,7 @@ class App(ctk.CTk):
     def undo(self):
         """Undo last action."""
         # Execute undo and refresh if successful
+        self.session.wait(self.session.active)
         if self.model.undo(): 
             self.sync_sliders()
             self.refresh()
@@ -452,75 +918,223 @@ class App(ctk.CTk):
     def redo(self):
         """Redo last undone action."""
         # Execute redo and refresh if successful
+        self.session.wait(self.session.active)
         if self.model.redo(): 
             self.sync_sliders()
             self.refresh()
 
     def grayscale(self):
         """Apply grayscale effect."""
-        # Apply and refresh
+        # Apply and refresh (after any in-flight render finishes)
+        self.session.wait(self.session.active)
         self.model.grayscale()
         self.refresh()
     
     def edge(self):
-        """Apply edge detection effect."""
-        # Apply and refresh
+        """Toggle the edge detection stage."""
+        # Apply and refresh (after any in-flight render finishes)
+        self.session.wait(self.session.active)
         self.model.edge()
         self.refresh()
     
+    def apply_filter(self):
+        """Apply the filter selected in the effects menu."""
+        # Apply and refresh (after any in-flight render finishes)
+        self.session.wait(self.session.active)
+        self.model.apply_filter(self.filter_var.get())
+        self.refresh()
+    
+    def on_select(self, rect):
+        """Limit adjustments to a rectangle selected on the canvas (None selects everything)."""
+        if self.model.original_img is None:
+            return
+        
+        # Canvas pixels are rendered pixels; the model keeps base image pixels
+        self.session.wait(self.session.active)
+        if rect is not None:
+            s = self.model.scale
+            rect = (round(rect[0] / s), round(rect[1] / s), round(rect[2] / s), round(rect[3] / s))
+        
+        # The adjustment made so far stays; the sliders start afresh
+        if self.model.select(rect):
+            self.sync_sliders()
+            self.refresh()
+
+    def zoom_view(self, direction):
+        """Zoom the active view in or out one step around its centre."""
+        view = self.image_area
+        factor = view.ZOOM_STEP if direction > 0 else 1 / view.ZOOM_STEP
+        view.set_zoom(view.zoom * factor)
+
+    def show_layers(self):
+        """Open (or raise) the adjustment layers window."""
+        if self.layers_window is not None and self.layers_window.winfo_exists():
+            self.layers_window.lift()
+            return
+        
+        # Tool window with the layer editor
+        self.layers_window = ctk.CTkToplevel(self)
+        self.layers_window.title("Layers")
+        self.layers_window.geometry("380x420")
+        self.layers_panel = LayersPanel(self.layers_window, FILTERS, self.layer_action, self.layer_preview)
+        self.layers_panel.pack(fill="both", expand=True, padx=10, pady=10)
+        self._layers_shown = None
+        self.update_layers_panel()
+
+    def show_memory(self):
+        """Open (or raise) the memory report window."""
+        if self.memory_window is not None and self.memory_window.winfo_exists():
+            self.memory_window.lift()
+            self.update_memory_report()
+            return
+        
+        # Report text with refresh and tracemalloc snapshot buttons
+        self.memory_window = ctk.CTkToplevel(self)
+        self.memory_window.title("Memory")
+        self.memory_window.geometry("640x480")
+        buttons = ctk.CTkFrame(self.memory_window, fg_color="transparent")
+        buttons.pack(side="top", fill="x", padx=10, pady=(10, 0))
+        ctk.CTkButton(buttons, text="Refresh", width=90, command=self.update_memory_report).pack(side="left")
+        ctk.CTkButton(buttons, text="Tracemalloc Snapshot", width=160, command=self.memory_snapshot).pack(side="left", padx=6)
+        self.memory_text = ctk.CTkTextbox(self.memory_window, font=("Courier", 12), wrap="none")
+        self.memory_text.pack(fill="both", expand=True, padx=10, pady=10)
+        self.update_memory_report()
+
+    def update_memory_report(self, extra=None):
+        """Show the active document's memory breakdown (and extra text) in the memory window."""
+        if self.memory_window is None or not self.memory_window.winfo_exists():
+            return
+        text = format_report(memory_report(self.model, self.image_area))
+        text += f"\n\nAll documents: {self.session.budget.usage(self.session.documents) / 1024 ** 2:.1f} MB"
+        if extra:
+            text += "\n\n" + extra
+        self.memory_text.delete("1.0", "end")
+        self.memory_text.insert("1.0", text)
+
+    def memory_snapshot(self):
+        """Take a tracemalloc snapshot and show the allocation sites that grew."""
+        self.update_memory_report(self.profiler.snapshot())
+
+    def update_layers_panel(self):
+        """Rebuild the layers window if the active stack changed."""
+        if self.layers_window is None or not self.layers_window.winfo_exists():
+            return
+        state = self.model.layers.state()
+        if state != self._layers_shown:
+            self.layers_panel.update_layers(state)
+            self._layers_shown = state
+
+    def layer_preview(self, index, params):
+        """Show a layer parameter while its slider is dragged (no undo step yet)."""
+        # Remember the value before the drag so the release records one undo step from it
+        if self._layer_preview is None:
+            layer = self.model.layers.layers[index]
+            self._layer_preview = (index, dict(layer.params))
+        self.render(layer=(index, params))
+
+    def layer_action(self, action, **kwargs):
+        """Commit a layer edit as one undo step."""
+        # Wait for any in-flight render before changing the stack
+        self.session.wait(self.session.active)
+        if self.model.original_img is None:
+            return
+        
+        # Undo must return to the value before the slider drag began
+        if self._layer_preview is not None:
+            index, params = self._layer_preview
+            self.model.layers.layers[index].params = params
+            self._layer_preview = None
+        
+        self.model.edit_layer(action, **kwargs)
+        self.refresh()
+    
     def rotate(self, a):
         """Rotate image by angle."""
-        # Apply and refresh
+        # Apply and refresh (after any in-flight render finishes)
+        self.session.wait(self.session.active)
         self.model.rotate(a)
+        self.sync_sliders()
         self.refresh()
     
     def flip_h(self):
         """Flip image horizontally."""
-        # Apply and refresh
+        # Apply and refresh (after any in-flight render finishes)
+        self.session.wait(self.session.active)
         self.model.flip_h()
+        self.sync_sliders()
         self.refresh()
     
     def flip_v(self):
         """Flip image vertically."""
-        # Apply and refresh
+        # Apply and refresh (after any in-flight render finishes)
+        self.session.wait(self.session.active)
         self.model.flip_v()
+        self.sync_sliders()
         self.refresh()
 
     def on_release(self, e):
         """Handle slider release event."""
+        # Settings held back by a running render are written first
+        self.session.wait(self.session.active)
+        
         # Push undo state after slider adjustment
-        self.model.push_undo()
+        self.model.push_undo(
+            "adjust", 
+            brightness=self.model.brightness, 
+            contrast=self.model.contrast, 
+            blur=self.model.blur, 
+            scale=self.model.scale,
+            edge_low=self.model.edge_low,
+            edge_high=self.model.edge_high,
+            roi=list(self.model.roi) if self.model.roi is not None else None
+        )
     
     def on_br_change(self, v):
         """Handle brightness slider change."""
-        # Update brightness and refresh
-        self.model.brightness = int(v)
-        self.model.apply_all()
-        self.refresh()
+        # Update brightness and render in background
+        self.render(brightness=int(v))
     
     def on_ct_change(self, v):
         """Handle contrast slider change."""
-        # Update contrast and refresh
-        self.model.contrast = float(v)
-        self.model.apply_all()
-        self.refresh()
+        # Update contrast and render in background
+        self.render(contrast=float(v))
     
     def on_bl_change(self, v):
         """Handle blur slider change."""
-        # Update blur and refresh
-        self.model.blur = int(v)
-        self.model.apply_all()
-        self.refresh()
+        # Update blur and render in background
+        self.render(blur=int(v))
     
     def on_sz_change(self, v):
         """Handle resize slider change."""
-        # Update scale and refresh
-        self.model.scale = float(v)
-        self.model.apply_all()
-        self.refresh()
+        # Update scale and render in background
+        self.render(scale=float(v))
+    
+    def on_el_change(self, v):
+        """Handle edge low threshold slider change."""
+        # Update threshold; only hysteresis reruns while the edge stage is on
+        if self.model.edge_on:
+            self.render(edge_low=int(v))
+        else:
+            self.session.set_settings(self.session.active, edge_low=int(v))
+    
+    def on_eh_change(self, v):
+        """Handle edge high threshold slider change."""
+        # Update threshold; only hysteresis reruns while the edge stage is on
+        if self.model.edge_on:
+            self.render(edge_high=int(v))
+        else:
+            self.session.set_settings(self.session.active, edge_high=int(v))
 
 
 if __name__ == "__main__":
-    # Create and run application
-    app = App()
+    # Create and run application (--startup-time reports launch time and exits,
+    # --threads N renders large images in N parallel bands, --high-depth
+    # starts in 16-bit mode, --memory-debug asserts on unexplained growth,
+    # --render-process renders outside the Tk process, --no-speculation
+    # leaves idle time unused)
+    threads = int(sys.argv[sys.argv.index("--threads") + 1]) if "--threads" in sys.argv else None
+    app = App(tile_threads=threads, high_depth="--high-depth" in sys.argv, memory_debug="--memory-debug" in sys.argv,
+              auto_tune="--startup-time" not in sys.argv, render_process="--render-process" in sys.argv,
+              speculate="--no-speculation" not in sys.argv)
+    app.after(0, app.report_startup, "--startup-time" in sys.argv)
     app.mainloop()
@@ -0,0 +1,242 @@
+"""
+BlurEngine class for fast Gaussian-style blurring.
+
+Picks a blur strategy from the kernel size (direct Gaussian for small
+kernels, stacked box filters or downsample-blur-upsample for large ones)
+and caches results per kernel so dragging the Blur slider back and forth
+reuses earlier work.
+
+Error bounds against the exact cv2.GaussianBlur with the same kernel size,
+measured on 8-bit photographic content of 4 MP and more by
+``python benchmark.py blur`` (and checked by regression.py):
+
+    gaussian  (k < box_from)              exact
+    box       (box_from <= k < pyr_from)  max 2 levels, mean < 0.35
+    pyramid   (k >= pyr_from)             max 4 levels, mean < 0.6
+
+Small frames hold finer detail per kernel width, where the box path errs
+by up to 6 levels (mean 1.1) at 0.1 MP. The pyramid resamples whole 2x2
+cells (keeping its grid aligned on odd frame sizes) and blurs the border
+strips exactly.
+
+blur_rect() blurs one rectangle with the same strategy. The Gaussian and
+box filters read only a fixed halo around each pixel, so the rectangle
+plus that halo gives exactly the pixels of the whole-frame result; the
+pyramid's resampling grid depends on the frame size, so that strategy
+blurs the whole frame (cached like blur()).
+"""
+import threading
+import importlib
+from collections import OrderedDict
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+def kernel_sigma(k):
+    """Return the sigma OpenCV derives for a Gaussian kernel of size k."""
+    return 0.3 * ((k - 1) * 0.5 - 1) + 0.8
+
+
+def box_sizes(sigma, passes=3):
+    """Return odd box widths whose stacked passes approximate a Gaussian."""
+    # Ideal width for n equal boxes with the same variance
+    ideal = np.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(np.floor(ideal))
+    if lower % 2 == 0:
+        lower -= 1
+    upper = lower + 2
+
+    # Number of passes using the lower width so the variance matches
+    m = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if i < m else upper for i in range(passes)]
+
+
+class BlurEngine:
+    """
+    Strategy-selecting blur with a per-kernel result cache.
+
+    Results are cached for the most recent source image; passing a
+    different source array clears the cache. The cache may be filled from
+    another thread with prefetch() (see 24_speculation).
+    """
+
+    def __init__(self, box_from=13, pyr_from=17, max_cache=6):
+        """Initialize engine with strategy thresholds and cache size."""
+        # Kernel sizes where the faster approximations take over
+        self.box_from = box_from
+        self.pyr_from = pyr_from
+
+        # Cached results for the current source, keyed by kernel size
+        self.max_cache = max_cache
+        self._cache = OrderedDict()
+        self._source = None
+        self._lock = threading.Lock()
+
+        # Optional TileRunner for splitting large frames into bands
+        self.tiles = None
+
+    def strategy(self, k):
+        """Return the strategy name used for kernel size k."""
+        if k >= self.pyr_from:
+            return "pyramid"
+        if k >= self.box_from:
+            return "box"
+        return "gaussian"
+
+    def halo(self, k):
+        """Return the context (pixels on each side) a crop needs for the exact result of kernel k, or None if only the whole frame gives it."""
+        strategy = self.strategy(k)
+        if strategy == "gaussian":
+            return k // 2
+        if strategy == "box":
+            return sum(size // 2 for size in box_sizes(kernel_sigma(k)))
+        return None
+
+    def blur_rect(self, img, rect, k, cache=True):
+        """Return rectangle (x, y, w, h) of blur(img, k), computing only the rectangle plus the halo where that is exact.
+
+        cache=False leaves the result cache alone (for images other than
+        the one the pipeline blurs).
+        """
+        x, y, w, h = rect
+        halo = self.halo(k)
+        if halo is None:
+            out = self.blur(img, k) if cache else self._compute(img, k)
+            return out[y:y + h, x:x + w]
+
+        # The rectangle plus the halo; at the frame border both see the same reflection
+        x0, y0 = max(0, x - halo), max(0, y - halo)
+        x1, y1 = min(img.shape[1], x + w + halo), min(img.shape[0], y + h + halo)
+        out = self._compute(img[y0:y1, x0:x1], k)
+        return out[y - y0:y - y0 + h, x - x0:x - x0 + w]
+
+    def clear(self):
+        """Drop all cached results."""
+        with self._lock:
+            self._cache.clear()
+            self._source = None
+
+    def cache_bytes(self):
+        """Return the number of bytes held by cached results."""
+        with self._lock:
+            return sum(img.nbytes for img in self._cache.values())
+
+    def blur(self, img, k, cache=True):
+        """Blur img with an odd kernel size k, reusing cached results.
+
+        cache=False blurs without touching the cache (for images blurred
+        once, such as video frames).
+        """
+        if not cache:
+            return self._compute(img, k)
+        with self._lock:
+            # Reset cache when the source image changes
+            if img is not self._source:
+                self._cache.clear()
+                self._source = img
+
+            # Return cached result if available
+            if k in self._cache:
+                self._cache.move_to_end(k)
+                return self._cache[k]
+
+        out = self._compute(img, k)
+        with self._lock:
+            self._store(img, k, out)
+        return out
+
+    def prefetch(self, k):
+        """Compute the blur with kernel k of the most recent source into the cache, if not there yet."""
+        with self._lock:
+            img = self._source
+            if img is None or k in self._cache:
+                return
+        out = self._compute(img, k)
+        with self._lock:
+            self._store(img, k, out)
+
+    def _compute(self, img, k):
+        """Blur img with the strategy for kernel size k."""
+        strategy = self.strategy(k)
+        if strategy == "pyramid":
+            return self._pyramid_blur(img, k)
+        if strategy == "box":
+            return self._box_blur(img, k)
+        if self.tiles is not None:
+            return self.tiles.gaussian_blur(img, k)
+        return cv2.GaussianBlur(img, (k, k), 0)
+
+    def _store(self, img, k, out):
+        """Cache out for kernel k if img is still the source, evicting least recently used entries (lock held)."""
+        if img is not self._source:
+            return
+        self._cache[k] = out
+        while len(self._cache) > self.max_cache:
+            self._cache.popitem(last=False)
+
+    def _box_blur(self, img, k):
+        """Approximate a Gaussian with three stacked box filters."""
+        if self.tiles is not None:
+            return self.tiles.box_blur(img, box_sizes(kernel_sigma(k)))
+        out = img
+        for size in box_sizes(kernel_sigma(k)):
+            out = cv2.blur(out, (size, size))
+        return out
+
+    def _pyramid_blur(self, img, k, factor=2):
+        """Approximate a Gaussian by blurring a downsampled copy (the border strips exactly)."""
+        h, w = img.shape[:2]
+        sigma = kernel_sigma(k)
+
+        # Strips along the border where the pyramid reflects at another edge
+        # than cv2.GaussianBlur; frames not much wider are blurred exactly
+        border = k // 2 + factor
+        if min(h, w) <= 4 * border:
+            return cv2.GaussianBlur(img, (k, k), 0)
+
+        # Downsample whole factor x factor cells with area averaging, so both
+        # resamplers use exactly this factor (an odd last row or column lies
+        # in the border strips)
+        h_even, w_even = h - h % factor, w - w % factor
+        small = cv2.resize(img[:h_even, :w_even], (w_even // factor, h_even // factor), interpolation=cv2.INTER_AREA)
+
+        # Remove the variance already added by the area and linear resamplers
+        extra = (factor * factor - 1) / 12 + factor * factor / 6
+        small_sigma = np.sqrt(max(sigma * sigma - extra, 0.09)) / factor
+        small = cv2.GaussianBlur(small, (0, 0), small_sigma)
+
+        # Upsample back to the source size
+        if self.tiles is not None:
+            up = self.tiles.resize(small, (w_even, h_even))
+        else:
+            up = cv2.resize(small, (w_even, h_even), interpolation=cv2.INTER_LINEAR)
+        if (h_even, w_even) == (h, w):
+            out = up
+        else:
+            out = np.empty_like(img)
+            out[:h_even, :w_even] = up
+
+        # Exact Gaussian in the border strips (each plus its halo, as blur_rect)
+        for x, y, sw, sh in ((0, 0, w, border), (0, h - border, w, border),
+                             (0, border, border, h - 2 * border), (w - border, border, border, h - 2 * border)):
+            out[y:y + sh, x:x + sw] = self._gaussian_rect(img, (x, y, sw, sh), k)
+        return out
+
+    def _gaussian_rect(self, img, rect, k):
+        """Return rectangle (x, y, w, h) of cv2.GaussianBlur(img, (k, k), 0), blurring only the rectangle plus the kernel radius."""
+        x, y, w, h = rect
+        r = k // 2
+        x0, y0 = max(0, x - r), max(0, y - r)
+        x1, y1 = min(img.shape[1], x + w + r), min(img.shape[0], y + h + r)
+        crop = img[y0:y1, x0:x1]
+
+        # The kernel is the same along both axes, and OpenCV filters narrow,
+        # tall crops far slower than the same crop transposed
+        if y1 - y0 > x1 - x0:
+            out = cv2.transpose(cv2.GaussianBlur(cv2.transpose(crop), (k, k), 0))
+        else:
+            out = cv2.GaussianBlur(crop, (k, k), 0)
+        return out[y - y0:y - y0 + h, x - x0:x - x0 + w]
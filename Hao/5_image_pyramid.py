@@ -0,0 +1,130 @@
+"""
+ImagePyramid class for cached multi-resolution copies of an image.
+
+Levels are built lazily by halving the previous level with area
+averaging, so zoom requests can resample from the nearest larger level
+instead of the full-resolution image.
+"""
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+
+
+class ImagePyramid:
+    """
+    Lazily populated mipmap chain for a single base image.
+
+    Level 0 is the base image itself; level i is half the size of
+    level i - 1. Levels stop once either side would drop below min_side.
+    """
+
+    def __init__(self, base, min_side=16, tiles=None):
+        """Initialize pyramid for base image without building any level."""
+        # Base image and smallest allowed level side
+        self.base = base
+        self.min_side = min_side
+
+        # Optional TileRunner for banded linear resampling
+        self.tiles = tiles
+
+        # Built levels (level 0 is always available)
+        self.levels = [base]
+
+    def level(self, i):
+        """Return level i, building missing levels on demand."""
+        # Clamp to the smallest level allowed
+        i = min(i, self.max_level())
+
+        # Build each missing level from the previous one
+        while len(self.levels) <= i:
+            prev = self.levels[-1]
+            half = cv2.resize(prev, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+            self.levels.append(half)
+        return self.levels[i]
+
+    def max_level(self):
+        """Return the index of the smallest level allowed."""
+        h, w = self.base.shape[:2]
+        n = 0
+        while min(h, w) // 2 >= self.min_side:
+            h, w = h // 2, w // 2
+            n += 1
+        return n
+
+    def level_for_scale(self, scale):
+        """Return the index of the smallest level still at least scale times the base."""
+        i = 0
+        while i < self.max_level() and 0.5 ** (i + 1) >= scale:
+            i += 1
+        return i
+
+    def resample(self, scale, interpolation=None):
+        """Return the base image resized by scale, sampled from the nearest larger level."""
+        # Linear interpolation unless told otherwise
+        if interpolation is None:
+            interpolation = cv2.INTER_LINEAR
+
+        # Target size matches cv2.resize with fx = fy = scale
+        h, w = self.base.shape[:2]
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+
+        # Upscale (or no-op) always works from full resolution
+        if scale >= 1.0:
+            if scale == 1.0:
+                return self.base
+            return self._resize(self.base, size, interpolation)
+
+        # Downscale from the nearest larger level; it is less than 2x larger
+        # than the target, so linear sampling no longer aliases
+        src = self.level(self.level_for_scale(scale))
+        if (src.shape[1], src.shape[0]) == size:
+            return src
+        return self._resize(src, size, interpolation)
+
+    def _resize(self, src, size, interpolation):
+        """Resize src to size, in bands when a TileRunner is set."""
+        if self.tiles is not None:
+            return self.tiles.resize(src, size, interpolation)
+        return cv2.resize(src, size, interpolation=interpolation)
+
+    def thumbnail(self, max_side):
+        """Return a copy of the image whose longer side is at most max_side."""
+        h, w = self.base.shape[:2]
+        return self.resample(min(1.0, max_side / max(h, w)))
+
+    def update(self, rect):
+        """Refresh built levels after the base changed in place inside rect (x, y, w, h)."""
+        x0, y0 = rect[0], rect[1]
+        x1, y1 = rect[0] + rect[2], rect[1] + rect[3]
+        for i in range(1, len(self.levels)):
+            prev, level = self.levels[i - 1], self.levels[i]
+
+            # Exact 2x2 averaging only when the previous level has even sides;
+            # otherwise rebuild this and the smaller levels on demand
+            ph, pw = prev.shape[:2]
+            if ph % 2 or pw % 2:
+                del self.levels[i:]
+                return
+
+            # Rectangle on this level, grown to whole 2x2 source blocks
+            x0, y0 = x0 // 2, y0 // 2
+            x1, y1 = min(level.shape[1], (x1 + 1) // 2), min(level.shape[0], (y1 + 1) // 2)
+            if x1 <= x0 or y1 <= y0:
+                return
+            src = prev[2 * y0:2 * y1, 2 * x0:2 * x1]
+            level[y0:y1, x0:x1] = cv2.resize(src, (x1 - x0, y1 - y0), interpolation=cv2.INTER_AREA)
+
+    def rebase(self, base, rect):
+        """Switch to a same-size base that differs from the current one only inside rect and refresh built levels."""
+        self.base = self.levels[0] = base
+        self.update(rect)
+
+    def nbytes(self):
+        """Return bytes held by built levels (excluding the shared base)."""
+        return sum(lvl.nbytes for lvl in self.levels[1:])
+
+    def clear(self):
+        """Drop all built levels except the base."""
+        del self.levels[1:]
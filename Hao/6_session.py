@@ -0,0 +1,300 @@
+"""
+Session classes for editing several images at once.
+
+A Session owns the open documents, one render worker pool shared by all
+of them, a global memory budget that evicts caches and undo history
+from background documents before touching the active one, and the
+idle-time Speculator (see 24_speculation).
+"""
+import os
+import sys
+import importlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Import modules dynamically
+image_processing_module = importlib.import_module("1_image_processing")
+parallel_tiles_module = importlib.import_module("13_parallel_tiles")
+auto_tune_module = importlib.import_module("21_auto_tune")
+speculation_module = importlib.import_module("24_speculation")
+
+ImageModel = image_processing_module.ImageModel
+TileRunner = parallel_tiles_module.TileRunner
+apply_profile = auto_tune_module.apply_profile
+Speculator = speculation_module.Speculator
+
+
+class RenderError(Exception):
+    """Renders that failed in one collect() call, with the documents that finished."""
+
+    def __init__(self, errors, finished):
+        """Initialize error with (document, exception) pairs and the finished documents."""
+        super().__init__("; ".join(f"{doc.title()}: {e}" for doc, e in errors))
+        self.errors = errors
+        self.finished = finished
+
+
+class Document:
+    """
+    One open image with its own model, history and view.
+
+    The view is attached by the GUI; render bookkeeping is managed by
+    the owning Session.
+    """
+
+    def __init__(self, name):
+        """Initialize empty document with the given tab name."""
+        # Tab name and per-document state
+        self.name = name
+        self.model = ImageModel()
+        self.view = None
+
+        # Render bookkeeping for the shared pool
+        self.render_future = None
+        self.render_pending = False
+
+        # Slider settings and layer parameters not yet written to the model
+        # (held back while a worker renders it)
+        self.settings = {}
+        self.layer_params = {}
+
+    def title(self):
+        """Return file name for display."""
+        return os.path.basename(self.model.img_path) if self.model.img_path else "Untitled"
+
+
+class MemoryBudget:
+    """
+    Global memory limit shared by all documents.
+
+    Eviction order: caches of background documents, undo history of
+    background documents (oldest first), caches of the active document,
+    then undo history of the active document down to keep_active entries.
+    Documents with a render in flight are never evicted from.
+    """
+
+    def __init__(self, limit_bytes=2 * 1024 ** 3, keep_active=1):
+        """Initialize budget with byte limit and undo entries kept for the active document."""
+        self.limit_bytes = limit_bytes
+        self.keep_active = keep_active
+
+    def usage(self, documents):
+        """Return total bytes held by all documents."""
+        return sum(doc.model.memory_usage() for doc in documents)
+
+    def enforce(self, documents, active):
+        """Evict until usage fits the limit; return bytes freed."""
+        before = self.usage(documents)
+        if before <= self.limit_bytes:
+            return 0
+
+        # Skip documents whose caches a worker is using right now
+        idle = [doc for doc in documents if doc.render_future is None]
+        background = [doc for doc in idle if doc is not active]
+
+        # Background caches and pyramids first
+        for doc in background:
+            doc.model.drop_caches()
+            if self.usage(documents) <= self.limit_bytes:
+                return before - self.usage(documents)
+
+        # Background undo history, oldest entries first
+        for doc in background:
+            while doc.model.drop_oldest_undo():
+                if self.usage(documents) <= self.limit_bytes:
+                    return before - self.usage(documents)
+
+        # Active document last
+        if active in idle:
+            active.model.drop_caches()
+            while self.usage(documents) > self.limit_bytes and len(active.model.undo_stack) > self.keep_active:
+                active.model.drop_oldest_undo()
+
+        return before - self.usage(documents)
+
+
+class Session:
+    """
+    Set of open documents sharing one render pool and memory budget.
+
+    A tuned profile (see 21_auto_tune) sets the band threads and the
+    settings of every document; an explicit tile_threads overrides it.
+    Every render cancels speculation.
+    """
+
+    def __init__(self, workers=None, budget=None, tile_threads=None, profile=None, speculate=True):
+        """Initialize session with worker count, memory budget, optional band threads, tuned profile and speculation."""
+        # Open documents and the one shown in the UI
+        self.documents = []
+        self.active = None
+
+        # Shared resources
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 2, thread_name_prefix="render")
+        self.budget = budget or MemoryBudget()
+        self.speculator = Speculator() if speculate else None
+
+        # Intra-image parallelism shared by all documents (off unless asked
+        # for or tuned)
+        self.tile_threads = tile_threads
+        self.tiles = None
+        self.profile = None
+        self.set_profile(profile)
+
+    def set_profile(self, profile):
+        """Apply a tuned profile (None for defaults) to the band threads and all open documents."""
+        self.profile = profile
+        settings = profile or {}
+        threads = self.tile_threads if self.tile_threads is not None else settings.get("tile_threads")
+        min_pixels = settings.get("tile_min_pixels", 4_000_000)
+
+        # Rebuild the band runner only when its settings change
+        current = (self.tiles.threads, self.tiles.min_pixels) if self.tiles is not None else None
+        wanted = (threads, min_pixels) if threads and threads > 1 else None
+        if current != wanted:
+            if self.tiles is not None:
+                self.tiles.shutdown()
+            self.tiles = TileRunner(threads, min_pixels=min_pixels) if wanted else None
+
+        for doc in self.documents:
+            doc.model.set_tiles(self.tiles)
+            apply_profile(doc.model, profile)
+
+    def new_document(self):
+        """Create, register and activate an empty document."""
+        doc = Document(self.unique_name("Untitled"))
+        doc.model.set_tiles(self.tiles)
+        apply_profile(doc.model, self.profile)
+        self.documents.append(doc)
+        self.active = doc
+        return doc
+
+    def close_document(self, doc):
+        """Remove document from the session and activate a neighbour."""
+        # Wait for an in-flight render before dropping the model
+        self.cancel_speculation()
+        if doc.render_future is not None:
+            doc.render_future.result()
+
+        idx = self.documents.index(doc)
+        self.documents.remove(doc)
+        if self.active is doc:
+            self.active = self.documents[min(idx, len(self.documents) - 1)] if self.documents else None
+
+    def unique_name(self, base):
+        """Return a tab name based on base that no open document uses."""
+        names = {doc.name for doc in self.documents}
+        if base not in names:
+            return base
+        n = 2
+        while f"{base} ({n})" in names:
+            n += 1
+        return f"{base} ({n})"
+
+    def render(self, doc, layer=None, **settings):
+        """Re-render document on the shared pool with new model settings (and (index, params) for a layer), coalescing requests while one is running."""
+        self.buffer_settings(doc, layer, settings)
+
+        # Only one render per document at a time; the latest state wins
+        if doc.render_future is not None and not doc.render_future.done():
+            doc.render_pending = True
+            return
+        doc.render_pending = False
+        self.cancel_speculation()
+        self.apply_settings(doc)
+        doc.render_future = self.pool.submit(doc.model.render)
+
+    def set_settings(self, doc, **settings):
+        """Change model settings without rendering, once no render is in flight."""
+        self.buffer_settings(doc, None, settings)
+        if doc.render_future is None or doc.render_future.done():
+            self.apply_settings(doc)
+
+    def buffer_settings(self, doc, layer, settings):
+        """Hold settings and layer parameters for the next apply_settings."""
+        doc.settings.update(settings)
+        if layer is not None:
+            index, params = layer
+            doc.layer_params.setdefault(index, {}).update(params)
+
+    def apply_settings(self, doc):
+        """Write held settings into the model; only called with no render in flight, so a frame never mixes old and new values."""
+        for index, params in doc.layer_params.items():
+            doc.model.layers.set_params(index, **params)
+        for name, value in doc.settings.items():
+            setattr(doc.model, name, value)
+        doc.layer_params = {}
+        doc.settings = {}
+
+    def wait(self, doc):
+        """Block until the document has no render in flight and its frame is up to date."""
+        self.cancel_speculation()
+        while doc.render_future is not None:
+            fut, doc.render_future = doc.render_future, None
+            fut.result()
+            if doc.render_pending:
+                doc.render_pending = False
+                self.apply_settings(doc)
+                doc.model.render()
+        self.apply_settings(doc)
+
+        # Render process mode: an op marked the frame stale
+        if doc.model.frame_stale:
+            doc.model.render()
+
+    def collect(self):
+        """Return documents whose renders finished since the last call.
+
+        Raises RenderError after every document was collected if any
+        render failed; its finished attribute holds the return value.
+        """
+        finished = []
+        errors = []
+        for doc in self.documents:
+            fut = doc.render_future
+            if fut is None or not fut.done():
+                continue
+
+            # Keep worker errors for after the loop and clear the slot
+            doc.render_future = None
+            try:
+                fut.result()
+            except Exception as e:
+                errors.append((doc, e))
+
+            # Start the coalesced follow-up render (or write settings held
+            # without one), also after a failed render
+            if doc.render_pending:
+                self.render(doc)
+            else:
+                self.apply_settings(doc)
+            finished.append(doc)
+
+        if errors:
+            raise RenderError(errors, finished)
+        return finished
+
+    def speculate(self, doc):
+        """Start idle-time speculation on a document with no render in flight."""
+        if self.speculator is not None and doc.render_future is None:
+            self.speculator.start(doc.model)
+
+    def cancel_speculation(self):
+        """Stop speculation after its step in flight (returns at once)."""
+        if self.speculator is not None:
+            self.speculator.cancel()
+
+    def enforce_budget(self):
+        """Apply the memory budget across all documents."""
+        self.cancel_speculation()
+        return self.budget.enforce(self.documents, self.active)
+
+    def shutdown(self):
+        """Stop the shared worker pools."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.speculator is not None:
+            self.speculator.shutdown()
+        if self.tiles is not None:
+            self.tiles.shutdown()
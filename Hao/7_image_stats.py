@@ -0,0 +1,98 @@
+"""
+ImageStats class for cheap live histograms and channel statistics.
+
+The histogram of the image before brightness/contrast is computed once
+on a subsampled proxy and cached; tonal changes are then applied to the
+histogram itself through the brightness/contrast mapping instead of
+rescanning the rendered image.
+"""
+import importlib
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# High-depth frames are binned on their 8-bit quantization
+to_8bit = importlib.import_module("17_bit_depth").to_8bit
+
+
+class ImageStats:
+    """
+    Cached per-channel histogram of the pre-tonal image.
+
+    Histograms are 256-bin, one row per channel (BGR order for colour
+    images). Statistics are derived from the histogram so they follow
+    the same tonal mapping without touching pixels.
+    """
+
+    def __init__(self, proxy_pixels=1_000_000):
+        """Initialize stats cache with the proxy size in pixels."""
+        # Upper bound on pixels scanned per histogram
+        self.proxy_pixels = proxy_pixels
+
+        # Cached histogram of the last pre-tonal image
+        self._source = None
+        self._hist = None
+
+    def proxy(self, img):
+        """Return a strided view of img with at most proxy_pixels pixels."""
+        h, w = img.shape[:2]
+        step = max(1, int(np.ceil(np.sqrt(h * w / self.proxy_pixels))))
+        return img[::step, ::step]
+
+    def base_histogram(self, img):
+        """Return the cached histogram of img, computing it on first use."""
+        # Rescan only when the pre-tonal image changed
+        if img is not self._source:
+            small = to_8bit(self.proxy(img))
+            channels = 1 if small.ndim == 2 else small.shape[2]
+            self._hist = np.stack([
+                cv2.calcHist([small], [c], None, [256], [0, 256]).ravel()
+                for c in range(channels)
+            ])
+            self._source = img
+        return self._hist
+
+    def histogram(self, img, contrast=1.0, brightness=0):
+        """Return the histogram img would have after tone(img, contrast, brightness)."""
+        hist = self.base_histogram(img)
+
+        # Identity mapping needs no remapping
+        if contrast == 1.0 and brightness == 0:
+            return hist
+
+        # Output bin of every input level, rounded and saturated like tone():
+        # convertScaleAbs mirrors negative 8-bit values, deeper types clip at 0
+        levels = np.arange(256, dtype=np.float64) * contrast + brightness
+        if img.dtype == np.uint8:
+            levels = np.abs(levels)
+        mapping = np.clip(np.rint(levels), 0, 255).astype(np.intp)
+
+        # Move each bin's count to its output level
+        return np.stack([np.bincount(mapping, weights=row, minlength=256) for row in hist])
+
+    def statistics(self, hist):
+        """Return per-channel dicts with min, max, mean and clipped percentage."""
+        levels = np.arange(256)
+        stats = []
+        for row in hist:
+            total = row.sum()
+            if total == 0:
+                stats.append({"min": 0, "max": 0, "mean": 0.0, "clipped": 0.0})
+                continue
+
+            # Occupied range and weighted mean
+            occupied = np.nonzero(row)[0]
+            stats.append({
+                "min": int(occupied[0]),
+                "max": int(occupied[-1]),
+                "mean": float((levels * row).sum() / total),
+                "clipped": float((row[0] + row[255]) / total * 100),
+            })
+        return stats
+
+    def clear(self):
+        """Drop the cached histogram."""
+        self._source = None
+        self._hist = None
@@ -0,0 +1,106 @@
+"""
+EditJournal class for crash-safe, append-only edit logs.
+
+Every undoable operation is appended to a small JSON-lines file as an
+op name plus parameters (never pixels), so a crashed session can be
+rebuilt by replaying the journal against the source image.
+"""
+import os
+import json
+import time
+from pathlib import Path
+
+
+# Default location for journals of open documents
+JOURNAL_DIR = Path.home() / ".assignment3" / "journal"
+
+
+def _owner_alive(path):
+    """Return True if the process that wrote the journal is still running."""
+    # File names are <date>-<time>-<pid>-<n>.jsonl
+    try:
+        pid = int(path.stem.split("-")[2])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return True
+    
+    # Signal 0 probes a process on POSIX; on Windows it would interrupt it
+    if os.name == "nt":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class EditJournal:
+    """
+    Append-only journal for one document.
+
+    The first record is always {"op": "open", "params": {"path": ...,
+    "high_depth": ...}} (the load mode replay must use);
+    later records are operations in the order they were applied. The file
+    exists only while the document has edits that may need recovery.
+    """
+
+    def __init__(self, path):
+        """Initialize journal appending to path (existing records are kept)."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @classmethod
+    def create(cls, source_path, journal_dir=JOURNAL_DIR, high_depth=False):
+        """Start a new journal for an image opened from source_path (at full bit depth if high_depth)."""
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.monotonic_ns() % 10**6}.jsonl"
+        journal = cls(Path(journal_dir) / name)
+        journal.record("open", {"path": os.path.abspath(source_path), "high_depth": high_depth})
+        return journal
+
+    @staticmethod
+    def pending(journal_dir=JOURNAL_DIR):
+        """Return journal files left behind by sessions that did not close cleanly."""
+        journal_dir = Path(journal_dir)
+        if not journal_dir.is_dir():
+            return []
+        
+        # Skip journals of other instances that are still running
+        return sorted(p for p in journal_dir.glob("*.jsonl") if not _owner_alive(p))
+
+    @staticmethod
+    def read(path):
+        """Return the records of a journal file, ignoring a torn last line."""
+        records = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash mid-write can only damage the final line
+                    break
+        return records
+
+    def record(self, op, params=None):
+        """Append one operation and flush it to disk."""
+        line = json.dumps({"op": op, "params": params or {}, "time": time.time()})
+        self._file.write(line + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def reset(self, source_path, high_depth=False):
+        """Restart the journal after the edits were saved to source_path."""
+        self._file.close()
+        self._file = open(self.path, "w", encoding="utf-8")
+        self.record("open", {"path": os.path.abspath(source_path), "high_depth": high_depth})
+
+    def discard(self):
+        """Close and delete the journal (the document closed cleanly)."""
+        self._file.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
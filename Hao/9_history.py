@@ -0,0 +1,212 @@
+"""
+History class for bounded undo/redo stacks.
+
+A deque-backed ring buffer limited by the total bytes of the entries it
+holds rather than by entry count. Frames shared between entries are
+counted once. Shared by the editors in this repository.
+
+CompressedFrame stores snapshot pixels losslessly compressed on a
+background thread and decompresses them only when they are restored.
+"""
+import zlib
+import importlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Heavy modules load on first use (see 0_lazy_imports)
+lazy_import = importlib.import_module("0_lazy_imports").lazy_import
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+# Single background worker so compression never competes with rendering
+_COMPRESSOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="undo-compress")
+
+
+def entry_nbytes(entry):
+    """Return the bytes of pixel data held by an ndarray or a dict of ndarrays."""
+    return sum(frame.nbytes for frame in entry_frames(entry))
+
+
+def entry_frames(entry):
+    """Return the pixel-holding objects (ndarrays, CompressedFrames) of an entry."""
+    if isinstance(entry, dict):
+        return [f for v in entry.values() for f in entry_frames(v)]
+    if isinstance(entry, np.ndarray) or hasattr(entry, "nbytes"):
+        return [entry]
+    return []
+
+
+class CompressedFrame:
+    """
+    Losslessly compressed copy of an image.
+
+    Compression runs on a background thread; until it finishes the frame
+    keeps a reference to the source array, which must not be modified in
+    place afterwards. codec is "png" (cv2.imencode, level 0-9) or "zlib"
+    (level 1-9); lower levels are faster and compress less. Float frames
+    always use zlib.
+    """
+
+    def __init__(self, img, codec="png", level=1):
+        """Start compressing img in the background."""
+        # Metadata needed to rebuild the array
+        self.shape = img.shape
+        self.dtype = img.dtype
+        self.codec = codec if img.dtype in (np.uint8, np.uint16) else "zlib"
+        self.level = level
+
+        # Raw pixels until the compressed bytes are ready
+        self._raw = img
+        self._data = None
+        self._future = _COMPRESSOR.submit(self._compress)
+
+    def _compress(self):
+        """Encode the raw pixels and release them."""
+        if self.codec == "png":
+            ok, buf = cv2.imencode(".png", self._raw, [cv2.IMWRITE_PNG_COMPRESSION, self.level])
+            if not ok:
+                raise ValueError("Could not compress frame")
+            self._data = buf
+        else:
+            self._data = zlib.compress(np.ascontiguousarray(self._raw).tobytes(), self.level)
+        self._raw = None
+
+    @property
+    def settled(self):
+        """Return True once nbytes is final (compression finished)."""
+        return self._raw is None
+
+    @property
+    def nbytes(self):
+        """Return bytes currently held (compressed size once compression finished)."""
+        # Read raw first: the worker sets data before it releases raw
+        raw = self._raw
+        data = self._data
+        if data is not None:
+            return len(data)
+        return raw.nbytes if raw is not None else 0
+
+    def decode(self):
+        """Return the frame as an ndarray."""
+        # Still compressing: the raw pixels are at hand
+        raw = self._raw
+        if raw is not None:
+            return raw
+
+        # Surface compression errors before decoding
+        self._future.result()
+        if self.codec == "png":
+            return cv2.imdecode(self._data, cv2.IMREAD_UNCHANGED)
+        return np.frombuffer(zlib.decompress(self._data), dtype=self.dtype).reshape(self.shape).copy()
+
+
+class History:
+    """
+    Stack of history entries bounded by total bytes.
+
+    Pushing past max_bytes evicts the oldest entries, but the newest
+    entry is always kept so a single large frame can still be undone.
+    Frames shared by several entries (parameter-only edits reuse the
+    previous snapshot's pixels) are counted once. The byte total is kept
+    running: push, pop and eviction only touch the frames of the entry
+    involved, plus the frames still compressing.
+    """
+
+    def __init__(self, max_bytes=1024 ** 3):
+        """Initialize empty history with a byte limit."""
+        self.max_bytes = max_bytes
+        self._nbytes = 0
+        self._entries = deque()
+
+        # Held frames by id: id -> [frame, count, bytes counted in the total]
+        self._refs = {}
+
+        # Ids of held frames whose size still shrinks once compressed
+        self._pending = set()
+
+    def __len__(self):
+        """Return number of entries."""
+        return len(self._entries)
+
+    def __iter__(self):
+        """Iterate entries from oldest to newest."""
+        return iter(self._entries)
+
+    @property
+    def nbytes(self):
+        """Return bytes of the unique held frames (compressed sizes once known)."""
+        self._settle()
+        return self._nbytes
+
+    def _acquire(self, entry):
+        """Count references to the frames of a new entry."""
+        for frame in entry_frames(entry):
+            ref = self._refs.get(id(frame))
+            if ref is None:
+                ref = self._refs[id(frame)] = [frame, 0, frame.nbytes]
+                self._nbytes += ref[2]
+                if not getattr(frame, "settled", True):
+                    self._pending.add(id(frame))
+            ref[1] += 1
+
+    def _release(self, entry):
+        """Drop references to the frames of a removed entry."""
+        for frame in entry_frames(entry):
+            ref = self._refs[id(frame)]
+            ref[1] -= 1
+            if ref[1] == 0:
+                del self._refs[id(frame)]
+                self._pending.discard(id(frame))
+                self._nbytes -= ref[2]
+
+    def _settle(self):
+        """Update the total for frames that finished compressing since the last call."""
+        for key in list(self._pending):
+            ref = self._refs[key]
+            if ref[0].settled:
+                size = ref[0].nbytes
+                self._nbytes += size - ref[2]
+                ref[2] = size
+                self._pending.discard(key)
+
+    def push(self, entry):
+        """Add entry on top, evicting the oldest entries beyond the byte limit."""
+        self._entries.append(entry)
+        self._acquire(entry)
+
+        # Evict from the bottom (each step touches only the evicted entry's frames)
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            self.evict_oldest()
+
+    def pop(self):
+        """Remove and return the newest entry."""
+        entry = self._entries.pop()
+        self._release(entry)
+        return entry
+
+    def peek(self):
+        """Return the newest entry without removing it."""
+        return self._entries[-1]
+
+    def evict_oldest(self):
+        """Drop the oldest entry; return False if the history is empty."""
+        if not self._entries:
+            return False
+        self._release(self._entries.popleft())
+        return True
+
+    def recount(self):
+        """Recompute bytes of the unique held frames from scratch (for checks; the total is kept running)."""
+        for ref in self._refs.values():
+            ref[2] = ref[0].nbytes
+        self._pending = {key for key, ref in self._refs.items() if not getattr(ref[0], "settled", True)}
+        self._nbytes = sum(ref[2] for ref in self._refs.values())
+        return self._nbytes
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+        self._refs.clear()
+        self._pending.clear()
+        self._nbytes = 0
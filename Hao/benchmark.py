@@ -0,0 +1,150 @@
+"""
+Benchmarks for the image processing engine.
+
+Runs on deterministic synthetic images so results are comparable between
+machines and commits. Usage:
+
+    python benchmark.py blur [--megapixels 12]
+    python benchmark.py tiles [--megapixels 40] [--threads 1,2,4,8]
+
+Output regressions and timing baselines are checked by regression.py.
+"""
+import sys
+import time
+import argparse
+import importlib
+from pathlib import Path
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+# Import modules dynamically
+blur_engine_module = importlib.import_module("4_blur_engine")
+image_processing_module = importlib.import_module("1_image_processing")
+parallel_tiles_module = importlib.import_module("13_parallel_tiles")
+
+BlurEngine = blur_engine_module.BlurEngine
+ImageModel = image_processing_module.ImageModel
+TileRunner = parallel_tiles_module.TileRunner
+
+
+def synthetic_image(megapixels, seed=0):
+    """Create a deterministic photo-like BGR image of the given size."""
+    # Keep a 4:3 aspect ratio
+    w = int(np.sqrt(megapixels * 1e6 * 4 / 3))
+    h = int(w * 3 / 4)
+
+    # Smooth low-frequency structure plus fine grain
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    img = cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC)
+    grain = rng.integers(0, 40, (h, w, 3), dtype=np.uint8)
+    return cv2.add(img, grain)
+
+
+def timed(func, repeat=3):
+    """Return (best milliseconds, last result) over several runs."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+
+def bench_blur(args):
+    """Compare BlurEngine against cv2.GaussianBlur for every slider kernel."""
+    img = synthetic_image(args.megapixels)
+    h, w = img.shape[:2]
+    print(f"Image: {w} x {h} ({w * h / 1e6:.1f} MP)")
+    print(f"{'k':>3} {'strategy':>9} {'exact ms':>9} {'engine ms':>10} {'cached ms':>10} {'speedup':>8} {'max err':>8} {'mean err':>9}")
+
+    engine = BlurEngine()
+    for k in range(3, 22, 2):
+        # Exact reference
+        t_exact, exact = timed(lambda: cv2.GaussianBlur(img, (k, k), 0))
+
+        # Cold engine call (cache cleared every run)
+        def cold():
+            engine.clear()
+            return engine.blur(img, k)
+        t_engine, approx = timed(cold)
+
+        # Warm call as when dragging back to a previous radius
+        t_cached, _ = timed(lambda: engine.blur(img, k))
+
+        # Error against the exact Gaussian
+        err = cv2.absdiff(exact, approx)
+        print(
+            f"{k:>3} {engine.strategy(k):>9} {t_exact:>9.1f} {t_engine:>10.1f} {t_cached:>10.3f} "
+            f"{t_exact / t_engine:>7.2f}x {int(err.max()):>8} {float(err.mean()):>9.3f}"
+        )
+
+
+def bench_tiles(args):
+    """Time a full single-image render with the frame split into 1..N bands."""
+    img = synthetic_image(args.megapixels)
+    h, w = img.shape[:2]
+    print(f"Image: {w} x {h} ({w * h / 1e6:.1f} MP), blur {args.blur}, scale {args.scale}")
+    print(f"{'threads':>7} {'cv threads':>10} {'render ms':>10} {'speedup':>8} {'max err':>8} {'banded':>7}")
+
+    model = ImageModel()
+    model.record_history = False
+    model.load_array(img)
+    model.blur = args.blur
+    model.contrast = 1.2
+    model.brightness = 10
+
+    base_ms = None
+    reference = None
+    for threads in (int(t) for t in args.threads.split(",")):
+        tiles = TileRunner(threads) if threads > 1 else None
+        model.set_tiles(tiles)
+
+        # Cold render each run (no cached pyramid, resize or blur)
+        def render():
+            model.drop_caches()
+            model.scale = args.scale
+            model.apply_all()
+            return model.current_img
+        ms, out = timed(render)
+
+        # Compare with the single-band result
+        if reference is None:
+            base_ms, reference = ms, out
+        err = int(cv2.absdiff(reference, out).max())
+        # Passes the runner kept in bands after measuring both ways
+        cv_threads = tiles.cv_threads if tiles else cv2.getNumThreads()
+        banded = "{}/{}".format(*tiles.banded_ops()) if tiles else "-"
+        print(f"{threads:>7} {cv_threads:>10} {ms:>10.1f} {base_ms / ms:>7.2f}x {err:>8} {banded:>7}")
+        if tiles is not None:
+            tiles.shutdown()
+    model.set_tiles(None)
+
+
+def main():
+    """Parse arguments and run the selected benchmark."""
+    parser = argparse.ArgumentParser(description="Image engine benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    blur = sub.add_parser("blur", help="blur strategies against exact Gaussian")
+    blur.add_argument("--megapixels", type=float, default=12.0)
+    blur.set_defaults(func=bench_blur)
+
+    tiles = sub.add_parser("tiles", help="render latency with intra-image band threads")
+    tiles.add_argument("--megapixels", type=float, default=40.0)
+    tiles.add_argument("--threads", default="1,2,4,8")
+    tiles.add_argument("--blur", type=int, default=9)
+    tiles.add_argument("--scale", type=float, default=0.9)
+    tiles.set_defaults(func=bench_tiles)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Golden-image regression and performance harness for ImageModel.
+
+Every case is a recipe of ImageModel operations (the same {"op": ...}
+steps the edit journal records) run on a deterministic synthetic image.
+The result is compared with a stored golden output within the case's
+tolerance (max and mean absolute error), and the recipe is timed on a
+larger image against a stored baseline. Reference cases compare an
+approximate fast path with the exact operation it stands in for instead,
+within the path's documented bound (on a REFERENCE_MEGAPIXELS image, the
+size the bounds are measured at), so --update cannot move them. A case fails when it drifts
+beyond its tolerance or runs more than --slower percent slower than its
+baseline. Usage:
+
+    python regression.py                  check outputs and timings
+    python regression.py --only blur      cases whose name contains "blur"
+    python regression.py --update         rewrite goldens and timing baseline
+    python regression.py --update-timings rewrite the timing baseline only
+
+Goldens (golden/outputs.npz) are committed, so a fresh checkout is
+checked against known-good output; rewrite them with --update only for
+an intended change of output (or on a known-good commit when another
+OpenCV build rounds beyond the tolerances). Timings
+(golden/baseline.json) depend on the machine and are kept locally.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+from pathlib import Path
+
+# Add current directory to Python path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+# Import modules dynamically
+image_processing_module = importlib.import_module("1_image_processing")
+parallel_tiles_module = importlib.import_module("13_parallel_tiles")
+bit_depth_module = importlib.import_module("17_bit_depth")
+benchmark_module = importlib.import_module("benchmark")
+
+ImageModel = image_processing_module.ImageModel
+TileRunner = parallel_tiles_module.TileRunner
+to_depth = bit_depth_module.to_depth
+synthetic_image = benchmark_module.synthetic_image
+
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+GOLDEN_FILE = GOLDEN_DIR / "outputs.npz"
+BASELINE_FILE = GOLDEN_DIR / "baseline.json"
+
+# Outputs are compared at a small size so the check runs in seconds
+GOLDEN_MEGAPIXELS = 0.03
+
+# Size of the reference cases' image (see 4_blur_engine for the bounds)
+REFERENCE_MEGAPIXELS = 4.0
+
+# Timings below this many milliseconds are too noisy to compare
+NOISE_MS = 2.0
+
+
+def case(name, recipe, max_err=0, mean_err=0.0, golden=None, roi=None, tiles=False, depth="uint8", reference=None,
+         frame=False):
+    """
+    Return a regression case as a dict.
+
+    recipe is run with ImageModel.apply_recipe. max_err / mean_err bound
+    the absolute difference to the golden (in the output's units); golden
+    names another case whose output must be matched (fast paths checked
+    against the plain result). roi selects a rectangle in relative
+    (x, y, w, h) units, tiles renders with two band threads and depth
+    loads the image as uint8 or uint16. reference is a function of the
+    input image returning the exact output, used instead of a golden.
+    frame renders the recipe's settings with ImageModel.process_frame
+    (the video path) instead of apply_all.
+    """
+    return {"name": name, "recipe": recipe, "max_err": max_err, "mean_err": mean_err,
+            "golden": golden or name, "roi": roi, "tiles": tiles, "depth": depth, "reference": reference,
+            "frame": frame}
+
+
+def adjust(**params):
+    """Return a slider step."""
+    return {"op": "adjust", **params}
+
+
+def gaussian(k):
+    """Return the exact blur the Blur slider approximates for kernel k."""
+    return lambda img: cv2.GaussianBlur(img, (k, k), 0)
+
+
+def scaled_edges(scale):
+    """Return the edge map at scale: Canny on the full-resolution image, then resized to the slider's size."""
+    def reference(img):
+        edges = cv2.cvtColor(cv2.Canny(img, 100, 200), cv2.COLOR_GRAY2BGR)
+        h, w = img.shape[:2]
+        return cv2.resize(edges, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_LINEAR)
+    return reference
+
+
+# Goldens are matched exactly on the build that wrote them; tolerances
+# leave room for another OpenCV build rounding differently (1 level, or
+# 257 in 16-bit units). Edge maps and thresholded chains are binary, so
+# their mean bounds the share of flipped pixels: 0.1 is 0.04%, what a
+# 1-level change on 1% of the input pixels flips. Banded renders (tiles)
+# match the single-call result exactly, and video frames (frame) the
+# apply_all render
+CASES = [
+    case("identity", []),
+    case("brightness_up", [adjust(brightness=60)], 1, 0.01),
+    case("brightness_down", [adjust(brightness=-60)], 1, 0.01),
+    case("contrast_low", [adjust(contrast=0.5)], 1, 0.01),
+    case("contrast_high", [adjust(contrast=1.8)], 1, 0.01),
+    case("blur_3", [adjust(blur=3)], 1, 0.05),
+    case("blur_9", [adjust(blur=9)], 1, 0.05),
+    case("blur_15", [adjust(blur=15)], 1, 0.05),
+    case("blur_21", [adjust(blur=21)], 1, 0.05),
+    case("scale_down", [adjust(scale=0.5)], 1, 0.05),
+    case("scale_up", [adjust(scale=1.5)], 1, 0.05),
+    case("sliders", [adjust(scale=0.75, blur=7, contrast=1.3, brightness=15)], 1, 0.05),
+    case("grayscale", [{"op": "grayscale"}], 1, 0.01),
+    case("grayscale_undo", [{"op": "grayscale"}, {"op": "undo"}], golden="identity"),
+    case("edge", [{"op": "edge"}], 255, 0.1),
+    case("grayscale_edge", [{"op": "grayscale"}, {"op": "edge"}], 255, 0.1),
+    # The grain of the test image is above most thresholds; these move ~0.4%
+    # of the edge pixels (mean 1.1 from the default map)
+    case("edge_thresholds", [adjust(edge_low=400, edge_high=500), {"op": "edge"}], 255, 0.1),
+    case("rotate_90", [{"op": "rotate", "angle": 90}]),
+    case("rotate_270", [{"op": "rotate", "angle": 270}]),
+    case("flip_h", [{"op": "flip_h"}]),
+    case("flip_v", [{"op": "flip_v"}]),
+    case("filter_grayscale", [{"op": "filter", "name": "grayscale"}], 1, 0.05),
+    case("filter_sepia", [{"op": "filter", "name": "sepia"}], 1, 0.05),
+    case("filter_saturation", [{"op": "filter", "name": "saturation", "amount": 1.5}], 1, 0.05),
+    case("filter_invert", [{"op": "filter", "name": "invert"}]),
+    case("filter_threshold", [{"op": "filter", "name": "threshold", "level": 128}]),
+    case("filter_gamma", [{"op": "filter", "name": "gamma", "gamma": 1.5}], 1, 0.01),
+    case("filter_sharpen", [{"op": "filter", "name": "sharpen", "amount": 1.0}], 1, 0.01),
+    case("filter_edge", [{"op": "filter", "name": "edge"}], 255, 0.1),
+    case("chain_lut", [{"op": "filter", "steps": [["gamma", {"gamma": 2.0}], ["invert", {}], ["threshold", {"level": 100}]]}],
+         255, 0.1),
+    case("chain_matrix", [{"op": "filter", "steps": [["sepia", {}], ["saturation", {"amount": 0.5}]]}], 1, 0.05),
+    case("layers", [{"op": "layer", "action": "add", "name": "gamma", "params": {"gamma": 0.8}},
+                    {"op": "layer", "action": "add", "name": "sharpen"}], 1, 0.01),
+    case("layers_toggle", [{"op": "layer", "action": "add", "name": "sepia"},
+                           {"op": "layer", "action": "toggle", "index": 0}], golden="identity"),
+    case("roi", [adjust(blur=5, brightness=40)], 1, 0.01, roi=(0.25, 0.25, 0.5, 0.5)),
+    case("tiles_blur_9", [adjust(blur=9)], golden="blur_9", tiles=True),
+    case("tiles_scale_down", [adjust(scale=0.5)], golden="scale_down", tiles=True),
+    case("tiles_sliders", [adjust(scale=0.75, blur=7, contrast=1.3, brightness=15)], golden="sliders", tiles=True),
+    case("frame_sliders", [adjust(scale=0.75, blur=7, contrast=1.3, brightness=15)], golden="sliders", frame=True),
+    case("frame_scale_down", [adjust(scale=0.5)], golden="scale_down", frame=True),
+    case("frame_blur_21", [adjust(blur=21)], golden="blur_21", frame=True),
+    case("frame_grayscale", [{"op": "grayscale"}], golden="grayscale", frame=True),
+    case("frame_edge", [{"op": "edge"}], golden="edge", frame=True),
+    case("frame_grayscale_edge", [{"op": "grayscale"}, {"op": "edge"}], golden="grayscale_edge", frame=True),
+    case("depth16_sliders", [adjust(blur=5, contrast=1.3, brightness=15)], 257, 13.0, depth="uint16"),
+    case("depth16_gamma", [{"op": "filter", "name": "gamma", "gamma": 1.5}], 257, 13.0, depth="uint16"),
+    # Approximate blurs against cv2.GaussianBlur within their documented
+    # bounds (default thresholds: box from 13, pyramid from 17)
+    case("exact_blur_13", [adjust(blur=13)], 2, 0.35, reference=gaussian(13)),
+    case("exact_blur_15", [adjust(blur=15)], 2, 0.35, reference=gaussian(15)),
+    case("exact_blur_17", [adjust(blur=17)], 4, 0.6, reference=gaussian(17)),
+    case("exact_blur_21", [adjust(blur=21)], 4, 0.6, reference=gaussian(21)),
+    case("exact_tiles_blur_15", [adjust(blur=15)], 2, 0.35, tiles=True, reference=gaussian(15)),
+    case("exact_tiles_blur_21", [adjust(blur=21)], 4, 0.6, tiles=True, reference=gaussian(21)),
+    case("exact_edge_scaled", [adjust(scale=0.5), {"op": "edge"}], reference=scaled_edges(0.5)),
+    case("exact_frame_edge_scaled", [adjust(scale=0.5), {"op": "edge"}], frame=True, reference=scaled_edges(0.5)),
+    case("exact_tiles_edge_scaled", [adjust(scale=0.75), {"op": "edge"}], tiles=True, reference=scaled_edges(0.75)),
+]
+
+
+def source_image(megapixels, depth):
+    """Return the deterministic input image for a case."""
+    img = synthetic_image(megapixels)
+    return to_depth(img, np.dtype(depth))
+
+
+def run_case(c, img):
+    """Return (output, milliseconds) of one case on img with a fresh model."""
+    model = ImageModel()
+    tiles = TileRunner(2, min_pixels=0, adaptive=False) if c["tiles"] else None
+    model.set_tiles(tiles)
+    model.load_array(img)
+    if c["roi"] is not None:
+        h, w = img.shape[:2]
+        rx, ry, rw, rh = c["roi"]
+        model.set_roi((int(rx * w), int(ry * h), int(rw * w), int(rh * h)))
+        model.apply_all()
+
+    # Only the recipe is timed (loading is the same for every case)
+    start = time.perf_counter()
+    model.apply_recipe(c["recipe"])
+    ms = (time.perf_counter() - start) * 1000
+    out = model.current_img
+
+    # Video path: the same settings on the loaded image as a frame
+    if c["frame"]:
+        start = time.perf_counter()
+        out = model.process_frame(img, {}, grayscale=model.is_grayscale, edge=model.edge_on)
+        ms = (time.perf_counter() - start) * 1000
+    if tiles is not None:
+        tiles.shutdown()
+    return out, ms
+
+
+def time_case(c, images, repeat):
+    """Return the best time in milliseconds over repeat runs on the timing image."""
+    img = images[c["depth"]]
+    return min(run_case(c, img)[1] for _ in range(repeat))
+
+
+def compare(out, golden):
+    """Return (max error, mean error) of out against golden, or None if shape or type differ."""
+    if golden is None or out.shape != golden.shape or out.dtype != golden.dtype:
+        return None
+    diff = np.abs(out.astype(np.float64) - golden)
+    return float(diff.max()), float(diff.mean())
+
+
+def machine():
+    """Return a description of the machine the timings come from."""
+    return {"platform": platform.platform(), "python": platform.python_version(),
+            "opencv": cv2.__version__, "cpus": cv2.getNumberOfCPUs()}
+
+
+def main():
+    """Parse arguments, run the cases and report; exit non-zero on failures."""
+    parser = argparse.ArgumentParser(description="ImageModel golden-image and timing regression")
+    parser.add_argument("--only", default="", help="run cases whose name contains this text")
+    parser.add_argument("--update", action="store_true", help="rewrite goldens and timing baseline")
+    parser.add_argument("--update-timings", action="store_true", help="rewrite the timing baseline only")
+    parser.add_argument("--slower", type=float, default=25.0, help="allowed slowdown in percent")
+    parser.add_argument("--megapixels", type=float, default=4.0, help="size of the timing image")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per case (best is kept)")
+    parser.add_argument("--no-timing", action="store_true", help="compare outputs only")
+    args = parser.parse_args()
+
+    cases = [c for c in CASES if args.only in c["name"]]
+    small = {d: source_image(GOLDEN_MEGAPIXELS, d) for d in ("uint8", "uint16")}
+    large = {d: source_image(args.megapixels, d) for d in ("uint8", "uint16")}
+    exact = source_image(REFERENCE_MEGAPIXELS, "uint8") if any(c["reference"] for c in cases) else None
+
+    # Stored goldens and timings
+    goldens = dict(np.load(GOLDEN_FILE)) if GOLDEN_FILE.exists() and not args.update else {}
+    baseline = {}
+    if BASELINE_FILE.exists() and not (args.update or args.update_timings):
+        stored = json.loads(BASELINE_FILE.read_text())
+        if stored.get("megapixels") == args.megapixels:
+            baseline = stored["timings"]
+            if stored.get("machine") != machine():
+                print("Note: timing baseline comes from a different machine")
+        else:
+            print("Note: timing baseline was recorded at a different --megapixels, timings not compared")
+
+    print(f"{'case':<24} {'max err':>8} {'mean err':>9} {'tolerance':>13} {'ms':>9} {'base ms':>9} {'change':>8}  result")
+    failures = 0
+    outputs, timings = {}, {}
+    for c in cases:
+        # Reference cases are checked for accuracy only, against the exact op
+        if c["reference"] is not None:
+            out, _ = run_case(c, exact)
+            golden, ms = c["reference"](exact), None
+        else:
+            out, _ = run_case(c, small[c["depth"]])
+            ms = None if args.no_timing else time_case(c, large, args.repeat)
+
+            # Goldens come from the plain cases; fast-path cases must match them
+            if args.update and c["golden"] == c["name"]:
+                outputs[c["name"]] = out
+            golden = outputs.get(c["golden"], goldens.get(c["golden"]))
+        errors = compare(out, golden)
+
+        problems = []
+        if errors is None:
+            problems.append("no golden" if golden is None else "shape/type changed")
+        elif errors[0] > c["max_err"] or errors[1] > c["mean_err"]:
+            problems.append("output drifted")
+
+        # Slower than baseline by more than the allowed share (above the noise floor)
+        base = baseline.get(c["name"])
+        change = ""
+        if ms is not None:
+            timings[c["name"]] = round(ms, 3)
+            if base:
+                change = f"{(ms / base - 1) * 100:+.0f}%"
+                if ms > base * (1 + args.slower / 100) and ms - base > NOISE_MS:
+                    problems.append("slower")
+
+        failures += bool(problems)
+        err_text = f"{errors[0]:>8.1f} {errors[1]:>9.3f}" if errors else f"{'-':>8} {'-':>9}"
+        ms_text = f"{ms:>9.1f}" if ms is not None else f"{'-':>9}"
+        base_text = f"{base:>9.1f}" if base else f"{'-':>9}"
+        tol_text = f"{c['max_err']}/{c['mean_err']}"
+        print(f"{c['name']:<24} {err_text} {tol_text:>13} {ms_text} {base_text} {change:>8}  {', '.join(problems) or 'ok'}")
+
+    # Write new goldens and baseline (merged, so --only updates just those cases)
+    GOLDEN_DIR.mkdir(exist_ok=True)
+    if args.update:
+        stored = dict(np.load(GOLDEN_FILE)) if GOLDEN_FILE.exists() else {}
+        stored.update(outputs)
+        np.savez_compressed(GOLDEN_FILE, **stored)
+        print(f"Wrote {len(outputs)} goldens to {GOLDEN_FILE}")
+    if (args.update or args.update_timings) and timings:
+        stored = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+        merged = stored.get("timings", {}) if stored.get("megapixels") == args.megapixels else {}
+        merged.update(timings)
+        BASELINE_FILE.write_text(json.dumps(
+            {"machine": machine(), "megapixels": args.megapixels, "timings": merged}, indent=2))
+        print(f"Wrote {len(timings)} timings to {BASELINE_FILE}")
+
+    if failures and not (args.update or args.update_timings):
+        print(f"{failures} of {len(cases)} cases failed")
+        sys.exit(1)
+    print(f"{len(cases)} cases passed" if not (args.update or args.update_timings) else "Baseline updated")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,13 @@ from tkinter import filedialog, messagebox, Menu
 import cv2
 import numpy as num
 from PIL import Image, ImageTk  
-import copy
+import sys
+import importlib
+from pathlib import Path
+
+# History ring buffer is shared with the editor in ../Hao
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Hao"))
+History = importlib.import_module("9_history").History
 
 class imgprocess:
     def __init__(self):
@@ -35,18 +41,15 @@ class imgprocess:
         return True
     
 class undo_redo:
-    def __init__(self, max_history=10):
-        self.undo_stack = []
-        self.redo_stack = []
-        self.max_history = max_history
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.undo_stack = History(max_bytes)
+        self.redo_stack = History(max_bytes)
     
     def push(self, image):
-        self.undo_stack.append(copy.deepcopy(image))
-        if len(self.undo_stack) > self.max_history:
-            self.undo_stack.pop(0)
+        self.undo_stack.push(image.copy())
         self.redo_stack.clear()
     def undo(self):
         if len(self.undo_stack) > 1:
-            self.redo_stack.append(self.undo_stack.pop())
-            return self.undo_stack[-1]
+            self.redo_stack.push(self.undo_stack.pop())
+            return self.undo_stack.peek()
         return None